@@ -18,8 +18,61 @@
 # Public License along with this program.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+import math
 import numpy as np
 
+# Distance (in Angstroms) either side of the packing density threshold within
+# which atom pairs are re-checked exactly. This is many orders of magnitude
+# larger than the rounding error of a distance calculated in double precision.
+BOUNDARY_TOL = 1e-6
+
+# Distance (in Angstroms) within which the copy of an asymmetric unit atom in
+# the (trimmed) unit cell assembly is identified as the atom itself. The
+# assembly coordinates are calculated via a round trip through fractional
+# coordinates, hence this distance is small but not exactly 0. This is the
+# same tolerance as is used by identify_au_copy_atoms.
+SELF_PAIR_TOL = 1e-3
+
+# Distance (in Angstroms) below which two symmetry images of an atom are
+# considered to occupy the same (special) position. This is the default value
+# of min_distance_sym_equiv used by cctbx when expanding to P1.
+MIN_DISTANCE_SYM_EQUIV = 0.5
+
+# Edge length (in Angstroms) of the voxels onto which the surrounding atoms
+# are mapped when packing density is approximated on a grid, and the number
+# of asymmetric unit atoms whose exact packing density is calculated to
+# estimate the error of the approximation.
+GRID_VOXEL_SIZE = 0.5
+GRID_ERROR_SAMPLE_SIZE = 1000
+
+# Largest voxel size (as a fraction of the packing density threshold) to which
+# the grid is coarsened to keep its memory usage within max_kernel_mem. Beyond
+# this the sphere kernel is too poorly resolved for the approximation to be
+# useful.
+GRID_MAX_VOXEL_FRACTION = 0.25
+
+# Functions of the distance r (in Angstroms) between two atoms (and of the
+# packing density threshold, pdt) by which each contact is weighted when
+# calculating weighted contact numbers. The Gaussian weighting has a standard
+# deviation of half of the packing density threshold.
+CONTACT_WEIGHTINGS = {
+    'inverse': lambda r, pdt: 1 / r,
+    'inverse_square': lambda r, pdt: 1 / (r*r),
+    'gaussian': lambda r, pdt: np.exp(-(r*r) / (2 * (0.5*pdt)**2))
+}
+
+
+def get_atom_values(atomList, name):
+    """
+    Returns an array of the values of the named property of each atom, from
+    either a list of atom objects or an atom table (see parsePDB.atom_table).
+    """
+
+    if getattr(atomList, 'columnar', False) is True:
+        return getattr(atomList, name)
+
+    return np.array([getattr(atm, name) for atm in atomList])
+
 
 def get_xyz_from_objects(bdamAtomList):
     """
@@ -27,6 +80,9 @@ def get_xyz_from_objects(bdamAtomList):
     included in the BDamage calculation.
     """
 
+    if getattr(bdamAtomList, 'columnar', False) is True:
+        return np.array(bdamAtomList.xyz)
+
     au_atom_coords = np.zeros([len(bdamAtomList), 3])
     for i, atom in enumerate(bdamAtomList):
         au_atom_coords[i, :] = np.array([atom.xyzCoords[0][0],
@@ -36,90 +92,1408 @@ def get_xyz_from_objects(bdamAtomList):
     return au_atom_coords
 
 
-def calc_packing_density(xyz_au_atom, xyz_surr_atom, pack_dens_thresh):
+def calc_distances(xyz_au_atom, xyz_surr_atom):
+    """
+    Calculates the distances between pairs of atoms.
+    """
+
+    return np.sqrt(np.square(xyz_surr_atom - xyz_au_atom).sum(axis=-1))
+
+
+def select_kernel_backend(backend='auto', engine='kdtree'):
+    """
+    Determines whether the JIT-compiled (numba) or numpy kernels are used to
+    count contacts with the blocked packing density engine (the only stage
+    with a JIT-compiled kernel). If backend is 'auto', the JIT kernels are
+    used if the blocked engine has been selected and numba is installed,
+    otherwise the numpy kernels are used (the compilation time of the JIT
+    kernels would outweigh their benefit for the other engines).
+    """
+
+    if not backend in ['auto', 'numpy', 'jit']:
+        raise ValueError(
+            'Kernel backend {} not recognised - expect to be one of \'auto\', '
+            '\'numpy\' or \'jit\''.format(backend)
+        )
+
+    if backend == 'numpy' or (backend == 'auto' and engine != 'blocked'):
+        return 'numpy'
+
+    try:
+        import numba
+    except ImportError:
+        if backend == 'jit':
+            raise ImportError(
+                'The jit kernel backend requires the numba package to be '
+                'installed - install via "pip install numba"'
+            )
+        return 'numpy'
+
+    return 'jit'
+
+
+def load_jit_kernels():
+    """
+    Imports the module of JIT-compiled kernels (only possible if numba is
+    installed).
+    """
+
+    if __name__ == 'Subroutines.BDamage':
+        import Subroutines.jitKernels as jitKernels
+    elif __name__ == 'phenix.rabdam.Subroutines.BDamage':
+        import phenix.rabdam.Subroutines.jitKernels as jitKernels
+    else:
+        import rabdam.Subroutines.jitKernels as jitKernels
+
+    return jitKernels
+
+
+def count_contacts_jit(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, tol=None,
+    xyz_surr_exact=None
+):
+    """
+    Counts the number of surrounding atoms within the packing density
+    threshold of each asymmetric unit atom via a JIT-compiled kernel that
+    compares every pair of atoms without storing any intermediate arrays. If
+    the surrounding atom coordinates are stored in single precision, the
+    distances of atom pairs within tol of the threshold are recalculated
+    from the double precision coordinates in xyz_surr_exact.
+    """
+
+    jitKernels = load_jit_kernels()
+
+    num_au_atoms = xyz_au_atom.shape[0]
+    contacts = np.zeros(num_au_atoms, dtype=np.int64)
+    band_counts = np.zeros(num_au_atoms, dtype=np.int64)
+    xyz_au_atom = np.ascontiguousarray(xyz_au_atom, dtype=np.float64)
+    xyz_surr_atom = np.ascontiguousarray(xyz_surr_atom)
+
+    if tol is None:
+        lower_thresh = float(pack_dens_thresh)
+        upper_thresh = float(pack_dens_thresh)
+    else:
+        lower_thresh = float(pack_dens_thresh - tol)
+        upper_thresh = float(pack_dens_thresh + tol)
+    jitKernels.count_contacts_kernel(
+        xyz_au_atom, xyz_surr_atom, lower_thresh, upper_thresh, contacts,
+        band_counts
+    )
+
+    au_indices = np.flatnonzero(band_counts)
+    if au_indices.shape[0] > 0:
+        band_offsets = np.concatenate(
+            [[0], np.cumsum(band_counts[au_indices])[:-1]]
+        ).astype(np.int64)
+        band_surr_indices = np.zeros(
+            int(band_counts[au_indices].sum()), dtype=np.int64
+        )
+        jitKernels.find_band_pairs_kernel(
+            xyz_au_atom, xyz_surr_atom, au_indices, lower_thresh,
+            upper_thresh, band_offsets, band_surr_indices
+        )
+        band_au_indices = np.repeat(au_indices, band_counts[au_indices])
+        exact_distances = calc_distances(
+            xyz_au_atom[band_au_indices], xyz_surr_exact[band_surr_indices]
+        )
+        np.add.at(
+            contacts, band_au_indices, exact_distances < pack_dens_thresh
+        )
+
+    return contacts
+
+
+def calc_block_size(num_surr_atoms, max_kernel_mem, itemsize=8):
+    """
+    Determines the number of asymmetric unit atoms whose distances to every
+    surrounding atom can be calculated at once without the blocked distance
+    kernel exceeding max_kernel_mem bytes of memory.
+    """
+
+    # Each atom pair requires 3 coordinate differences and one distance (of
+    # itemsize bytes each, i.e. 8 in double precision and 4 in single
+    # precision) and one boolean comparison
+    bytes_per_au_atom = max(num_surr_atoms, 1) * ((3*itemsize) + itemsize + 1)
+    block_size = int(max_kernel_mem // bytes_per_au_atom)
+    if block_size < 1:
+        block_size = 1
+
+    return block_size
+
+
+def calc_single_precision_tol(xyz_au_atom, xyz_surr_atom, pack_dens_thresh):
+    """
+    Determines the distance (in Angstroms) either side of the packing density
+    threshold within which the contact counts calculated from single
+    precision coordinates may differ from those calculated in double
+    precision. Rounding each coordinate to single precision introduces an
+    error of up to eps/2 * |x| (where eps is the single precision machine
+    epsilon, ~1.2e-7), so the distance between two atoms can be in error by
+    up to sqrt(3) * eps * max|x|, plus a few eps * PDT from evaluating the
+    distance in single precision. A safety factor of 8 is applied to the
+    sum of these terms.
+    """
+
+    eps = float(np.finfo(np.float32).eps)
+    max_coord = max(
+        float(np.abs(xyz_au_atom).max(initial=0)),
+        float(np.abs(xyz_surr_atom).max(initial=0))
+    )
+
+    return 8 * eps * (max_coord + pack_dens_thresh)
+
+
+def count_contacts_kdtree(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, tree, tol=BOUNDARY_TOL,
+    xyz_surr_exact=None
+):
+    """
+    Counts the number of surrounding atoms within the packing density
+    threshold of each asymmetric unit atom via a KD-tree (of the surrounding
+    atoms) neighbour search. If the surrounding atom coordinates are stored
+    in single precision, their double precision coordinates (xyz_surr_exact)
+    are used to recount atoms that lie within tol of the threshold.
+    """
+
+    if xyz_surr_exact is None:
+        xyz_surr_exact = xyz_surr_atom
+
+    # The surrounding atoms are stored in a KD-tree, so that only atoms in the
+    # neighbourhood of each asymmetric unit atom are considered. The tree is
+    # queried with radii marginally smaller and larger than the packing
+    # density threshold. Where these two queries return different numbers of
+    # atoms, the atom lies (to within floating point error) on the threshold
+    # of one of its neighbours, and so its distances to the atoms found are
+    # recalculated exactly.
+    inner_count = tree.query_ball_point(
+        xyz_au_atom, pack_dens_thresh - tol, return_length=True
+    )
+    outer_count = tree.query_ball_point(
+        xyz_au_atom, pack_dens_thresh + tol, return_length=True
+    )
+
+    contacts = inner_count
+    for i in np.flatnonzero(inner_count != outer_count):
+        surr_indices = tree.query_ball_point(
+            xyz_au_atom[i], pack_dens_thresh + tol
+        )
+        distances = calc_distances(
+            xyz_au_atom[i], xyz_surr_exact[np.array(surr_indices, dtype=int)]
+        )
+        contacts[i] = np.sum(distances < pack_dens_thresh)
+
+    return contacts
+
+
+def count_contacts_blocked(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, max_kernel_mem, tol=None,
+    xyz_surr_exact=None
+):
+    """
+    Counts the number of surrounding atoms within the packing density
+    threshold of each asymmetric unit atom, calculating the distances between
+    a block of asymmetric unit atoms and every surrounding atom at once. The
+    size of the block is selected such that the calculation does not require
+    more than max_kernel_mem bytes of memory. If the surrounding atom
+    coordinates are stored in single precision, the distances are calculated
+    in single precision, and those within tol of the threshold are then
+    recalculated in double precision from xyz_surr_exact.
+    """
+
+    num_au_atoms = xyz_au_atom.shape[0]
+    contacts = np.zeros(num_au_atoms, dtype=int)
+    dtype = xyz_surr_atom.dtype
+    block_size = calc_block_size(
+        xyz_surr_atom.shape[0], max_kernel_mem, dtype.itemsize
+    )
+
+    for start in range(0, num_au_atoms, block_size):
+        stop = min(start + block_size, num_au_atoms)
+        # Operations are performed in place to keep memory usage within
+        # max_kernel_mem; the order of operations is the same as in
+        # calc_distances.
+        diffs = (  xyz_surr_atom[np.newaxis, :, :]
+                 - xyz_au_atom[start:stop, np.newaxis, :].astype(dtype))
+        np.square(diffs, out=diffs)
+        distances = diffs.sum(axis=-1)
+        del diffs
+        np.sqrt(distances, out=distances)
+
+        if tol is None:
+            contacts[start:stop] = np.count_nonzero(
+                distances < pack_dens_thresh, axis=1
+            )
+        else:
+            contacts[start:stop] = np.count_nonzero(
+                distances < np.float64(pack_dens_thresh - tol), axis=1
+            )
+            au_indices, surr_indices = np.nonzero(
+                  (distances >= np.float64(pack_dens_thresh - tol))
+                & (distances < np.float64(pack_dens_thresh + tol))
+            )
+            if au_indices.shape[0] > 0:
+                exact_distances = calc_distances(
+                    xyz_au_atom[start + au_indices],
+                    xyz_surr_exact[surr_indices]
+                )
+                np.add.at(
+                    contacts, start + au_indices,
+                    exact_distances < pack_dens_thresh
+                )
+
+    return contacts
+
+
+def calc_morton_order(xyz, bits=21):
+    """
+    Returns the permutation that sorts the input coordinates along a Morton
+    (Z-order) space-filling curve. The coordinates are quantised to a grid of
+    2**bits points along each axis spanning their bounding box, and the bits
+    of the three grid indices are interleaved to give the position of each
+    atom along the curve. Atoms that are close together along the curve are
+    close together in space.
+    """
+
+    num_atoms = xyz.shape[0]
+    if num_atoms < 2:
+        return np.arange(num_atoms)
+
+    xyz = np.asarray(xyz, dtype=np.float64)
+    min_xyz = xyz.min(axis=0)
+    extent = xyz.max(axis=0) - min_xyz
+    extent[extent == 0] = 1
+    grid = ((xyz - min_xyz) / extent * ((1 << bits) - 1)).astype(np.uint64)
+
+    # Spreads the bits of each grid index so that they are separated by two
+    # zero bits, ready to be interleaved with the other two axes
+    spread = grid & np.uint64(0x1fffff)
+    for shift, mask in [
+        (32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff),
+        (8, 0x100f00f00f00f00f), (4, 0x10c30c30c30c30c3),
+        (2, 0x1249249249249249)
+    ]:
+        spread = (spread | (spread << np.uint64(shift))) & np.uint64(mask)
+    morton_codes = (
+        spread[:, 0] | (spread[:, 1] << np.uint64(1))
+        | (spread[:, 2] << np.uint64(2))
+    )
+
+    return np.argsort(morton_codes, kind='stable')
+
+
+def count_contacts_in_parallel(
+    count_func, xyz_au_atom, workers, combine_func=np.concatenate
+):
+    """
+    Splits the asymmetric unit atoms into chunks, and counts the contacts of
+    the atoms in each chunk (via count_func) across a pool of worker threads.
+    The threads share the surrounding atom coordinates (and KD-tree) rather
+    than each receiving its own copy, and the contact number of each atom is
+    independent of the chunk it is in, so the returned array is identical to
+    that calculated by a single thread. The results for each chunk are
+    combined (in order) via combine_func. If count_func returns a tuple of
+    results, combine_func must be a tuple of functions, one per result.
+
+    The asymmetric unit atoms are listed in file order, which has poor
+    spatial locality, so they are first sorted along a Morton curve (see
+    calc_morton_order). Consecutive queries then visit the same regions of
+    the KD-tree / surrounding atoms, and each chunk covers a compact region
+    of the structure. The results are scattered back to the original order
+    of the asymmetric unit atoms before being returned.
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    if xyz_au_atom.shape[0] < 2:
+        return count_func(xyz_au_atom)
+
+    spatial_order = calc_morton_order(xyz_au_atom)
+    inverse_order = np.empty_like(spatial_order)
+    inverse_order[spatial_order] = np.arange(spatial_order.shape[0])
+    xyz_au_sorted = np.ascontiguousarray(xyz_au_atom[spatial_order])
+
+    if workers <= 1:
+        contacts = count_func(xyz_au_sorted)
+        if isinstance(contacts, tuple):
+            return tuple(result[inverse_order] for result in contacts)
+        return contacts[inverse_order]
+
+    # Several chunks are assigned to each thread to balance the workload
+    # between regions of the structure with high and low packing density.
+    num_chunks = min(workers*4, xyz_au_atom.shape[0])
+    chunks = np.array_split(xyz_au_sorted, num_chunks)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        contacts = list(executor.map(count_func, chunks))
+
+    if isinstance(contacts[0], tuple):
+        return tuple(
+            func(list(results))[inverse_order]
+            for func, results in zip(combine_func, zip(*contacts))
+        )
+    return combine_func(contacts)[inverse_order]
+
+
+def calc_packing_density(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, engine='kdtree',
+    max_kernel_mem=1073741824, workers=1, xyz_surr_exact=None,
+    backend='numpy'
+):
+    """
+    Calculates the packing density of each atom in the subset of atoms to
+    be considered for BDamage analysis. The number of surrounding atoms
+    within the packing density threshold of each atom is calculated either
+    via a KD-tree neighbour search (engine='kdtree', default) or via a
+    blocked comparison of every pair of atoms (engine='blocked') whose
+    memory usage is limited to max_kernel_mem bytes. If backend='jit', the
+    comparison of every pair of atoms is instead performed by a JIT-compiled
+    kernel that requires no intermediate arrays. The calculation is split
+    across the specified number of worker threads.
+
+    The surrounding atom coordinates can be provided in single precision, in
+    which case their double precision coordinates must also be provided (as
+    xyz_surr_exact) so that atoms close to the threshold can be recounted
+    exactly; the packing density values are then identical to those
+    calculated in double precision.
+    """
+
+    num_au_atoms = xyz_au_atom.shape[0]
+    packing_density_array = np.zeros([num_au_atoms, 1])
+
+    contacts = count_contacts(
+        xyz_au_atom, xyz_surr_atom, pack_dens_thresh, engine, max_kernel_mem,
+        workers, xyz_surr_exact, backend
+    )
+
+    packing_density_array[:, 0] = contacts - 1  # Subtract 1 to correct for the
+    # atom itself being counted.
+
+    return packing_density_array
+
+
+def count_contacts(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, engine='kdtree',
+    max_kernel_mem=1073741824, workers=1, xyz_surr_exact=None,
+    backend='numpy'
+):
+    """
+    Counts the number of surrounding atoms within the packing density
+    threshold of each asymmetric unit atom, with the specified engine and
+    backend (see calc_packing_density).
+    """
+
+    tol = None
+    if xyz_surr_atom.dtype == np.float32:
+        if xyz_surr_exact is None:
+            raise ValueError(
+                'Double precision coordinates of the surrounding atoms '
+                '(xyz_surr_exact) are required to calculate packing density '
+                'from single precision coordinates'
+            )
+        tol = calc_single_precision_tol(
+            xyz_au_atom, xyz_surr_atom, pack_dens_thresh
+        )
+
+    if engine == 'kdtree':
+        from scipy.spatial import cKDTree
+        # Note that cKDTree stores a double precision copy of single precision
+        # coordinates, so unlike the blocked engine the tree does not benefit
+        # from precision=single
+        tree = cKDTree(xyz_surr_atom)
+        count_func = lambda xyz_au_chunk: count_contacts_kdtree(
+            xyz_au_chunk, xyz_surr_atom, pack_dens_thresh, tree,
+            max(BOUNDARY_TOL, tol or 0), xyz_surr_exact
+        )
+    elif engine == 'blocked' and backend == 'jit':
+        count_func = lambda xyz_au_chunk: count_contacts_jit(
+            xyz_au_chunk, xyz_surr_atom, pack_dens_thresh, tol, xyz_surr_exact
+        )
+    elif engine == 'blocked':
+        # The memory available is shared between the worker threads
+        kernel_mem = max_kernel_mem // max(workers, 1)
+        count_func = lambda xyz_au_chunk: count_contacts_blocked(
+            xyz_au_chunk, xyz_surr_atom, pack_dens_thresh, kernel_mem, tol,
+            xyz_surr_exact
+        )
+    else:
+        raise ValueError(
+            'Packing density engine {} not recognised - expect to be either '
+            '\'kdtree\' or \'blocked\''.format(engine)
+        )
+    contacts = count_contacts_in_parallel(count_func, xyz_au_atom, workers)
+
+    return contacts
+
+
+def calc_packing_density_stream(
+    xyz_au_atom, surr_atom_blocks, pack_dens_thresh, engine='kdtree',
+    max_kernel_mem=1073741824, workers=1, backend='numpy'
+):
     """
     Calculates the packing density of each atom in the subset of atoms to
-    be considered for BDamage analysis.
+    be considered for BDamage analysis from an iterable of blocks of
+    surrounding atoms (e.g. the trimmed atoms in each translated unit cell in
+    turn). The contacts with the atoms in each block are counted and added to
+    a running total, after which the block can be discarded, so only a single
+    block of surrounding atoms need be stored in memory at any one time. As
+    every surrounding atom lies in exactly one block, the packing density
+    values are identical to those calculated from all of the blocks at once.
+    """
+
+    num_au_atoms = xyz_au_atom.shape[0]
+    packing_density_array = np.zeros([num_au_atoms, 1])
+
+    contacts = np.zeros(num_au_atoms, dtype=int)
+    for xyz_surr_atom in surr_atom_blocks:
+        if xyz_surr_atom.shape[0] == 0:
+            continue
+        contacts += count_contacts(
+            xyz_au_atom, xyz_surr_atom, pack_dens_thresh, engine,
+            max_kernel_mem, workers, backend=backend
+        )
+
+    packing_density_array[:, 0] = contacts - 1  # Subtract 1 to correct for the
+    # atom itself being counted.
+
+    return packing_density_array
+
+
+def calc_grid_shape(origin, grid_max, voxel_size):
+    """
+    Determines the shape of the grid (with voxels of edge length voxel_size)
+    spanning from origin to grid_max, padded by 2 voxels.
     """
 
+    return tuple((np.ceil((grid_max - origin) / voxel_size) + 2).astype(int))
+
+
+def calc_grid_mem(grid_shape, kernel_width):
+    """
+    Estimates the memory (in bytes) required to convolve a (float64) grid of
+    shape grid_shape with a cubic kernel of kernel_width voxels. The atom grid
+    and the convolved grid each take 8 bytes per voxel, whilst the FFT
+    convolution requires (approximately) a further 32 bytes per voxel of the
+    grid padded by the width of the kernel.
+    """
+
+    num_voxels = np.prod(grid_shape, dtype=np.float64)
+    num_padded_voxels = np.prod(
+        np.array(grid_shape, dtype=np.float64) + kernel_width - 1
+    )
+
+    return (16*num_voxels) + (32*num_padded_voxels)
+
+
+def calc_packing_density_grid(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, voxel_size=GRID_VOXEL_SIZE,
+    sample_size=GRID_ERROR_SAMPLE_SIZE, xyz_surr_exact=None,
+    max_kernel_mem=1073741824
+):
+    """
+    Approximates the packing density of each atom in the subset of atoms to
+    be considered for BDamage analysis. The surrounding atoms are spread
+    across the 8 voxels around them (cloud-in-cell) to give a grid of atom
+    counts, which is convolved (via FFT) with a sphere of radius equal to the
+    packing density threshold. The number of contacts of each asymmetric
+    unit atom is then interpolated from the convolved grid and rounded to the
+    nearest integer. The cost of the convolution depends upon the number of
+    voxels rather than the number of atoms, but the values are approximate
+    (atoms close to the threshold can be miscounted), and so the error with
+    respect to the exact values is reported for a random sample of (up to)
+    sample_size atoms. If the convolution would require more than
+    max_kernel_mem bytes of memory, the voxel size is coarsened (up to
+    GRID_MAX_VOXEL_FRACTION of the packing density threshold) until it fits,
+    else a ValueError is raised.
+    """
+
+    from scipy.ndimage import map_coordinates
+    from scipy.signal import fftconvolve
+
     num_au_atoms = xyz_au_atom.shape[0]
     packing_density_array = np.zeros([num_au_atoms, 1])
+    if num_au_atoms == 0:
+        return packing_density_array
+
+    xyz_surr = np.asarray(xyz_surr_atom, dtype=np.float64)
+    xyz_au = np.asarray(xyz_au_atom, dtype=np.float64)
+    origin = np.minimum(xyz_surr.min(axis=0), xyz_au.min(axis=0)) - voxel_size
+    grid_max = np.maximum(xyz_surr.max(axis=0), xyz_au.max(axis=0))
+    grid_shape = calc_grid_shape(origin, grid_max, voxel_size)
+
+    # Coarsens the voxel size until the memory required by the convolution is
+    # within max_kernel_mem
+    max_voxel_size = GRID_MAX_VOXEL_FRACTION * pack_dens_thresh
+    init_voxel_size = voxel_size
+    grid_mem = calc_grid_mem(
+        grid_shape, (2*np.ceil(pack_dens_thresh / voxel_size)) + 1
+    )
+    while grid_mem > max_kernel_mem:
+        voxel_size *= max((grid_mem / max_kernel_mem)**(1/3), 1.05)
+        if voxel_size > max_voxel_size:
+            raise ValueError(
+                'Grid-based packing density calculation requires more than '
+                'the maximum kernel memory ({} bytes) even at a voxel size of '
+                '{:.3f} Angstroms - increase maxkernelmem or use '
+                'pdengine=kdtree'.format(max_kernel_mem, max_voxel_size)
+            )
+        origin = (
+            np.minimum(xyz_surr.min(axis=0), xyz_au.min(axis=0)) - voxel_size
+        )
+        grid_shape = calc_grid_shape(origin, grid_max, voxel_size)
+        grid_mem = calc_grid_mem(
+            grid_shape, (2*np.ceil(pack_dens_thresh / voxel_size)) + 1
+        )
+    if voxel_size != init_voxel_size:
+        print('WARNING: Grid voxel size coarsened from %.3f to %.3f Angstroms '
+              'to keep the memory required by the grid-based packing density '
+              'calculation within %s bytes (maxkernelmem) - the packing '
+              'density values will be less accurate\n' % (
+                  init_voxel_size, voxel_size, max_kernel_mem
+              ))
+
+    # Spreads each surrounding atom across the 8 voxels around it, weighted by
+    # its proximity to each
+    surr_grid = (xyz_surr - origin) / voxel_size
+    lower = np.floor(surr_grid).astype(int)
+    frac = surr_grid - lower
+    atom_grid = np.zeros(grid_shape)
+    for corner in np.ndindex(2, 2, 2):
+        corner = np.array(corner)
+        weights = np.prod(np.where(corner == 1, frac, 1 - frac), axis=1)
+        indices = lower + corner
+        np.add.at(
+            atom_grid, (indices[:, 0], indices[:, 1], indices[:, 2]), weights
+        )
 
-    for i in range(num_au_atoms):
-        distances = np.sqrt(np.square(xyz_surr_atom[:, :] - xyz_au_atom[i, :]).sum(axis=1))
-        packing_density_array[i][0] = np.sum(distances < pack_dens_thresh) - 1  # Subtract
-        # 1 to correct for the atom itself being counted.
+    kernel_radius = int(np.ceil(pack_dens_thresh / voxel_size))
+    kernel_axis = np.arange(-kernel_radius, kernel_radius+1) * voxel_size
+    kx, ky, kz = np.meshgrid(kernel_axis, kernel_axis, kernel_axis, indexing='ij')
+    kernel = ((kx**2 + ky**2 + kz**2) < pack_dens_thresh**2).astype(np.float64)
+    contact_grid = fftconvolve(atom_grid, kernel, mode='same')
+
+    au_grid = ((xyz_au - origin) / voxel_size).T
+    contacts = np.rint(map_coordinates(contact_grid, au_grid, order=1))
+
+    packing_density_array[:, 0] = contacts - 1  # Subtract 1 to correct for the
+    # atom itself being counted.
+
+    # Estimates the error of the approximation from the exact packing density
+    # values of a random sample of atoms
+    rng = np.random.RandomState(0)
+    sample = np.sort(rng.choice(
+        num_au_atoms, min(sample_size, num_au_atoms), replace=False
+    ))
+    exact_contacts = count_contacts(
+        xyz_au_atom[sample], xyz_surr_atom, pack_dens_thresh,
+        xyz_surr_exact=xyz_surr_exact
+    )
+    errors = contacts[sample] - exact_contacts
+    print('Grid-based packing density error (over %s sampled atoms):\n'
+          'mean absolute error = %.3f, maximum absolute error = %d, '
+          'mean relative error = %.2f%%\n' % (
+              sample.shape[0], np.abs(errors).mean(), np.abs(errors).max(),
+              100 * np.mean(
+                  np.abs(errors) / np.maximum(exact_contacts - 1, 1)
+              )
+          ))
 
     return packing_density_array
 
 
+def calc_lattice_translations(cartesianVectors, cell_shifts):
+    """
+    Calculates the Cartesian translation vectors corresponding to (an array
+    of) integer numbers of unit cells along a, b and c. The same arithmetic
+    is used as in translateUnitCell, such that the translated coordinates
+    are identical to those in the 3x3 unit cell assembly.
+    """
+
+    cell_shifts = np.asarray(cell_shifts).reshape(-1, 3)
+    aVec = cell_shifts[:, 0:1] * cartesianVectors[0].reshape(1, 3)
+    bVec = cell_shifts[:, 1:2] * cartesianVectors[1].reshape(1, 3)
+    cVec = cell_shifts[:, 2:3] * cartesianVectors[2].reshape(1, 3)
+
+    return (aVec + bVec) + cVec
+
+
+def count_contacts_pbc(
+    xyz_au_atom, xyz_uc_atom, uc_cell_shifts, cartesianVectors,
+    pack_dens_thresh, tree, uc_frac_bounds
+):
+    """
+    Counts the number of unit cell atoms (and their periodic images) within
+    the packing density threshold of each asymmetric unit atom. The unit cell
+    atoms, wrapped into the (0, 0, 0) cell, are stored in a KD-tree, which is
+    queried with the asymmetric unit atoms shifted by every lattice
+    translation that could bring an image within the packing density
+    threshold.
+    """
+
+    inv_lattice = np.linalg.inv(np.hstack(cartesianVectors))
+    # The extent of a sphere of radius PDT along each fractional axis is
+    # PDT multiplied by the length of the corresponding reciprocal lattice
+    # vector (which accounts for oblique unit cells)
+    reach = (pack_dens_thresh + BOUNDARY_TOL) * np.linalg.norm(
+        inv_lattice, axis=1
+    )
+    au_frac = xyz_au_atom.dot(inv_lattice.T)
+    shift_min = np.floor(au_frac.min(axis=0) - reach - uc_frac_bounds[1])
+    shift_max = np.ceil(au_frac.max(axis=0) + reach - uc_frac_bounds[0])
+
+    contacts = np.zeros(xyz_au_atom.shape[0], dtype=int)
+    for a in range(int(shift_min[0]), int(shift_max[0]) + 1):
+        for b in range(int(shift_min[1]), int(shift_max[1]) + 1):
+            for c in range(int(shift_min[2]), int(shift_max[2]) + 1):
+                shift = np.array([a, b, c])
+                # Only considers asymmetric unit atoms that lie within the
+                # packing density threshold of the translated unit cell
+                au_indices = np.flatnonzero(np.all(
+                      (au_frac >= uc_frac_bounds[0] + shift - reach)
+                    & (au_frac <= uc_frac_bounds[1] + shift + reach), axis=1
+                ))
+                if au_indices.shape[0] == 0:
+                    continue
+
+                trans_vector = calc_lattice_translations(cartesianVectors, shift)
+                query_xyz = xyz_au_atom[au_indices] - trans_vector
+                inner_count = tree.query_ball_point(
+                    query_xyz, pack_dens_thresh - BOUNDARY_TOL,
+                    return_length=True
+                )
+                outer_count = tree.query_ball_point(
+                    query_xyz, pack_dens_thresh + BOUNDARY_TOL,
+                    return_length=True
+                )
+
+                # As in count_contacts_kdtree, atoms lying close to the
+                # threshold are recounted exactly, with the coordinates of
+                # their neighbours calculated as in the 3x3 unit cell assembly
+                for i in np.flatnonzero(inner_count != outer_count):
+                    uc_indices = np.array(tree.query_ball_point(
+                        query_xyz[i], pack_dens_thresh + BOUNDARY_TOL
+                    ), dtype=int)
+                    surr_xyz = xyz_uc_atom[uc_indices] + calc_lattice_translations(
+                        cartesianVectors, shift - uc_cell_shifts[uc_indices]
+                    )
+                    distances = calc_distances(
+                        xyz_au_atom[au_indices[i]], surr_xyz
+                    )
+                    inner_count[i] = np.sum(distances < pack_dens_thresh)
+
+                contacts[au_indices] += inner_count
+
+    return contacts
+
+
+def count_contacts_periodic(
+    xyz_au_atom, xyz_uc_atom, cartesianVectors, pack_dens_thresh, workers=1
+):
+    """
+    Counts the number of atoms in the unit cell, plus their periodic images,
+    within the packing density threshold of each asymmetric unit atom.
+    """
+
+    from scipy.spatial import cKDTree
+
+    # Wraps the unit cell atoms into the (0, 0, 0) unit cell
+    inv_lattice = np.linalg.inv(np.hstack(cartesianVectors))
+    uc_cell_shifts = np.floor(xyz_uc_atom.dot(inv_lattice.T)).astype(int)
+    xyz_uc_wrapped = xyz_uc_atom - calc_lattice_translations(
+        cartesianVectors, uc_cell_shifts
+    )
+    uc_frac = xyz_uc_wrapped.dot(inv_lattice.T)
+    uc_frac_bounds = (uc_frac.min(axis=0), uc_frac.max(axis=0))
+
+    tree = cKDTree(xyz_uc_wrapped)
+    count_func = lambda xyz_au_chunk: count_contacts_pbc(
+        xyz_au_chunk, xyz_uc_atom, uc_cell_shifts, cartesianVectors,
+        pack_dens_thresh, tree, uc_frac_bounds
+    )
+
+    return count_contacts_in_parallel(count_func, xyz_au_atom, workers)
+
+
+def calc_packing_density_pbc(
+    xyz_au_atom, xyz_uc_atom, cartesianVectors, pack_dens_thresh, workers=1
+):
+    """
+    Calculates the packing density of each atom in the subset of atoms to
+    be considered for BDamage analysis directly from the atoms in the unit
+    cell, applying periodic boundary conditions in fractional coordinates
+    rather than generating and trimming a 3x3 unit cell assembly. All
+    lattice translations within the packing density threshold are
+    considered, so unit cells of any shape or size are handled correctly.
+    """
+
+    num_au_atoms = xyz_au_atom.shape[0]
+    packing_density_array = np.zeros([num_au_atoms, 1])
+
+    contacts = count_contacts_periodic(
+        xyz_au_atom, xyz_uc_atom, cartesianVectors, pack_dens_thresh, workers
+    )
+
+    packing_density_array[:, 0] = contacts - 1  # Subtract 1 to correct for the
+    # atom itself being counted.
+
+    return packing_density_array
+
+
+def find_unique_symmetry_images(au_atom_frac, sym_ops, cartesianVectors):
+    """
+    Determines, for each symmetry operator, which asymmetric unit atoms are
+    mapped onto a unique site in the unit cell. Atoms on special positions
+    are mapped onto the same site by more than one symmetry operator, in
+    which case only the image generated by the first of these operators is
+    retained (as in cctbx's expand_to_p1).
+    """
+
+    lattice = np.hstack(cartesianVectors)
+
+    def calc_image_separation(frac_1, frac_2):
+        frac_diff = frac_1 - frac_2
+        frac_diff -= np.round(frac_diff)
+        return np.sqrt(np.square(frac_diff.dot(lattice.T)).sum(axis=-1))
+
+    unique_masks = [np.ones(au_atom_frac.shape[0], dtype=bool) for op in sym_ops]
+
+    # Identifies atoms on special positions, i.e. which are mapped onto
+    # themselves by a symmetry operator other than the identity
+    special = np.zeros(au_atom_frac.shape[0], dtype=bool)
+    for rot, trans in sym_ops:
+        if np.array_equal(rot, np.identity(3)) and not np.any(trans % 1):
+            continue
+        image_frac = au_atom_frac.dot(rot.T) + trans
+        special |= (
+            calc_image_separation(image_frac, au_atom_frac)
+            < MIN_DISTANCE_SYM_EQUIV
+        )
+    special_indices = np.flatnonzero(special)
+    if special_indices.shape[0] == 0:
+        return unique_masks
+
+    images_frac = [
+        au_atom_frac[special_indices].dot(rot.T) + trans
+        for rot, trans in sym_ops
+    ]
+    for j in range(1, len(sym_ops)):
+        for k in range(j):
+            duplicate = (
+                calc_image_separation(images_frac[j], images_frac[k])
+                < MIN_DISTANCE_SYM_EQUIV
+            ) & unique_masks[k][special_indices]
+            unique_masks[j][special_indices[duplicate]] = False
+
+    return unique_masks
+
+
+def calc_packing_density_symmetry(
+    xyz_au_atom, au_atom_frac, sym_ops, cartesianVectors, pack_dens_thresh,
+    workers=1
+):
+    """
+    Calculates the packing density of each atom in the subset of atoms to
+    be considered for BDamage analysis from the asymmetric unit plus the
+    space group symmetry operators. The symmetry images generated by each
+    operator are counted in turn (under periodic boundary conditions), so
+    that neither the unit cell nor the 3x3 unit cell assembly is held in
+    memory, and only those lattice translations of each image within the
+    packing density threshold of the asymmetric unit are considered.
+    """
+
+    num_au_atoms = xyz_au_atom.shape[0]
+    packing_density_array = np.zeros([num_au_atoms, 1])
+
+    lattice = np.hstack(cartesianVectors)
+    unique_masks = find_unique_symmetry_images(
+        au_atom_frac, sym_ops, cartesianVectors
+    )
+
+    contacts = np.zeros(num_au_atoms, dtype=int)
+    for (rot, trans), unique_mask in zip(sym_ops, unique_masks):
+        image_frac = au_atom_frac[unique_mask].dot(rot.T) + trans
+        image_xyz = image_frac.dot(lattice.T)
+        contacts += count_contacts_periodic(
+            xyz_au_atom, image_xyz, cartesianVectors, pack_dens_thresh,
+            workers
+        )
+
+    packing_density_array[:, 0] = contacts - 1  # Subtract 1 to correct for the
+    # atom itself being counted.
+
+    return packing_density_array
+
+
+def count_contacts_in_shells(
+    xyz_au_atom, xyz_surr_atom, shell_radii, tree, tol=BOUNDARY_TOL,
+    xyz_surr_exact=None
+):
+    """
+    Counts the number of surrounding atoms within each of a series of
+    (increasing) radii of each asymmetric unit atom, from a single KD-tree
+    neighbour search at the largest radius. The distances between each atom
+    and its neighbours are calculated exactly, from xyz_surr_exact if the
+    surrounding atom coordinates are stored in single precision.
+    """
+
+    if xyz_surr_exact is None:
+        xyz_surr_exact = xyz_surr_atom
+
+    num_au_atoms = xyz_au_atom.shape[0]
+    num_shells = shell_radii.shape[0]
+    shell_counts = np.zeros([num_au_atoms, num_shells], dtype=int)
+
+    # Asymmetric unit atoms are processed in chunks to limit the memory
+    # required to store the indices of their neighbours
+    chunk_size = 1024
+    for start in range(0, num_au_atoms, chunk_size):
+        stop = min(start + chunk_size, num_au_atoms)
+        neighbours = tree.query_ball_point(
+            xyz_au_atom[start:stop], shell_radii[-1] + tol
+        )
+        num_neighbours = np.array([len(x) for x in neighbours], dtype=int)
+        au_indices = np.repeat(np.arange(stop - start), num_neighbours)
+        surr_indices = np.concatenate(
+            [np.array(x, dtype=int) for x in neighbours]
+        )
+        distances = calc_distances(
+            xyz_au_atom[start:stop][au_indices], xyz_surr_exact[surr_indices]
+        )
+
+        # Each pair of atoms is assigned to the shell of the smallest radius
+        # that it lies within (pairs that lie outside of every radius are
+        # assigned to an additional shell which is subsequently discarded).
+        # The number of atoms within each radius is then the cumulative sum
+        # of the counts in the shells up to and including that radius.
+        shell_indices = np.searchsorted(shell_radii, distances, side='right')
+        shell_hist = np.bincount(
+            (au_indices*(num_shells+1)) + shell_indices,
+            minlength=(stop-start)*(num_shells+1)
+        ).reshape(stop-start, num_shells+1)
+        shell_counts[start:stop] = np.cumsum(shell_hist[:, :num_shells], axis=1)
+
+    return shell_counts
+
+
+def calc_contact_shells(
+    xyz_au_atom, xyz_surr_atom, shell_radii, workers=1, xyz_surr_exact=None
+):
+    """
+    Calculates the packing density of each atom in the subset of atoms to
+    be considered for BDamage analysis at each of a series of packing density
+    thresholds (shell_radii) in a single neighbour search. Returns an array
+    with one row per atom and one column per threshold (in ascending
+    order).
+    """
+
+    from scipy.spatial import cKDTree
+
+    shell_radii = np.sort(np.array(shell_radii, dtype=float))
+
+    tol = BOUNDARY_TOL
+    if xyz_surr_atom.dtype == np.float32:
+        if xyz_surr_exact is None:
+            raise ValueError(
+                'Double precision coordinates of the surrounding atoms '
+                '(xyz_surr_exact) are required to calculate contact shells '
+                'from single precision coordinates'
+            )
+        tol = max(tol, calc_single_precision_tol(
+            xyz_au_atom, xyz_surr_atom, shell_radii[-1]
+        ))
+
+    tree = cKDTree(xyz_surr_atom)
+    count_func = lambda xyz_au_chunk: count_contacts_in_shells(
+        xyz_au_chunk, xyz_surr_atom, shell_radii, tree, tol, xyz_surr_exact
+    )
+    shell_counts = count_contacts_in_parallel(count_func, xyz_au_atom, workers)
+
+    return shell_counts - 1  # Subtract 1 to correct for the atom itself
+    # being counted.
+
+
+def find_self_pairs(au_indices, distances):
+    """
+    Flags, for each asymmetric unit atom, the pair formed with its own copy in
+    the surrounding atoms, i.e. its nearest surrounding atom if this lies
+    within SELF_PAIR_TOL. At most one pair is flagged per atom, so that other
+    atoms at (almost) the same position are still counted as contacts.
+    """
+
+    self_pairs = np.zeros(distances.shape[0], dtype=bool)
+    candidates = np.flatnonzero(distances < SELF_PAIR_TOL)
+    if candidates.shape[0] > 0:
+        candidates = candidates[np.lexsort(
+            (distances[candidates], au_indices[candidates])
+        )]
+        unique_atoms, first_index = np.unique(
+            au_indices[candidates], return_index=True
+        )
+        self_pairs[candidates[first_index]] = True
+
+    return self_pairs
+
+
+def count_weighted_contacts(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, weightings, tree,
+    tol=BOUNDARY_TOL, xyz_surr_exact=None, contact_graph=False,
+    au_copy_mask=None
+):
+    """
+    Counts the number of surrounding atoms within the packing density
+    threshold of each asymmetric unit atom, and sums the weights of these
+    contacts under each of the weighting functions (named in
+    CONTACT_WEIGHTINGS) in weightings, from a single KD-tree neighbour
+    search. The distances between each atom and its neighbours are calculated
+    exactly, from xyz_surr_exact if the surrounding atom coordinates are
+    stored in single precision. Returns an array with one row per atom, with
+    the contact number in the first column followed by one column per
+    weighting function. The atom itself (its copy within SELF_PAIR_TOL, see
+    find_self_pairs) is included in the contact number but not in the
+    weighted sums.
+
+    If au_copy_mask (a boolean array flagging the surrounding atoms in the
+    same copy of the asymmetric unit as the asymmetric unit atoms) is
+    provided, an additional final column holds the number of these atoms
+    within the packing density threshold (again including the atom itself).
+    If contact_graph is True, the pairs of atoms in contact (excluding each
+    atom and its own copy) are also returned, as a sparse matrix with one row
+    per asymmetric unit atom and one column per surrounding atom, whose
+    entries are the distances between the atoms in each pair.
+    """
+
+    from scipy.sparse import csr_matrix
+
+    if xyz_surr_exact is None:
+        xyz_surr_exact = xyz_surr_atom
+
+    num_au_atoms = xyz_au_atom.shape[0]
+    num_cols = len(weightings) + 1
+    if au_copy_mask is not None:
+        num_cols += 1
+    contacts = np.zeros([num_au_atoms, num_cols])
+    rows = []
+    cols = []
+    dists = []
+
+    # Asymmetric unit atoms are processed in chunks to limit the memory
+    # required to store the indices of their neighbours
+    chunk_size = 1024
+    for start in range(0, num_au_atoms, chunk_size):
+        stop = min(start + chunk_size, num_au_atoms)
+        neighbours = tree.query_ball_point(
+            xyz_au_atom[start:stop], pack_dens_thresh + tol
+        )
+        num_neighbours = np.array([len(x) for x in neighbours], dtype=int)
+        au_indices = np.repeat(np.arange(stop - start), num_neighbours)
+        surr_indices = np.concatenate(
+            [np.array(x, dtype=int) for x in neighbours]
+        )
+        distances = calc_distances(
+            xyz_au_atom[start:stop][au_indices], xyz_surr_exact[surr_indices]
+        )
+
+        in_contact = distances < pack_dens_thresh
+        contacts[start:stop, 0] = np.bincount(
+            au_indices[in_contact], minlength=stop-start
+        )
+        if au_copy_mask is not None:
+            contacts[start:stop, -1] = np.bincount(
+                au_indices[in_contact & au_copy_mask[surr_indices]],
+                minlength=stop-start
+            )
+        in_contact &= ~find_self_pairs(au_indices, distances)
+        for col, weighting in enumerate(weightings, start=1):
+            weights = CONTACT_WEIGHTINGS[weighting](
+                distances[in_contact], pack_dens_thresh
+            )
+            contacts[start:stop, col] = np.bincount(
+                au_indices[in_contact], weights=weights, minlength=stop-start
+            )
+        if contact_graph is True:
+            rows.append(start + au_indices[in_contact])
+            cols.append(surr_indices[in_contact])
+            dists.append(distances[in_contact].astype(np.float32))
+
+    if contact_graph is False:
+        return contacts
+
+    graph = csr_matrix(
+        (np.concatenate(dists + [np.zeros(0, dtype=np.float32)]),
+         (np.concatenate(rows + [np.zeros(0, dtype=int)]),
+          np.concatenate(cols + [np.zeros(0, dtype=int)]))),
+        shape=(num_au_atoms, xyz_surr_atom.shape[0])
+    )
+    graph.sort_indices()
+
+    return contacts, graph
+
+
+def calc_contact_properties(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, weightings=None,
+    au_copy_mask=None, contact_graph=False, workers=1, xyz_surr_exact=None
+):
+    """
+    Calculates the packing density of each atom in the subset of atoms to
+    be considered for BDamage analysis (identical to the values calculated
+    by calc_packing_density) in a single KD-tree neighbour search (see
+    count_weighted_contacts), split across the specified number of worker
+    threads that share the KD-tree of the surrounding atoms. The following
+    are calculated from the atom pairs found by the same search:
+    - the weighted contact numbers under each of the weighting functions in
+      weightings (if weightings is not None)
+    - the intra- and intermolecular contact numbers, with intramolecular
+      contacts being those with the atoms flagged by au_copy_mask (if
+      au_copy_mask is not None)
+    - the contact graph (if contact_graph is True), whose row lengths are
+      the packing density values
+    Returns the packing density array, the array of weighted contact numbers
+    (one column per weighting function), the array of intra- and
+    intermolecular contact numbers and the contact graph, with None in place
+    of any that have not been requested.
+    """
+
+    from scipy.sparse import vstack
+    from scipy.spatial import cKDTree
+
+    if weightings is None:
+        weightings = []
+    for weighting in weightings:
+        if not weighting in CONTACT_WEIGHTINGS:
+            raise ValueError(
+                'Contact weighting {} not recognised - expect to be one of '
+                '{}'.format(weighting, sorted(CONTACT_WEIGHTINGS))
+            )
+
+    tol = BOUNDARY_TOL
+    if xyz_surr_atom.dtype == np.float32:
+        if xyz_surr_exact is None:
+            raise ValueError(
+                'Double precision coordinates of the surrounding atoms '
+                '(xyz_surr_exact) are required to calculate contacts from '
+                'single precision coordinates'
+            )
+        tol = max(tol, calc_single_precision_tol(
+            xyz_au_atom, xyz_surr_atom, pack_dens_thresh
+        ))
+
+    tree = cKDTree(xyz_surr_atom)
+    count_func = lambda xyz_au_chunk: count_weighted_contacts(
+        xyz_au_chunk, xyz_surr_atom, pack_dens_thresh, weightings, tree, tol,
+        xyz_surr_exact, contact_graph, au_copy_mask
+    )
+    graph = None
+    if contact_graph is True:
+        contacts, graph = count_contacts_in_parallel(
+            count_func, xyz_au_atom, workers,
+            combine_func=(
+                np.concatenate, lambda graphs: vstack(graphs, format='csr')
+            )
+        )
+    else:
+        contacts = count_contacts_in_parallel(count_func, xyz_au_atom, workers)
+
+    packing_density_array = contacts[:, 0:1] - 1  # Subtract 1 to correct for
+    # the atom itself being counted.
+
+    weighted_contacts = None
+    if len(weightings) > 0:
+        weighted_contacts = contacts[:, 1:len(weightings)+1]
+
+    # The intermolecular contacts are the remainder of the packing density
+    contact_split = None
+    if au_copy_mask is not None:
+        contact_split = np.zeros([xyz_au_atom.shape[0], 2])
+        contact_split[:, 0] = contacts[:, -1] - 1  # Subtract 1 to correct
+        # for the atom itself being counted.
+        contact_split[:, 1] = packing_density_array[:, 0] - contact_split[:, 0]
+
+    return packing_density_array, weighted_contacts, contact_split, graph
+
+
+def calc_weighted_packing_density(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, weightings, workers=1,
+    xyz_surr_exact=None
+):
+    """
+    Calculates the packing density of each atom in the subset of atoms to
+    be considered for BDamage analysis (identical to the values calculated
+    by calc_packing_density), plus its weighted contact number under each of
+    the weighting functions in weightings, in a single neighbour search.
+    Returns the packing density array and an array of weighted contact
+    numbers (with one column per weighting function).
+    """
+
+    (packing_density_array, weighted_contacts, contact_split, contact_graph
+    ) = calc_contact_properties(
+        xyz_au_atom, xyz_surr_atom, pack_dens_thresh, weightings,
+        workers=workers, xyz_surr_exact=xyz_surr_exact
+    )
+
+    return packing_density_array, weighted_contacts
+
+
+def calc_contact_split(
+    xyz_au_atom, xyz_surr_atom, au_copy_mask, pack_dens_thresh, workers=1,
+    xyz_surr_exact=None
+):
+    """
+    Splits the packing density of each atom in the subset of atoms to be
+    considered for BDamage analysis into intramolecular contacts (with atoms
+    in the same copy of the asymmetric unit, as flagged by au_copy_mask) and
+    intermolecular contacts (with atoms in symmetry-related and
+    lattice-translated copies of the asymmetric unit, i.e. crystal contacts).
+    The contacts are split by applying au_copy_mask to the atom pairs found
+    by the packing density neighbour search, so no further distances are
+    calculated. Returns the packing density array, and an array with one row
+    per atom and columns of intra- and intermolecular contact numbers.
+    """
+
+    (packing_density_array, weighted_contacts, contact_split, contact_graph
+    ) = calc_contact_properties(
+        xyz_au_atom, xyz_surr_atom, pack_dens_thresh,
+        au_copy_mask=au_copy_mask, workers=workers,
+        xyz_surr_exact=xyz_surr_exact
+    )
+
+    return packing_density_array, contact_split
+
+
+def calc_contact_graph(
+    xyz_au_atom, xyz_surr_atom, pack_dens_thresh, weightings=None,
+    workers=1, xyz_surr_exact=None
+):
+    """
+    Calculates the graph of the contacts (within the packing density
+    threshold) formed by each atom in the subset of atoms to be considered
+    for BDamage analysis, as a compressed sparse row (CSR) matrix with one
+    row per atom and one column per surrounding atom. The packing density of
+    each atom is equal to the number of entries in its row, so the graph
+    and packing density values (identical to those calculated by
+    calc_packing_density) are found in a single neighbour search, along with
+    the weighted contact numbers under each of the weighting functions in
+    weightings (if any). Returns the packing density array, the array of
+    weighted contact numbers (None if weightings is None) and the contact
+    graph.
+    """
+
+    (packing_density_array, weighted_contacts, contact_split, contact_graph
+    ) = calc_contact_properties(
+        xyz_au_atom, xyz_surr_atom, pack_dens_thresh, weightings,
+        contact_graph=True, workers=workers, xyz_surr_exact=xyz_surr_exact
+    )
+
+    return packing_density_array, weighted_contacts, contact_graph
+
+
+def packing_density_at_threshold(shell_radii, shell_counts, pack_dens_thresh):
+    """
+    Extracts the packing density values at the specified threshold from the
+    output of calc_contact_shells, in the format returned by
+    calc_packing_density.
+    """
+
+    shell_index = np.flatnonzero(np.isclose(shell_radii, pack_dens_thresh))
+    if shell_index.shape[0] == 0:
+        raise ValueError(
+            'Packing density threshold {} not in contact shell radii '
+            '{}'.format(pack_dens_thresh, list(shell_radii))
+        )
+
+    return shell_counts[:, shell_index[0]:shell_index[0]+1].astype(float)
+
+
+def calc_bdamage_at_threshold(
+    bdamAtomList, shell_radii, shell_counts, pack_dens_thresh, window
+):
+    """
+    Recalculates the BDamage values of the atoms in bdamAtomList (in place)
+    at a different packing density threshold, using the packing density
+    values stored by calc_contact_shells rather than repeating the neighbour
+    search.
+    """
+
+    packing_density_array = packing_density_at_threshold(
+        shell_radii, shell_counts, pack_dens_thresh
+    )
+    write_pckg_dens_to_atoms(bdamAtomList, packing_density_array)
+    calcBDam(bdamAtomList, window)
+
+
+def gen_packing_density_cache_key(
+    xyz_au_atom, cryst1_line, pack_dens_thresh, shell_radii=None,
+    approximate=False, weightings=None, contact_split=False,
+    assembly_mode='full'
+):
+    """
+    Returns a key identifying the packing density values of a structure. The
+    packing density of an atom depends only upon the coordinates of the atoms
+    in the processed asymmetric unit, the unit cell and the packing density
+    threshold (plus the contact shell radii and contact weighting functions,
+    if the contact shells and weighted contact numbers are also cached, and
+    whether intra- and intermolecular contacts are also cached), and
+    so the key is unaffected by changes to the selection of atoms for BDamage
+    analysis. Approximate (grid-based) packing density values are given a
+    different key to exact values, and values calculated from each mode of
+    unit cell assembly (assembly_mode) are given different keys (for small
+    unit cells, the packing density values calculated under periodic
+    boundary conditions can differ from those calculated from the 3x3x3
+    assembly).
+    """
+
+    import hashlib
+
+    key = hashlib.sha256()
+    key.update(np.ascontiguousarray(xyz_au_atom, dtype=np.float64).tobytes())
+    key.update(cryst1_line.strip().encode('utf-8'))
+    key.update(repr(float(pack_dens_thresh)).encode('utf-8'))
+    key.update(assembly_mode.encode('utf-8'))
+    if shell_radii is not None:
+        key.update(repr([float(r) for r in shell_radii]).encode('utf-8'))
+    if approximate is True:
+        key.update(b'grid')
+    if weightings is not None:
+        key.update(repr(list(weightings)).encode('utf-8'))
+    if contact_split is True:
+        key.update(b'contact_split')
+
+    return key.hexdigest()
+
+
+def select_cached_values(bdamAtomList, clean_au_list, cached_array):
+    """
+    Selects the rows of an array of per-atom values, calculated for every
+    atom in clean_au_list, that correspond to the atoms in bdamAtomList
+    (atoms are matched via their atom numbers).
+    """
+
+    clean_index = {
+        atom_num: i for i, atom_num
+        in enumerate(get_atom_values(clean_au_list, 'atomNum').tolist())
+    }
+    rows = [
+        clean_index[atom_num]
+        for atom_num in get_atom_values(bdamAtomList, 'atomNum').tolist()
+    ]
+
+    return cached_array[rows]
+
+
 def write_pckg_dens_to_atoms(bdamAtomList, packing_density_array):
     """
-    Writes packing density values to their corresponding atom objects.
+    Writes packing density values to their corresponding atom objects (or
+    to the packing density column of an atom table).
     """
 
+    if getattr(bdamAtomList, 'columnar', False) is True:
+        bdamAtomList.pd[:] = packing_density_array[:, 0]
+        return
+
     for i, atom in enumerate(bdamAtomList):
         atom.pd = packing_density_array[i][0]
 
 
+def write_weighted_contacts_to_atoms(bdamAtomList, weightings, weighted_array):
+    """
+    Writes weighted contact numbers to their corresponding atom objects, as a
+    dictionary of the value under each weighting function (or to a column
+    per weighting function of an atom table).
+    """
+
+    if getattr(bdamAtomList, 'columnar', False) is True:
+        bdamAtomList.weighted_pd = {
+            weighting: np.array(weighted_array[:, j])
+            for j, weighting in enumerate(weightings)
+        }
+        return
+
+    for i, atom in enumerate(bdamAtomList):
+        atom.weighted_pd = {
+            weighting: weighted_array[i][j]
+            for j, weighting in enumerate(weightings)
+        }
+
+
+def write_contact_split_to_atoms(bdamAtomList, contact_split):
+    """
+    Writes intra- and intermolecular contact numbers to their corresponding
+    atom objects (or to the corresponding columns of an atom table).
+    """
+
+    if getattr(bdamAtomList, 'columnar', False) is True:
+        bdamAtomList.intra_pd[:] = contact_split[:, 0]
+        bdamAtomList.inter_pd[:] = contact_split[:, 1]
+        return
+
+    for i, atom in enumerate(bdamAtomList):
+        atom.intra_pd = contact_split[i][0]
+        atom.inter_pd = contact_split[i][1]
+
+
+def calc_rolling_mean(values, window):
+    """
+    Calculates the centred rolling mean of an array of values over a
+    fixed-size window, with NaN returned for windows that extend beyond the
+    ends of the array. The rolling mean is calculated by pandas'
+    Series.rolling(window=window, center=True).mean() (a single compiled pass
+    over the array), so that the values returned are identical to those of
+    the DataFrame-based BDamage calculation.
+    """
+
+    import pandas as pd
+
+    return pd.Series(values).rolling(
+        window=window, center=True
+    ).mean().to_numpy(dtype=np.float64, copy=True)
+
+
 def calcBDam(bdamAtomList, window):
     """
     All atoms to be considered for BDamage analysis are ordered via their
     packing density values; the BDamage value of each atom is then
     calculated as the ratio of its B-factor as compared to the average of the
     B-factor values of similarly (identified via sliding window) packed atoms.
+    The calculation is performed on numpy arrays, and returns values
+    identical to those calculated via the equivalent pandas operations.
     """
 
-    import math
-    import pandas as pd
+    num_atoms = len(bdamAtomList)
+    if num_atoms == 0:
+        return
+
+    # Arrays are filled with property values associated with each of the
+    # atoms considered for BDamage analysis.
+    atmnum = get_atom_values(bdamAtomList, 'atomNum')
+    bfac = get_atom_values(bdamAtomList, 'bFactor').astype(np.float64)
+    pd = get_atom_values(bdamAtomList, 'pd')
 
-    # Initialises lists of the atom properties required to calculate BDamage.
-    ATMNUM = [None]*len(bdamAtomList)
-    BFAC = [None]*len(bdamAtomList)
-    PD = [None]*len(bdamAtomList)
-
-    # Lists are filled with property values associated with each of the atoms
-    # considered for BDamage analysis, then concatenated into the columns of a
-    # DataFrame.
-    for index, atm in enumerate(bdamAtomList):
-        ATMNUM[index] = atm.atomNum
-        BFAC[index] = atm.bFactor
-        PD[index] = atm.pd
-
-    df = pd.DataFrame({'ATMNUM': ATMNUM,
-                       'BFAC': BFAC,
-                       'PD': PD})
-
-    # DataFrame rows are sorted by packing density (and next by atom number
-    # in cases of equal packing density). Average B-factor values are then
-    # calculated via a rolling mean approach with a window size as specified in
-    # the input file (default = 2%). In the cases of those atoms which lie too
+    # Atoms are sorted by packing density (and next by atom number in cases
+    # of equal packing density). Average B-factor values are then calculated
+    # via a rolling mean approach with a window size as specified in the
+    # input file (default = 2%). In the cases of those atoms which lie too
     # close to either edge of the packing density distribution to lie at the
     # centre of a full-sized window, the average B-factor value of each of
     # these atoms is taken from the closest complete window.
-    df = df.sort_values(by=['PD', 'ATMNUM'], ascending=[True, True])
-    df = df.reset_index(drop=True)
-
-    ser = df['BFAC']
-    ser = ser.rename('AVRG_BF')
-    ser = ser.rolling(window=window, center=True).mean()
-    ser = ser.fillna(0)
-
-    index_list = range(0, len(bdamAtomList))
-    index = pd.Series(index_list)
-    index = index.rename('INDEX')
-
-    df = pd.concat([df, ser, index], axis=1)
-
-    df.loc[(df.AVRG_BF == 0) & (df.INDEX <= (math.floor(window/2)-1)),
-           'AVRG_BF'] += df.BFAC.values[0:window].mean(axis=0)
-    df.loc[(df.AVRG_BF == 0) & (df.INDEX >= (len(bdamAtomList) - math.floor(window/2))),
-           'AVRG_BF'] += df.BFAC.values[(len(bdamAtomList)-window):len(bdamAtomList)].mean(axis=0)
-
-    # The BDamage value of each atom in the DataFrame is calculated as the
-    # ratio of its B factor value to its associated average B factor value.
-    atmnum_list = df.ATMNUM.tolist()
-    for atm in bdamAtomList:
-        index = atmnum_list.index(atm.atomNum)
-        atm.avrg_bf = df.AVRG_BF[index]
+    order = np.lexsort((atmnum, pd))
+    bfac_sorted = bfac[order]
+
+    avrg_bf = calc_rolling_mean(bfac_sorted, window)
+    avrg_bf[np.isnan(avrg_bf)] = 0
+
+    index = np.arange(num_atoms)
+    lower_edge = (avrg_bf == 0) & (index <= (math.floor(window/2)-1))
+    avrg_bf[lower_edge] += bfac_sorted[0:window].mean(axis=0)
+    upper_edge = (avrg_bf == 0) & (index >= (num_atoms - math.floor(window/2)))
+    avrg_bf[upper_edge] += bfac_sorted[(num_atoms-window):num_atoms].mean(axis=0)
+
+    # The average B factor values are scattered back to the original order of
+    # the atoms (via the inverse of the sorting permutation), and the BDamage
+    # value of each atom is calculated as the ratio of its B factor value to
+    # its associated average B factor value.
+    avrg_bf_unsorted = np.empty(num_atoms)
+    avrg_bf_unsorted[order] = avrg_bf
+    if getattr(bdamAtomList, 'columnar', False) is True:
+        bdamAtomList.avrg_bf[:] = avrg_bf_unsorted
+        bdamAtomList.bd[:] = bfac / avrg_bf_unsorted
+        return
+    for i, atm in enumerate(bdamAtomList):
+        atm.avrg_bf = avrg_bf_unsorted[i]
         atm.bd = atm.bFactor / atm.avrg_bf
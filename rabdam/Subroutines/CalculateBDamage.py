@@ -19,13 +19,96 @@
 # <http://www.gnu.org/licenses/>.
 
 
+def check_option_combinations(
+    assemblyMode, pdEngine, contactShells, weightedContacts, contactSplit,
+    contactGraph, trimMode, precision, createAUCpdb, createTApdb
+):
+    """
+    Checks that the unit cell assembly, packing density and output options
+    specified for a RABDAM run can be used together, raising a ValueError if
+    not. Called both when the input file is parsed and when a run_rabdam
+    object is initialised (e.g. from the phenix interface).
+    """
+
+    if contactShells is not None and assemblyMode != 'full':
+        raise ValueError(
+            'Contact shells can only be calculated from the 3x3 unit cell '
+            'assembly (assemblymode=full)'
+        )
+    if weightedContacts is not None and (
+        assemblyMode != 'full' or pdEngine != 'kdtree'
+    ):
+        raise ValueError(
+            'Weighted contact numbers can only be calculated from the 3x3 unit '
+            'cell assembly with a KD-tree neighbour search (assemblymode=full '
+            'and pdengine=kdtree)'
+        )
+    if contactSplit is True and (
+        assemblyMode != 'full' or pdEngine != 'kdtree'
+    ):
+        raise ValueError(
+            'Intra- and intermolecular contacts can only be calculated from '
+            'the 3x3 unit cell assembly with a KD-tree neighbour search '
+            '(assemblymode=full and pdengine=kdtree)'
+        )
+    if contactGraph is True and (
+        assemblyMode != 'full' or pdEngine != 'kdtree'
+    ):
+        raise ValueError(
+            'The contact graph can only be calculated from the 3x3 unit cell '
+            'assembly with a KD-tree neighbour search (assemblymode=full and '
+            'pdengine=kdtree)'
+        )
+    if trimMode != 'box' and assemblyMode not in ['full', 'stream']:
+        raise ValueError(
+            'Only the 3x3 unit cell assembly (assemblymode=full or stream) is '
+            'trimmed - trimmode must be set to "box" for assemblymode={}'.format(
+                assemblyMode
+            )
+        )
+    if assemblyMode == 'stream' and (
+        createAUCpdb is True or createTApdb is True
+    ):
+        raise ValueError(
+            'The 3x3 unit cell assembly is not stored when assemblymode=stream '
+            '- createaucpdb and createtapdb must be set to "False"'
+        )
+    if precision == 'single' and assemblyMode != 'full':
+        raise ValueError(
+            'Single precision coordinates are only supported for the 3x3 unit '
+            'cell assembly (assemblymode=full)'
+        )
+    if pdEngine == 'grid' and assemblyMode != 'full':
+        raise ValueError(
+            'Grid-based packing density (pdengine=grid) is only supported for '
+            'the 3x3 unit cell assembly (assemblymode=full)'
+        )
+    if assemblyMode in ['pbc', 'symmetry'] and pdEngine != 'kdtree':
+        raise ValueError(
+            'Packing density can only be calculated under periodic boundary '
+            'conditions (assemblymode={}) with pdengine=kdtree'.format(
+                assemblyMode
+            )
+        )
+
+
 class run_rabdam(object):
     def __init__(
         self, pathToInput, outputDir, batchRun, overwrite, outFiles,
         filterInput, temperature, resolution, PDT, windowSize, HETATM,
         removeAtoms, addAtoms, highlightAtoms, createOrigpdb, createAUpdb,
-        createUCpdb, createAUCpdb, createTApdb, phenixImport=False
+        createUCpdb, createAUCpdb, createTApdb, phenixImport=False,
+        pdEngine='kdtree', maxKernelMem=1073741824, nprocs=1,
+        assemblyMode='full', contactShells=None, precision='double',
+        backend='auto', pdCache=False, contactGraph=False, trimMode='box',
+        weightedContacts=None, contactSplit=False
     ):
+        check_option_combinations(
+            assemblyMode, pdEngine, contactShells, weightedContacts,
+            contactSplit, contactGraph, trimMode, precision, createAUCpdb,
+            createTApdb
+        )
+
         self.pathToInput = pathToInput
         self.outputDir = outputDir
         self.batchRun = batchRun
@@ -48,6 +131,18 @@ class run_rabdam(object):
         self.createAUCpdb = createAUCpdb
         self.createTApdb = createTApdb
         self.phenix_import = phenixImport
+        self.pdEngine = pdEngine
+        self.maxKernelMem = maxKernelMem
+        self.nprocs = nprocs
+        self.assemblyMode = assemblyMode
+        self.contactShells = contactShells
+        self.precision = precision
+        self.backend = backend
+        self.pdCache = pdCache
+        self.contactGraph = contactGraph
+        self.trimMode = trimMode
+        self.weightedContacts = weightedContacts
+        self.contactSplit = contactSplit
 
     def rabdam_dataframe(self, test=False):
         """
@@ -73,22 +168,36 @@ class run_rabdam(object):
         if self.phenix_import is True:
             from phenix.rabdam.Subroutines.PDBCUR import (
                 parse_mmcif_file, parse_pdb_file, clean_atom_rec, gen_unit_cell,
-                check_for_protein
+                get_symmetry_operators, check_for_protein
             )
             from phenix.rabdam.Subroutines.parsePDB import (
                 download_mmcif, copy_input, b_damage_atom_list,
-                suitable_for_bnet_filter
+                suitable_for_bnet_filter, atom_table
             )
             from phenix.rabdam.Subroutines.translateUnitCell import (
-                convertToCartesian, translateUnitCell, extract_unit_cell_params
+                convertToCartesian, translateUnitCellAssembly,
+                iterTranslatedUnitCells, extract_unit_cell_params,
+                translated_atom_coords, identify_au_copy_atoms
             )
             from phenix.rabdam.Subroutines.trimUnitCellAssembly import (
-                getAUparams, convertParams, trimAtoms
+                getAUparams, convertParams, trimAtoms, getAUfracParams,
+                convertFracParams, trimAtomsFractional, trimAtomsByDistance,
+                iterTrimmedAtoms
+            )
+            from phenix.rabdam.Subroutines.makeDataFrame import (
+                writeDataFrame, write_contact_shell_dataframe,
+                write_contact_graph
             )
-            from phenix.rabdam.Subroutines.makeDataFrame import writeDataFrame
             from phenix.rabdam.Subroutines.BDamage import (
                 get_xyz_from_objects, calc_packing_density,
-                write_pckg_dens_to_atoms, calcBDam
+                calc_packing_density_stream, calc_packing_density_grid,
+                calc_contact_properties, write_weighted_contacts_to_atoms,
+                write_contact_split_to_atoms,
+                calc_packing_density_pbc,
+                calc_packing_density_symmetry, calc_contact_shells,
+                packing_density_at_threshold, calc_single_precision_tol,
+                select_kernel_backend, gen_packing_density_cache_key,
+                select_cached_values, write_pckg_dens_to_atoms, calcBDam
             )
             from phenix.rabdam.Subroutines.output import write_all_carbon_cif
 
@@ -96,45 +205,73 @@ class run_rabdam(object):
             if __name__ == 'Subroutines.CalculateBDamage':
                 from Subroutines.PDBCUR import (
                     parse_mmcif_file, parse_pdb_file, clean_atom_rec,
-                    gen_unit_cell, check_for_protein
+                    gen_unit_cell, get_symmetry_operators,
+                    check_for_protein
                 )
                 from Subroutines.parsePDB import (
                     download_mmcif, copy_input, b_damage_atom_list,
-                    suitable_for_bnet_filter
+                    suitable_for_bnet_filter, atom_table
                 )
                 from Subroutines.translateUnitCell import (
-                    convertToCartesian, translateUnitCell,
-                    extract_unit_cell_params
+                    convertToCartesian, translateUnitCellAssembly,
+                    iterTranslatedUnitCells, extract_unit_cell_params,
+                    translated_atom_coords, identify_au_copy_atoms
                 )
                 from Subroutines.trimUnitCellAssembly import (
-                    getAUparams, convertParams, trimAtoms
+                    getAUparams, convertParams, trimAtoms, getAUfracParams,
+                    convertFracParams, trimAtomsFractional, trimAtomsByDistance,
+                    iterTrimmedAtoms
+                )
+                from Subroutines.makeDataFrame import (
+                    writeDataFrame, write_contact_shell_dataframe,
+                    write_contact_graph
                 )
-                from Subroutines.makeDataFrame import writeDataFrame
                 from Subroutines.BDamage import (
                     get_xyz_from_objects, calc_packing_density,
-                    write_pckg_dens_to_atoms, calcBDam
+                    calc_packing_density_stream, calc_packing_density_grid,
+                    calc_contact_properties, write_weighted_contacts_to_atoms,
+                    write_contact_split_to_atoms,
+                    calc_packing_density_pbc,
+                    calc_packing_density_symmetry, calc_contact_shells,
+                    packing_density_at_threshold, calc_single_precision_tol,
+                    select_kernel_backend, gen_packing_density_cache_key,
+                    select_cached_values, write_pckg_dens_to_atoms, calcBDam
                 )
                 from Subroutines.output import write_all_carbon_cif
             else:
                 from rabdam.Subroutines.PDBCUR import (
                     parse_mmcif_file, parse_pdb_file, clean_atom_rec,
-                    gen_unit_cell, check_for_protein
+                    gen_unit_cell, get_symmetry_operators,
+                    check_for_protein
                 )
                 from rabdam.Subroutines.parsePDB import (
                     download_mmcif, copy_input, b_damage_atom_list,
-                    suitable_for_bnet_filter
+                    suitable_for_bnet_filter, atom_table
                 )
                 from rabdam.Subroutines.translateUnitCell import (
-                    convertToCartesian, translateUnitCell,
-                    extract_unit_cell_params
+                    convertToCartesian, translateUnitCellAssembly,
+                    iterTranslatedUnitCells, extract_unit_cell_params,
+                    translated_atom_coords, identify_au_copy_atoms
                 )
                 from rabdam.Subroutines.trimUnitCellAssembly import (
-                    getAUparams, convertParams, trimAtoms
+                    getAUparams, convertParams, trimAtoms, getAUfracParams,
+                    convertFracParams, trimAtomsFractional, trimAtomsByDistance,
+                    iterTrimmedAtoms
+                )
+                from rabdam.Subroutines.makeDataFrame import (
+                    writeDataFrame, write_contact_shell_dataframe,
+                    write_contact_graph
                 )
-                from rabdam.Subroutines.makeDataFrame import writeDataFrame
                 from rabdam.Subroutines.BDamage import (
                     get_xyz_from_objects, calc_packing_density,
-                    write_pckg_dens_to_atoms, calcBDam
+                    calc_packing_density_stream, calc_packing_density_grid,
+                    calc_contact_properties, write_weighted_contacts_to_atoms,
+                    write_contact_split_to_atoms,
+                    calc_packing_density_pbc,
+                    calc_packing_density_symmetry, calc_contact_shells,
+                    packing_density_at_threshold, calc_single_precision_tol,
+                    select_kernel_backend, gen_packing_density_cache_key,
+                    select_cached_values, write_pckg_dens_to_atoms, calcBDam
                 )
                 from rabdam.Subroutines.output import write_all_carbon_cif
 
@@ -182,6 +319,84 @@ class run_rabdam(object):
             for value in self.addAtoms:
                 add_atoms_string = add_atoms_string + value + ', '
             print('Atoms to be added: %s' % add_atoms_string[:-2])
+        if self.pdEngine == 'kdtree':
+            print('Calculating packing density via KD-tree neighbour search '
+                  '(default)')
+        elif self.pdEngine == 'blocked':
+            print('Calculating packing density via blocked distance '
+                  'calculation, using up to %s bytes of memory' % self.maxKernelMem)
+        elif self.pdEngine == 'grid':
+            print('Approximating packing density via FFT convolution of a '
+                  'grid of atoms')
+        if self.assemblyMode == 'full':
+            print('Calculating packing density from 3x3 unit cell assembly '
+                  '(default)')
+        elif self.assemblyMode == 'stream':
+            print('Calculating packing density from 3x3 unit cell assembly, '
+                  'generated one\ntranslated unit cell at a time')
+        elif self.assemblyMode == 'pbc':
+            print('Calculating packing density from unit cell under periodic '
+                  'boundary conditions')
+        elif self.assemblyMode == 'symmetry':
+            print('Calculating packing density from asymmetric unit plus space '
+                  'group symmetry operators')
+        kernel_backend = select_kernel_backend(self.backend, self.pdEngine)
+        if kernel_backend == 'jit' and self.pdEngine == 'blocked':
+            print('Counting packing density contacts with JIT-compiled (numba) '
+                  'kernels')
+        elif kernel_backend == 'jit':
+            print('JIT-compiled (numba) kernels are only used by the blocked '
+                  'packing density engine - not used by the {} '
+                  'engine'.format(self.pdEngine))
+        if self.trimMode == 'box':
+            print('Trimming 3x3 unit cell assembly to a box around the '
+                  'asymmetric unit (default)')
+        elif self.trimMode == 'fractional':
+            print('Trimming 3x3 unit cell assembly to a box around the '
+                  'asymmetric unit,\nthen in fractional coordinates')
+        elif self.trimMode == 'distance':
+            print('Trimming 3x3 unit cell assembly to a box around the '
+                  'asymmetric unit,\nthen to atoms within the packing density '
+                  'threshold of an asymmetric unit atom')
+        if self.precision == 'double':
+            print('Storing coordinates in double precision (default)')
+        elif self.precision == 'single':
+            print('Storing coordinates in single precision (the KD-tree '
+                  'packing density engine\nstill builds its tree from a double '
+                  'precision copy of the trimmed atoms)')
+        if self.contactShells is None:
+            print('No contact shells to be calculated (default)')
+        else:
+            print('Contact shells to be calculated at radii of %s - %s '
+                  'Angstroms (%d shells)' % (
+                      self.contactShells[0], self.contactShells[-1],
+                      len(self.contactShells)
+                  ))
+        if self.weightedContacts is None:
+            print('No weighted contact numbers to be calculated (default)')
+        else:
+            print('Weighted contact numbers to be calculated: %s' % ', '.join(
+                self.weightedContacts
+            ))
+        if self.contactSplit is False:
+            print('Packing density will not be split into intra- and '
+                  'intermolecular contacts (default)')
+        else:
+            print('Packing density will be split into intra- and '
+                  'intermolecular contacts')
+        if self.contactGraph is False:
+            print('Contact graph will not be saved (default)')
+        else:
+            print('Contact graph will be saved')
+        if self.pdCache is False:
+            print('Packing density values will not be cached (default)')
+        else:
+            print('Packing density values will be cached, and reused if '
+                  'available')
+        if self.nprocs == 1:
+            print('Calculating packing density on a single thread (default)')
+        else:
+            print('Calculating packing density across %d threads' % self.nprocs)
 
         print('\n********************* End of Input Section *********************\n'
               '****************************************************************\n')
@@ -426,6 +641,8 @@ class run_rabdam(object):
             atoms_list, file_name_start, self.phenix_import
         )
         clean_au_file = '{}.cif'.format(clean_au_file)
+        # The unprocessed atom records are not needed beyond this point
+        del atoms_list
 
         if exit is True:
             shutil.rmtree('%s' % PDBdirectory)
@@ -492,14 +709,117 @@ class run_rabdam(object):
                 os.chdir('%s' % cwd)
                 return success
 
+        # Selects the atoms to be considered for BDamage analysis
+        bdamAtomList = b_damage_atom_list(
+            clean_au_list, self.HETATM, self.protOrNA, self.addAtoms,
+            self.removeAtoms
+        )
+
+        # Halts program if no atoms selected for BDamage analysis
+        if len(bdamAtomList) < 1:
+            print('\n\nERROR: No atoms selected for BDamage calculation')
+            shutil.rmtree('%s' % PDBdirectory)
+            success = False
+            if self.batchRun is False:
+                sys.exit()
+            elif self.batchRun is True:
+                os.chdir('%s' % cwd)
+                return success
+  
+        # Halts program if filterInput is set to True and the input model does
+        # not meet the filtering requirements for Bnet + Bnet_percentile
+        # calculation.
+        if not self.temperature is None:
+            temperature_list = [self.temperature]
+        if not self.resolution is None:
+            resolution = self.resolution
+        if self.filter is True:
+            exit = suitable_for_bnet_filter(
+                rfree, resolution, temperature_list, sub_1_asp_glu_occ,
+                contains_protein, bdamAtomList, self.pathToInput
+            )
+            if exit is True:
+                success = False
+                if self.batchRun is False:
+                    sys.exit()
+                elif self.batchRun is True:
+                    os.chdir('%s' % cwd)
+                    return success
+
+        # From this point onwards, the atoms selected for BDamage analysis
+        # and the atoms in the processed asymmetric unit are stored as atom
+        # tables (one array per atom property) rather than as lists of atom
+        # objects, so that the atom objects can be released
+        bdamAtomList = atom_table.from_atoms(bdamAtomList)
+        clean_au_list = atom_table.from_atoms(clean_au_list)
+
+        # If packing density values are to be cached, they are calculated for
+        # every atom in the processed asymmetric unit (rather than just those
+        # atoms selected for BDamage analysis)
+        if self.pdCache is True:
+            pdAtomList = clean_au_list
+        else:
+            pdAtomList = bdamAtomList
+
+        # If packing density caching is switched on, checks whether the
+        # packing density values of the processed asymmetric unit have been
+        # calculated previously. The packing density values are independent of
+        # the atoms selected for BDamage analysis, hence a cached calculation
+        # can be reused if only the HETATM, addAtoms or removeAtoms options
+        # have changed (in which case the unit cell does not need to be
+        # regenerated). The cache is not used if any of the unit cell PDB files
+        # (or the contact graph) have been requested.
+        pdCacheHit = False
+        if self.pdCache is True:
+            cache_directory = 'Logfiles/cache'
+            cache_key = gen_packing_density_cache_key(
+                get_xyz_from_objects(clean_au_list), cryst1_line, self.PDT,
+                self.contactShells, approximate=(self.pdEngine == 'grid'),
+                weightings=self.weightedContacts,
+                contact_split=self.contactSplit,
+                assembly_mode=self.assemblyMode
+            )
+            cache_file = '%s/%s_%s.pkl' % (
+                cache_directory, PDBcode, cache_key[:16]
+            )
+            if (
+                    os.path.isfile(cache_file)
+                and not any(x is True for x in [
+                    self.createUCpdb, self.createAUCpdb, self.createTApdb,
+                    self.contactGraph
+                ])
+            ):
+                print('\nLoading cached packing density values from %s\n' % cache_file)
+                with open(cache_file, 'rb') as f:
+                    (clean_pd_array, clean_shell_counts,
+                     clean_weighted_contacts,
+                     clean_contact_split) = pickle.load(f)
+                pdCacheHit = True
+
         print('****************** End of Process PDB Section ******************\n'
               '****************************************************************\n')
 
         print('****************************************************************\n'
               '************* Make and Translate Unit Cell Section *************\n')
-        # Generates a list of atoms in the unit cell
-        print('\nGenerating unit cell\n')
-        ucAtomList, ucAtomIDList = gen_unit_cell(clean_au_file, pathToInput)
+        # Generates a list of atoms in the unit cell (unless packing density is
+        # to be calculated from the space group symmetry operators, in which
+        # case the unit cell is only generated if createUCpdb is set equal to
+        # True in the input file).
+        if pdCacheHit is True:
+            print('\nPacking density values loaded from cache - unit cell not '
+                  'generated\n')
+        elif (
+                self.assemblyMode in ['full', 'stream', 'pbc']
+             or self.createUCpdb is True
+        ):
+            print('\nGenerating unit cell\n')
+            ucAtomList, ucAtomIDList = gen_unit_cell(clean_au_file, pathToInput)
+        if self.assemblyMode == 'symmetry' and pdCacheHit is False:
+            print('\nExtracting space group symmetry operators\n')
+            auAtomFrac, symOps = get_symmetry_operators(
+                clean_au_file, pathToInput
+            )
+            print('--> %d symmetry operators found' % len(symOps))
 
         # The PDB file of the processed asymmetric unit is deleted unless
         # createAUpdb is set equal to True (default = False) in the input file.
@@ -524,39 +844,79 @@ class run_rabdam(object):
         # vectors are then used to translate the unit cell -/+ 1 units in all
         # 3 (a, b and c) dimensions to generate a 3x3 parallelepiped. A PDB
         # file of this 3x3 parallelepiped is output if createAUCpdb is set
-        # equal to True in the input file (default = False).
-        transAtomList = np.empty([ucAtomList.shape[0]*27, 3])
-        transAtomIDList = ['']*(ucAtomList.shape[0]*27)
-
+        # equal to True in the input file (default = False). The 3x3
+        # parallelepiped is not required (and so is not generated) if packing
+        # density is to be calculated under periodic boundary conditions.
         unit_cell_params = extract_unit_cell_params(cryst1_line)
         cartesianVectors = convertToCartesian(unit_cell_params)
 
-        atom_count = 0
-        for a in range(-1, 2):
-            for b in range(-1, 2):
-                for c in range(-1, 2):
-                    transAtomList, transAtomIDList, atom_count = translateUnitCell(
-                        ucAtomList, transAtomList, transAtomIDList,
-                        cartesianVectors, a, b, c, atom_count,
-                        self.createAUCpdb, self.createTApdb
-                    )
-        # Halts program if error in unit cell translation
-        if atom_count != ucAtomList.shape[0]*27:
-            print('\n\nERROR: Failed to translate all unit cell atoms to '
-                  'create 3x3 unit cell assembly')
-            shutil.rmtree('%s' % PDBdirectory)
-            success = False
-            if self.batchRun is False:
-                sys.exit()
-            elif self.batchRun is True:
-                os.chdir('%s' % cwd)
-                return success
+        # Determines the boundaries of the trimmed atoms box, i.e. the
+        # boundaries of the asymmetric unit expanded by the packing density
+        # threshold. Atoms in the 3x3 parallelepiped outside of this box are
+        # later discarded.
+        au_atom_xyz = get_xyz_from_objects(pdAtomList)
+        auParams = getAUparams(au_atom_xyz)
+        print('\nObtained asymmetric unit parameters:')
+        print('xMin = %8.3f' % auParams[0])
+        print('xMax = %8.3f' % auParams[1])
+        print('yMin = %8.3f' % auParams[2])
+        print('yMax = %8.3f' % auParams[3])
+        print('zMin = %8.3f' % auParams[4])
+        print('zMax = %8.3f\n' % auParams[5])
 
-        # Creates PDB file of 3x3 unit cell assembly. WARNING: VERY slow and
-        # RAM-consuming for large structures!
-        if self.createAUCpdb is True:
-            aucPDBfilepath = '%s_all_unit_cells' % file_name_start
-            write_all_carbon_cif(transAtomList, transAtomIDList, aucPDBfilepath)
+        if pdCacheHit is True:
+            pass
+        elif self.assemblyMode in ['full', 'stream']:
+            if self.precision == 'single':
+                coord_dtype = np.float32
+            else:
+                coord_dtype = np.float64
+
+            # If contact shells are to be calculated, atoms are instead
+            # discarded if they lie further than the largest contact shell
+            # radius from the asymmetric unit
+            trim_radius = self.PDT
+            if self.contactShells is not None:
+                trim_radius = max(self.PDT, max(self.contactShells))
+            # If coordinates are stored in single precision, the trimmed
+            # atoms box is expanded to ensure that no atoms within the
+            # packing density threshold are discarded as a result of rounding
+            # (the magnitude of the rounding error is determined by the
+            # extremes of the coordinates of the atoms within the box)
+            if self.precision == 'single':
+                trim_radius += calc_single_precision_tol(
+                    np.array(auParams),
+                    np.array(convertParams(auParams, trim_radius)), trim_radius
+                )
+            keepParams = convertParams(auParams, trim_radius)
+
+            # Translated unit cells that lie entirely outside of the trimmed
+            # atoms box are not generated, unless a PDB file of the complete
+            # 3x3 unit cell assembly has been requested. In stream mode, each
+            # translated unit cell is instead generated as and when its
+            # contacts are counted.
+            if self.assemblyMode == 'stream':
+                print('3x3 unit cell assembly to be generated one translated '
+                      'unit cell at a time')
+            elif self.createAUCpdb is True:
+                transAtomList, transAtomIDList = translateUnitCellAssembly(
+                    ucAtomList, cartesianVectors, coord_dtype
+                )
+            else:
+                transAtomList, transAtomIDList = translateUnitCellAssembly(
+                    ucAtomList, cartesianVectors, coord_dtype, keepParams
+                )
+
+            # Creates PDB file of 3x3 unit cell assembly. WARNING: VERY slow
+            # and RAM-consuming for large structures!
+            if self.createAUCpdb is True:
+                aucPDBfilepath = '%s_all_unit_cells' % file_name_start
+                write_all_carbon_cif(
+                    transAtomList, transAtomIDList, aucPDBfilepath
+                )
+        elif self.assemblyMode in ['pbc', 'symmetry']:
+            print('Packing density to be calculated under periodic boundary '
+                  'conditions - 3x3 unit cell assembly not generated')
 
         print('\n************** End of Translate Unit Cell Section **************\n'
               '****************************************************************\n')
@@ -568,64 +928,45 @@ class run_rabdam(object):
         # asymmetric unit are discarded. A PDB file of the trimmed
         # parallelepiped is created if createTApdb is set equal to True
         # (default = False) in the input file.
-        bdamAtomList = b_damage_atom_list(
-            clean_au_list, self.HETATM, self.protOrNA, self.addAtoms,
-            self.removeAtoms
-        )
-
-        # Halts program if no atoms selected for BDamage analysis
-        if len(bdamAtomList) < 1:
-            print('\n\nERROR: No atoms selected for BDamage calculation')
-            shutil.rmtree('%s' % PDBdirectory)
-            success = False
-            if self.batchRun is False:
-                sys.exit()
-            elif self.batchRun is True:
-                os.chdir('%s' % cwd)
-                return success
-  
-        # Halts program if filterInput is set to True and the input model does
-        # not meet the filtering requirements for Bnet + Bnet_percentile
-        # calculation.
-        if not self.temperature is None:
-            temperature_list = [self.temperature]
-        if not self.resolution is None:
-            resolution = self.resolution
-        if self.filter is True:
-            exit = suitable_for_bnet_filter(
-                rfree, resolution, temperature_list, sub_1_asp_glu_occ,
-                contains_protein, bdamAtomList, self.pathToInput
+        # For unit cells with oblique axes, the atoms retained in the trimmed
+        # atoms box can be further filtered by the bounds of the asymmetric
+        # unit in fractional coordinates
+        keepFracParams = None
+        if (
+                self.assemblyMode in ['full', 'stream'] and pdCacheHit is False
+            and self.trimMode == 'fractional'
+        ):
+            keepFracParams = convertFracParams(
+                getAUfracParams(au_atom_xyz, cartesianVectors),
+                trim_radius, cartesianVectors
             )
-            if exit is True:
-                success = False
-                if self.batchRun is False:
-                    sys.exit()
-                elif self.batchRun is True:
-                    os.chdir('%s' % cwd)
-                    return success
 
-        auParams = getAUparams(bdamAtomList)
-        print('\nObtained asymmetric unit parameters:')
-        print('xMin = %8.3f' % auParams[0])
-        print('xMax = %8.3f' % auParams[1])
-        print('yMin = %8.3f' % auParams[2])
-        print('yMax = %8.3f' % auParams[3])
-        print('zMin = %8.3f' % auParams[4])
-        print('zMax = %8.3f\n' % auParams[5])
-
-        print('Removing atoms outside of packing density threshold')
-        keepParams = convertParams(auParams, self.PDT)
-        trimmedAtomList, trimmedAtomIDList = trimAtoms(
-            transAtomList, keepParams, transAtomIDList, str(self.PDT)
-        )
-
-        # Creates PDB file of trimmed 3x3 unit cell assembly. WARNING: VERY
-        # slow and RAM-consuming for large structures!
-        if self.createTApdb is True:
-            taPDBfilepath = '%s_trimmed_atoms' % file_name_start
-            write_all_carbon_cif(
-                trimmedAtomList, trimmedAtomIDList, taPDBfilepath
+        if self.assemblyMode == 'full' and pdCacheHit is False:
+            print('Removing atoms outside of packing density threshold')
+            trimmedAtomList, trimmedAtomIDList = trimAtoms(
+                transAtomList, keepParams, transAtomIDList, str(trim_radius)
             )
+            if self.trimMode == 'fractional':
+                trimmedAtomList, trimmedAtomIDList = trimAtomsFractional(
+                    trimmedAtomList, keepFracParams, cartesianVectors,
+                    trimmedAtomIDList, str(trim_radius)
+                )
+            # Alternatively, only those atoms within the packing density
+            # threshold of at least one atom in the asymmetric unit are
+            # retained
+            elif self.trimMode == 'distance':
+                trimmedAtomList, trimmedAtomIDList = trimAtomsByDistance(
+                    trimmedAtomList, au_atom_xyz, trimmedAtomIDList,
+                    trim_radius
+                )
+
+            # Creates PDB file of trimmed 3x3 unit cell assembly. WARNING:
+            # VERY slow and RAM-consuming for large structures!
+            if self.createTApdb is True:
+                taPDBfilepath = '%s_trimmed_atoms' % file_name_start
+                write_all_carbon_cif(
+                    trimmedAtomList, trimmedAtomIDList, taPDBfilepath
+                )
 
         print('\n****************** End of Trim Crystal Section *****************\n'
               '****************************************************************\n')
@@ -635,12 +976,162 @@ class run_rabdam(object):
         # Calculates the packing density (atomic contact number) of every atom
         # in the asymmetric unit.
 
-        print('Calculating packing density values\n')
-        au_atom_xyz = get_xyz_from_objects(bdamAtomList)
-        packing_density_array = calc_packing_density(
-            au_atom_xyz, trimmedAtomList, self.PDT
-        )
+        if pdCacheHit is False:
+            print('Calculating packing density values\n')
+        # If the trimmed atom coordinates are stored in single precision,
+        # atoms close to the packing density threshold are recounted using
+        # their double precision coordinates (calculated from their IDs)
+        trimmedAtomExact = None
+        if (
+                self.assemblyMode == 'full' and self.precision == 'single'
+            and pdCacheHit is False
+        ):
+            trimmedAtomExact = translated_atom_coords(
+                ucAtomList, trimmedAtomIDList, cartesianVectors
+            )
+
+        # Counts the contacts of every atom at each of the contact shell radii
+        # in a single neighbour search, so that BDamage can later be
+        # recalculated at different packing density thresholds
+        shell_counts = None
+        if pdCacheHit is True:
+            shell_counts = clean_shell_counts
+        elif self.contactShells is not None:
+            print('Calculating contact shells\n')
+            shell_counts = calc_contact_shells(
+                au_atom_xyz, trimmedAtomList, self.contactShells,
+                workers=self.nprocs, xyz_surr_exact=trimmedAtomExact
+            )
+
+        weighted_contacts = None
+        contact_split = None
+        contact_graph = None
+        if pdCacheHit is True:
+            packing_density_array = clean_pd_array
+            weighted_contacts = clean_weighted_contacts
+            contact_split = clean_contact_split
+        elif self.assemblyMode == 'full' and (
+                self.weightedContacts is not None or self.contactSplit is True
+             or self.contactGraph is True
+        ):
+            # Weighted contact numbers, the split of the contacts of every
+            # atom into those with atoms in the same copy of the asymmetric
+            # unit (intramolecular) and those with atoms in other copies
+            # (intermolecular, i.e. crystal contacts), and the sparse graph of
+            # every pair of atoms within the packing density threshold, are
+            # all calculated from the atom pairs found by the same neighbour
+            # search as the packing density values. The atoms in the same
+            # copy of the asymmetric unit are identified from their IDs.
+            auCopyMask = None
+            if self.contactSplit is True:
+                print('Splitting contacts into intra- and intermolecular '
+                      'contacts\n')
+                auCopyMask = identify_au_copy_atoms(
+                    ucAtomList, get_xyz_from_objects(clean_au_list),
+                    trimmedAtomIDList
+                )
+            if self.contactGraph is True:
+                print('Calculating contact graph\n')
+            (packing_density_array, weighted_contacts, contact_split,
+             contact_graph
+            ) = calc_contact_properties(
+                au_atom_xyz, trimmedAtomList, self.PDT,
+                weightings=self.weightedContacts, au_copy_mask=auCopyMask,
+                contact_graph=self.contactGraph, workers=self.nprocs,
+                xyz_surr_exact=trimmedAtomExact
+            )
+        elif shell_counts is not None and np.any(
+            np.isclose(self.contactShells, self.PDT)
+        ):
+            # If the packing density threshold is one of the contact shell
+            # radii, the packing density values are taken from the contact
+            # shells rather than repeating the neighbour search
+            packing_density_array = packing_density_at_threshold(
+                self.contactShells, shell_counts, self.PDT
+            )
+        elif self.assemblyMode == 'full' and self.pdEngine == 'grid':
+            packing_density_array = calc_packing_density_grid(
+                au_atom_xyz, trimmedAtomList, self.PDT,
+                xyz_surr_exact=trimmedAtomExact,
+                max_kernel_mem=self.maxKernelMem
+            )
+        elif self.assemblyMode == 'full':
+            packing_density_array = calc_packing_density(
+                au_atom_xyz, trimmedAtomList, self.PDT, engine=self.pdEngine,
+                max_kernel_mem=self.maxKernelMem, workers=self.nprocs,
+                xyz_surr_exact=trimmedAtomExact, backend=kernel_backend
+            )
+        elif self.assemblyMode == 'stream':
+            # Each translated unit cell is generated and trimmed, and the
+            # contacts of the asymmetric unit atoms with its atoms are
+            # counted, before the next translated unit cell is generated
+            if self.trimMode == 'distance':
+                trimmedAtomBlocks = iterTrimmedAtoms(
+                    iterTranslatedUnitCells(
+                        ucAtomList, cartesianVectors, keepParams
+                    ), keepParams, auAtomXYZ=au_atom_xyz, pdt=trim_radius
+                )
+            else:
+                trimmedAtomBlocks = iterTrimmedAtoms(
+                    iterTranslatedUnitCells(
+                        ucAtomList, cartesianVectors, keepParams
+                    ), keepParams, keepFracParams, cartesianVectors
+                )
+            packing_density_array = calc_packing_density_stream(
+                au_atom_xyz, trimmedAtomBlocks, self.PDT,
+                engine=self.pdEngine, max_kernel_mem=self.maxKernelMem,
+                workers=self.nprocs, backend=kernel_backend
+            )
+        elif self.assemblyMode == 'pbc':
+            packing_density_array = calc_packing_density_pbc(
+                au_atom_xyz, ucAtomList, cartesianVectors, self.PDT,
+                workers=self.nprocs
+            )
+        elif self.assemblyMode == 'symmetry':
+            packing_density_array = calc_packing_density_symmetry(
+                au_atom_xyz, auAtomFrac, symOps, cartesianVectors, self.PDT,
+                workers=self.nprocs
+            )
+
+        # Saves the packing density values of the processed asymmetric unit
+        # to the cache, then selects the values of the atoms to be considered
+        # for BDamage analysis
+        if self.pdCache is True:
+            if pdCacheHit is False:
+                print('Saving packing density values to %s\n' % cache_file)
+                if not os.path.isdir(cache_directory):
+                    os.makedirs(cache_directory)
+                with open(cache_file, 'wb') as f:
+                    pickle.dump((
+                        packing_density_array, shell_counts, weighted_contacts,
+                        contact_split
+                    ), f)
+            packing_density_array = select_cached_values(
+                bdamAtomList, clean_au_list, packing_density_array
+            )
+            if shell_counts is not None:
+                shell_counts = select_cached_values(
+                    bdamAtomList, clean_au_list, shell_counts
+                )
+            if weighted_contacts is not None:
+                weighted_contacts = select_cached_values(
+                    bdamAtomList, clean_au_list, weighted_contacts
+                )
+            if contact_split is not None:
+                contact_split = select_cached_values(
+                    bdamAtomList, clean_au_list, contact_split
+                )
+            if contact_graph is not None:
+                contact_graph = select_cached_values(
+                    bdamAtomList, clean_au_list, contact_graph
+                )
         write_pckg_dens_to_atoms(bdamAtomList, packing_density_array)
+        if weighted_contacts is not None:
+            write_weighted_contacts_to_atoms(
+                bdamAtomList, self.weightedContacts, weighted_contacts
+            )
+        if contact_split is not None:
+            write_contact_split_to_atoms(bdamAtomList, contact_split)
 
         print('*********** End of Calculate Packing Density Section ***********\n'
               '****************************************************************\n')
@@ -678,6 +1169,18 @@ class run_rabdam(object):
         df.to_pickle(storage_file + '_dataframe.pkl')
         with open(storage_file + '_variables.pkl', 'wb') as f:
             pickle.dump((file_name_start, bdamAtomList, window, resolution), f)
+        if self.contactShells is not None:
+            print('Saving contact shells\n')
+            shell_df = write_contact_shell_dataframe(
+                bdamAtomList, self.contactShells, shell_counts
+            )
+            shell_df.to_pickle(storage_file + '_contact_shells.pkl')
+        if self.contactGraph is True:
+            print('Saving contact graph\n')
+            write_contact_graph(
+                storage_file + '_contact_graph.npz', bdamAtomList,
+                trimmedAtomIDList, contact_graph
+            )
 
         print('****************************************************************\n'
               '*************** End Of Writing DataFrame Section ***************\n')
@@ -710,17 +1213,20 @@ class run_rabdam(object):
                     generate_output_files, write_output_cif
                 )
             from phenix.rabdam.Subroutines.makeDataFrame import makePDB
+            from phenix.rabdam.Subroutines.parsePDB import atom_selection
         else:
             if __name__ == 'Subroutines.CalculateBDamage':
                 from Subroutines.output import (
                     generate_output_files, write_output_cif
                 )
                 from Subroutines.makeDataFrame import makePDB
+                from Subroutines.parsePDB import atom_selection
             else:
                 from rabdam.Subroutines.output import (
                     generate_output_files, write_output_cif
                 )
                 from rabdam.Subroutines.makeDataFrame import makePDB
+                from rabdam.Subroutines.parsePDB import atom_selection
 
         print('**************************** RABDAM ****************************\n')
 
@@ -872,11 +1378,14 @@ class run_rabdam(object):
 
             # Plot kernel density estimate
             print('\nPlotting kernel density estimate')
-            output.gen_kde_plot(self.highlightAtoms)
+            highlightAtoms = atom_selection(
+                self.highlightAtoms
+            ).select_atom_numbers(bdamAtomList)
+            output.gen_kde_plot(highlightAtoms)
 
             # Make summary html file
             print('\nWriting summary html file\n')
-            output.write_html_summary(self.highlightAtoms)
+            output.write_html_summary(highlightAtoms)
 
         print('************** End of Writing Output Files Section *************\n'
               '****************************************************************\n')
@@ -630,10 +630,10 @@ def clean_atom_rec(atoms_list, file_name_start, phenix_import):
     the case where multiple alternate conformers of a particular atom have the
     same occupancy, only that which is first listed in the PDB file is
     retained). Note that the most probable conformer is selected on a per-atom
-    rather than a per-residue basis.
+    rather than a per-residue basis. The atom objects themselves are not
+    copied - the returned list references the retained atoms of atoms_list.
     """
 
-    import copy
     import numpy as np
 
     if phenix_import is True:
@@ -654,7 +654,7 @@ def clean_atom_rec(atoms_list, file_name_start, phenix_import):
         # Extracts non-hydrogen, B-factor > 0 and 0 < occupancy <= 1
         # ATOM/HETATM records
         if atm.element != 'H' and atm.bFactor > 0 and 0 < atm.occupancy <= 1:
-            filtered_atoms_list.append(copy.deepcopy(atm))
+            filtered_atoms_list.append(atm)
 
             # Checks that all macromolecular atoms in single conformers have an
             # occupancy of 1, and that the occupancies of counterpart atoms in
@@ -667,7 +667,7 @@ def clean_atom_rec(atoms_list, file_name_start, phenix_import):
                 atom_ids[atom_id][atm.conformer] = atm.occupancy
 
     # Completes check for alternate conformer occupancies summing to 1
-    discarded_atoms_list = []
+    discarded_atoms_set = set()
     sub_1_occ_asp_glu_list = []
     for atom_id, occupancies in atom_ids.items():
         if sum(occupancies.values()) != 1.0:
@@ -681,10 +681,10 @@ def clean_atom_rec(atoms_list, file_name_start, phenix_import):
         # could be a mix of residue conformer "A" and residue conformer "B"
         conformer_index = np.argmax(list(occupancies.values()))
         conformers = list(occupancies.keys())
-        discarded_atoms_list += [
+        discarded_atoms_set.update(
             '{}_{}'.format(atom_id, conformer) for index, conformer
             in enumerate(conformers) if not index == conformer_index
-        ]
+        )
 
     # Check whether any Asp/Glu residues have been refined with sub-1 occupancy
     sub_1_asp_glu_occ = False
@@ -694,7 +694,7 @@ def clean_atom_rec(atoms_list, file_name_start, phenix_import):
     filtered_atoms_list = [
         atm for atm in filtered_atoms_list if not '_'.join([atm.chainID,
         str(atm.resiNum), atm.resiType, atm.insCode, atm.atomType, atm.conformer])
-        in discarded_atoms_list
+        in discarded_atoms_set
     ]
     if len(filtered_atoms_list) == 0:
         print('\n\nERROR: No atoms retained for BDamage analysis after cleaning'
@@ -727,6 +727,34 @@ def gen_unit_cell(clean_au_file, orig_input):
     return unit_cell_coords, [n for n in range(1, (unit_cell_coords.shape[0] + 1))]
 
 
+def get_symmetry_operators(clean_au_file, orig_input):
+    """
+    Returns the fractional coordinates of the atoms in the asymmetric unit,
+    plus the (rotation matrix, translation vector) pair of every symmetry
+    operator in the space group (in fractional coordinates) - these allow the
+    symmetry images of the asymmetric unit to be generated as and when they
+    are required, rather than expanding the entire unit cell.
+    """
+
+    import numpy as np
+    from iotbx.data_manager import DataManager
+
+    dm = DataManager()
+    model = dm.get_model(clean_au_file)
+    orig_model = dm.get_model(orig_input)
+    model.set_crystal_symmetry(orig_model.crystal_symmetry())
+
+    xray_structure = model.get_xray_structure()
+    au_atom_frac = np.array(xray_structure.sites_frac())
+    sym_ops = []
+    for op in xray_structure.space_group().all_ops():
+        rot = np.array(op.r().as_double()).reshape(3, 3)
+        trans = np.array(op.t().as_double())
+        sym_ops.append((rot, trans))
+
+    return au_atom_frac, sym_ops
+
+
 def check_for_protein(clean_au_file):
     """
     Check that there is at least one protein chain in the asymmetric unit
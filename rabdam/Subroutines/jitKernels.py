@@ -0,0 +1,87 @@
+
+# RABDAM
+# Copyright (C) 2025 Garman Group, University of Oxford
+
+# This file is part of RABDAM.
+
+# RABDAM is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# RABDAM is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General
+# Public License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+# Kernels compiled with numba, an optional dependency of RABDAM. This module
+# is only imported if the JIT kernel backend has been selected. The kernels
+# count contacts with the same distance calculation and comparisons as the
+# blocked numpy kernel, and so return identical packing density values.
+
+import math
+from numba import njit
+
+
+@njit(nogil=True, cache=True)
+def count_contacts_kernel(
+    xyz_au_atom, xyz_surr_atom, lower_thresh, upper_thresh, contacts,
+    band_counts
+):
+    """
+    Counts the number of surrounding atoms whose distance from each
+    asymmetric unit atom is less than lower_thresh (written to contacts), and
+    the number whose distance is at least lower_thresh but less than
+    upper_thresh (written to band_counts). The distance, comparison and count
+    steps are fused, so no temporary arrays are required.
+    """
+
+    for i in range(xyz_au_atom.shape[0]):
+        x = xyz_au_atom[i, 0]
+        y = xyz_au_atom[i, 1]
+        z = xyz_au_atom[i, 2]
+        count = 0
+        band_count = 0
+        for j in range(xyz_surr_atom.shape[0]):
+            dx = xyz_surr_atom[j, 0] - x
+            dy = xyz_surr_atom[j, 1] - y
+            dz = xyz_surr_atom[j, 2] - z
+            distance = math.sqrt(((dx*dx) + (dy*dy)) + (dz*dz))
+            if distance < lower_thresh:
+                count += 1
+            elif distance < upper_thresh:
+                band_count += 1
+        contacts[i] = count
+        band_counts[i] = band_count
+
+
+@njit(nogil=True, cache=True)
+def find_band_pairs_kernel(
+    xyz_au_atom, xyz_surr_atom, au_indices, lower_thresh, upper_thresh,
+    band_offsets, band_surr_indices
+):
+    """
+    Records the indices of the surrounding atoms whose distance from each of
+    the asymmetric unit atoms in au_indices is at least lower_thresh but less
+    than upper_thresh. The indices for the atom au_indices[k] are written to
+    band_surr_indices starting from position band_offsets[k].
+    """
+
+    for k in range(au_indices.shape[0]):
+        i = au_indices[k]
+        x = xyz_au_atom[i, 0]
+        y = xyz_au_atom[i, 1]
+        z = xyz_au_atom[i, 2]
+        pos = band_offsets[k]
+        for j in range(xyz_surr_atom.shape[0]):
+            dx = xyz_surr_atom[j, 0] - x
+            dy = xyz_surr_atom[j, 1] - y
+            dz = xyz_surr_atom[j, 2] - z
+            distance = math.sqrt(((dx*dx) + (dy*dy)) + (dz*dz))
+            if lower_thresh <= distance < upper_thresh:
+                band_surr_indices[pos] = j
+                pos += 1
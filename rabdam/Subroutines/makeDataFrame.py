@@ -25,6 +25,7 @@ def makePDB(header_lines, atomList, footer_lines, newPDBfilename, Bfac):
     atoms in 'atomList', plus header and footer information.
     """
 
+    import itertools
     import numpy as np
 
     exit = False
@@ -35,7 +36,18 @@ def makePDB(header_lines, atomList, footer_lines, newPDBfilename, Bfac):
             line += '\n'
         newPDBfile.write(line)
 
-    for index, atm in enumerate(atomList):
+    # The rows of an atom table are read via iter_rows (rather than by
+    # indexing the table). Each atom is paired with the atom that follows it
+    # in the list, which is used to decide where to insert TER cards.
+    if getattr(atomList, 'columnar', False) is True:
+        atoms, next_atoms = itertools.tee(atomList.iter_rows())
+    else:
+        atoms, next_atoms = itertools.tee(atomList)
+    next(next_atoms, None)
+
+    for index, (atm, next_atm) in enumerate(
+        itertools.zip_longest(atoms, next_atoms)
+    ):
         a = atm.lineID.ljust(6)
         if len(a) != 6:
             exit = True
@@ -101,7 +113,6 @@ def makePDB(header_lines, atomList, footer_lines, newPDBfilename, Bfac):
 
             # Inserts TER cards
             if index != (len(atomList) - 1):
-                next_atm = atomList[index+1]
                 if atm.chainID != next_atm.chainID:
                     if any(_ is True for _ in [atm.protein, atm.na]):
                         if atm.chain_len > 1:
@@ -212,47 +223,35 @@ def writeDataFrame(bdamAtomList):
     import copy
     import pandas as pd
 
-    # Initialises a list for each atom property considered.
-    REC = [None]*len(bdamAtomList)
-    ATMNUM = [None]*len(bdamAtomList)
-    ATMNAME = [None]*len(bdamAtomList)
-    CONFORMER = [None]*len(bdamAtomList)
-    RESNAME = [None]*len(bdamAtomList)
-    CHAIN = [None]*len(bdamAtomList)
-    RESNUM = [None]*len(bdamAtomList)
-    INSCODE = [None]*len(bdamAtomList)
-    XPOS = [None]*len(bdamAtomList)
-    YPOS = [None]*len(bdamAtomList)
-    ZPOS = [None]*len(bdamAtomList)
-    OCC = [None]*len(bdamAtomList)
-    BFAC = [None]*len(bdamAtomList)
-    ELEMENT = [None]*len(bdamAtomList)
-    CHARGE = [None]*len(bdamAtomList)
-    PD = [None]*len(bdamAtomList)
-    AVRG_BF = [None]*len(bdamAtomList)
-    BDAM = [None]*len(bdamAtomList)
-
     # Lists are filled with the relevant values of the properties associated
-    # with each of the atoms considered for BDamage analysis.
-    for index, atm in enumerate(bdamAtomList):
-        REC[index] = atm.lineID
-        ATMNUM[index] = atm.atomNum
-        ATMNAME[index] = atm.origAtomType
-        CONFORMER[index] = atm.conformer
-        RESNAME[index] = atm.origResiType
-        CHAIN[index] = atm.origChainID
-        RESNUM[index] = atm.origResiNum
-        INSCODE[index] = atm.insCode
-        XPOS[index] = atm.xyzCoords[0][0]
-        YPOS[index] = atm.xyzCoords[1][0]
-        ZPOS[index] = atm.xyzCoords[2][0]
-        OCC[index] = atm.occupancy
-        BFAC[index] = atm.bFactor
-        ELEMENT[index] = atm.element
-        CHARGE[index] = atm.charge
-        PD[index] = atm.pd
-        AVRG_BF[index] = atm.avrg_bf
-        BDAM[index] = atm.bd
+    # with each of the atoms considered for BDamage analysis, either from the
+    # columns of an atom table or else from each atom object in turn.
+    if getattr(bdamAtomList, 'columnar', False) is True:
+        get_values = lambda name: getattr(bdamAtomList, name).tolist()
+        xyz = bdamAtomList.xyz
+        XPOS = xyz[:, 0].tolist()
+        YPOS = xyz[:, 1].tolist()
+        ZPOS = xyz[:, 2].tolist()
+    else:
+        get_values = lambda name: [getattr(atm, name) for atm in bdamAtomList]
+        XPOS = [atm.xyzCoords[0][0] for atm in bdamAtomList]
+        YPOS = [atm.xyzCoords[1][0] for atm in bdamAtomList]
+        ZPOS = [atm.xyzCoords[2][0] for atm in bdamAtomList]
+    REC = get_values('lineID')
+    ATMNUM = get_values('atomNum')
+    ATMNAME = get_values('origAtomType')
+    CONFORMER = get_values('conformer')
+    RESNAME = get_values('origResiType')
+    CHAIN = get_values('origChainID')
+    RESNUM = get_values('origResiNum')
+    INSCODE = get_values('insCode')
+    OCC = get_values('occupancy')
+    BFAC = get_values('bFactor')
+    ELEMENT = get_values('element')
+    CHARGE = get_values('charge')
+    PD = get_values('pd')
+    AVRG_BF = get_values('avrg_bf')
+    BDAM = get_values('bd')
 
     # Generates dictionary of DataFrame columns
     df_list_dict = {'REC': REC,
@@ -291,12 +290,74 @@ def writeDataFrame(bdamAtomList):
                     cif_list.append(atm)
             df_list_dict[key] = cif_list
 
+    # If weighted contact numbers have been calculated, they are included as
+    # additional columns (one per weighting function) after the packing
+    # density column.
+    weighted_pd_columns = []
+    if len(bdamAtomList) > 0 and bdamAtomList[0].weighted_pd is not None:
+        for weighting in bdamAtomList[0].weighted_pd:
+            column = 'PD_%s' % weighting.upper()
+            if getattr(bdamAtomList, 'columnar', False) is True:
+                df_list_dict[column] = (
+                    bdamAtomList.weighted_pd[weighting].tolist()
+                )
+            else:
+                df_list_dict[column] = [
+                    atm.weighted_pd[weighting] for atm in bdamAtomList
+                ]
+            weighted_pd_columns.append(column)
+
+    # Likewise, if packing density has been split into intra- and
+    # intermolecular contacts, these are included as additional columns.
+    if len(bdamAtomList) > 0 and bdamAtomList[0].intra_pd is not None:
+        df_list_dict['PD_INTRA'] = get_values('intra_pd')
+        df_list_dict['PD_INTER'] = get_values('inter_pd')
+        weighted_pd_columns += ['PD_INTRA', 'PD_INTER']
+
     # Lists are concatenated into the colummns of a DataFrame.
     df = pd.DataFrame(df_list_dict)
 
     # DataFrame columns are ordered.
     df = df[['REC', 'ATMNUM', 'ATMNAME', 'CONFORMER', 'RESNAME', 'CHAIN',
              'RESNUM', 'INSCODE', 'XPOS', 'YPOS', 'ZPOS', 'OCC', 'BFAC',
-             'ELEMENT', 'CHARGE', 'PD', 'AVRG_BF', 'BDAM']]
+             'ELEMENT', 'CHARGE', 'PD'] + weighted_pd_columns
+            + ['AVRG_BF', 'BDAM']]
 
     return df
+
+
+def write_contact_shell_dataframe(bdamAtomList, shell_radii, shell_counts):
+    """
+    Returns a DataFrame of the packing density of every atom considered for
+    BDamage analysis at each of the contact shell radii. Rows are ordered as
+    in bdamAtomList, and each radius (in Angstroms) is a column.
+    """
+
+    import pandas as pd
+
+    df = pd.DataFrame(shell_counts, columns=list(shell_radii))
+    df.insert(0, 'ATMNUM', [atm.atomNum for atm in bdamAtomList])
+
+    return df
+
+
+def write_contact_graph(
+    contact_graph_file, bdamAtomList, surrAtomIDList, contact_graph
+):
+    """
+    Saves the contact graph calculated by calc_contact_graph to a compressed
+    .npz file, along with the atom numbers of the atoms considered for
+    BDamage analysis (one per row) and the IDs of the surrounding atoms in the
+    trimmed 3x3 unit cell assembly (one per column). The file can be read
+    with scipy.sparse.load_npz.
+    """
+
+    import numpy as np
+
+    np.savez_compressed(
+        contact_graph_file, format=np.array('csr'),
+        shape=np.array(contact_graph.shape), data=contact_graph.data,
+        indices=contact_graph.indices, indptr=contact_graph.indptr,
+        au_atom_num=np.array([atm.atomNum for atm in bdamAtomList]),
+        surr_atom_id=np.asarray(surrAtomIDList, dtype=int)
+    )
@@ -18,6 +18,12 @@
 # Public License along with this program.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+# Maximum number of highlighted atoms labelled individually in the key of the
+# BDamage kernel density plot (beyond this the colour scheme repeats itself,
+# and the key may not fit onto the graph); any further highlighted atoms are
+# marked on the plot under a single label.
+MAX_HIGHLIGHT_LABELS = 6
+
 
 def write_output_cif(atom_list, file_start, bdam):
     """
@@ -83,7 +89,14 @@ def write_output_cif(atom_list, file_start, bdam):
         cif_column_widths['avrg_bf'] = 0
         cif_column_widths['bd'] = 0
 
-    for index, atom in enumerate(atom_list):
+    # The rows of an atom table are read via iter_rows (rather than by
+    # iterating over the table)
+    if getattr(atom_list, 'columnar', False) is True:
+        atoms = atom_list.iter_rows()
+    else:
+        atoms = atom_list
+
+    for index, atom in enumerate(atoms):
         cif_data['lineID'][index] = atom.lineID
         if len(cif_data['lineID'][index]) > cif_column_widths['lineID']:
             cif_column_widths['lineID'] = len(cif_data['lineID'][index])
@@ -567,6 +580,17 @@ class generate_output_files(object):
                       'ELEMENT = ELEMENT SYMBOL\n'
                       'CHARGE = CHARGE ON ATOM\n'
                       'PD = PACKING DENSITY (ATOMIC CONTACT NUMBER)\n')
+        for column in self.df.columns:
+            if column == 'PD_INTRA':
+                newFile.write('PD_INTRA = CONTACTS WITH ATOMS IN THE SAME COPY '
+                              'OF THE ASYMMETRIC UNIT\n')
+            elif column == 'PD_INTER':
+                newFile.write('PD_INTER = CONTACTS WITH ATOMS IN OTHER COPIES '
+                              'OF THE ASYMMETRIC UNIT (CRYSTAL CONTACTS)\n')
+            elif column.startswith('PD_'):
+                newFile.write('%s = %s-WEIGHTED CONTACT NUMBER\n' % (
+                    column, column[3:].replace('_', ' ')
+                ))
         newFile.write('AVRG_BF = AVERAGE B FACTOR FOR ATOMS IN A SIMILAR '
                       'PACKING DENSITY ENVIRONMENT (SLIDING WINDOW SIZE '
                       '= %s)\n' % window)
@@ -580,12 +604,11 @@ class generate_output_files(object):
     def gen_kde_plot(self, highlightAtoms):
         """
         Returns a kernel density estimate of the BDamage values of every atom
-        considered for BDamage analysis. Any atom whose number is listed
-        in the highlightAtoms option in the input file will be marked on the
-        plot. (Note that it is recommended no more than 6 atoms are listed
-        in the highlightAtoms option in the input file (beyond 6 atoms, the
-        colour scheme will repeat itself, and in addition the key may not fit
-        onto the graph).)
+        considered for BDamage analysis. Any atom selected by the
+        highlightAtoms option in the input file (passed in as the list of the
+        selected atom numbers) will be marked on the plot. Only the first
+        MAX_HIGHLIGHT_LABELS selected atoms are labelled individually in the
+        key; any remaining selected atoms are marked under a single label.
         """
 
         import matplotlib.pyplot as plt
@@ -601,16 +624,29 @@ class generate_output_files(object):
         # Plot KDE
         plt.plot(x_values, y_values, color='#212f3d')
 
-        # Marks on the positions of any atoms whose numbers are listed in the
-        # highlightAtoms option specified in the input file.
+        # Marks on the positions of any atoms selected by the highlightAtoms
+        # option specified in the input file.
+        highlight_df = self.df.loc[
+            self.df.ATMNUM.isin([int(number) for number in highlightAtoms]),
+            ['ATMNUM', 'BDAM']
+        ]
         highlighted_atoms = []
-        for number in highlightAtoms:
-            index = self.df.ATMNUM.tolist().index(int(number))
-            b_dam_value = self.df.BDAM.values[index]
+        for number, b_dam_value in zip(
+            highlight_df.ATMNUM.values[:MAX_HIGHLIGHT_LABELS],
+            highlight_df.BDAM.values[:MAX_HIGHLIGHT_LABELS]
+        ):
             line, = plt.plot([b_dam_value, b_dam_value], [0, max(y_values)],
                              linewidth=2, label=' atom ' + str(number) +
                              '\n BDamage = {:.2f}'.format(b_dam_value))
             highlighted_atoms.append(line)
+        num_unlabelled = highlight_df.shape[0] - MAX_HIGHLIGHT_LABELS
+        if num_unlabelled > 0:
+            lines = plt.vlines(
+                highlight_df.BDAM.values[MAX_HIGHLIGHT_LABELS:], 0,
+                max(y_values), colors='#808b96', linewidth=1, alpha=0.5,
+                label=' {} further atoms'.format(num_unlabelled)
+            )
+            highlighted_atoms.append(lines)
 
         if len(highlighted_atoms) >= 1:
             plt.legend(handles=highlighted_atoms)
@@ -18,6 +18,24 @@
 # Public License along with this program.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+# Atom properties that can be used in atom selection expressions, mapped to
+# the corresponding atom attribute, and whether they are numeric. (Atoms are
+# selected via their author, rather than label, atom names, residue names and
+# numbers and chain IDs.)
+SELECTION_PROPERTIES = {
+    'atomnum': ('atomNum', True),
+    'record': ('lineID', False),
+    'name': ('atomType', False),
+    'conformer': ('conformer', False),
+    'resname': ('resiType', False),
+    'chain': ('chainID', False),
+    'resnum': ('resiNum', True),
+    'inscode': ('insCode', False),
+    'element': ('element', False),
+    'occupancy': ('occupancy', True),
+    'bfactor': ('bFactor', True)
+}
+
 
 class atom(object):
     """
@@ -33,7 +51,8 @@ class atom(object):
         occupancy=None, charge=None, orig_resinum=None, orig_resitype=None,
         orig_chainID=None, orig_atomtype=None, pdb_model_num=None,
         packingdensity=None, avrg_bfactor=None, bdamage=None, protein=None,
-        na=None, chain_len=None
+        na=None, chain_len=None, weighted_packingdensity=None,
+        intra_packingdensity=None, inter_packingdensity=None
     ):
         self.lineID = lineidentifier
         self.atomNum = atomnum
@@ -60,6 +79,9 @@ class atom(object):
         self.protein = protein
         self.na = na
         self.chain_len = chain_len
+        self.weighted_pd = weighted_packingdensity
+        self.intra_pd = intra_packingdensity
+        self.inter_pd = inter_packingdensity
 
     def __eq__(self, other):
         """
@@ -93,6 +115,608 @@ class atom(object):
                self.chain_len == other.chain_len
 
 
+class atom_table(object):
+    """
+    A columnar table of the properties of a list of atoms. Each property of
+    the atom class is stored as a single array with one entry per atom
+    (coordinates as an (n, 3) array of floats, atom numbers as integers,
+    B-factors, occupancies and packing density / BDamage values as floats
+    (with NaN in place of None), and all other properties as arrays of
+    (interned) Python objects), rather than as attributes of one object per
+    atom. This requires much less memory than a list of atom objects, and
+    allows calculations over all atoms to be vectorised.
+
+    For code that still works with atom objects, iterating over (or indexing)
+    the table returns lightweight views of each row (atom_table_row) that
+    support the same attributes as an atom object (whilst indexing the table
+    with a slice or an array returns a new atom table of the selected rows),
+    and to_atoms returns a list of atom objects. Code that reads every row in turn (e.g. to write
+    the atoms to file) should instead use iter_rows, which converts each
+    column in bulk rather than reading every value via atom_table_row.
+    """
+
+    columnar = True
+
+    int_fields = ['atomNum']
+    float_fields = [
+        'occupancy', 'bFactor', 'pd', 'avrg_bf', 'bd', 'intra_pd', 'inter_pd'
+    ]
+    object_fields = [
+        'lineID', 'atomType', 'conformer', 'resiType', 'chainID',
+        'entity_id', 'resiNum', 'insCode', 'element', 'charge', 'origResiNum',
+        'origResiType', 'origChainID', 'origAtomType', 'pdb_model_num',
+        'protein', 'na', 'chain_len'
+    ]
+
+    def __init__(self, columns, xyz, weighted_pd=None):
+        import numpy as np
+
+        for name, values in columns.items():
+            setattr(self, name, values)
+        self.xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        self.weighted_pd = weighted_pd
+
+    @classmethod
+    def from_atoms(cls, atomList):
+        """
+        Creates an atom table from a list of atom objects.
+        """
+
+        import sys
+        import numpy as np
+
+        columns = {}
+        for name in cls.int_fields:
+            columns[name] = np.array(
+                [getattr(atm, name) for atm in atomList], dtype=np.int64
+            )
+        for name in cls.float_fields:
+            columns[name] = np.array(
+                [np.nan if getattr(atm, name) is None else getattr(atm, name)
+                 for atm in atomList], dtype=np.float64
+            )
+        for name in cls.object_fields:
+            values = np.empty(len(atomList), dtype=object)
+            values[:] = [
+                sys.intern(getattr(atm, name))
+                if type(getattr(atm, name)) == str else getattr(atm, name)
+                for atm in atomList
+            ]
+            columns[name] = values
+
+        xyz = np.array([
+            [atm.xyzCoords[0][0], atm.xyzCoords[1][0], atm.xyzCoords[2][0]]
+            for atm in atomList
+        ], dtype=np.float64)
+
+        weighted_pd = None
+        if len(atomList) > 0 and atomList[0].weighted_pd is not None:
+            weighted_pd = {
+                weighting: np.array(
+                    [atm.weighted_pd[weighting] for atm in atomList]
+                ) for weighting in atomList[0].weighted_pd
+            }
+
+        return cls(columns, xyz, weighted_pd)
+
+    def __len__(self):
+        return self.atomNum.shape[0]
+
+    def __getitem__(self, index):
+        import numbers
+        import numpy as np
+
+        if isinstance(index, numbers.Integral):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError('atom_table index out of range')
+            return atom_table_row(self, int(index))
+
+        if isinstance(index, slice):
+            return self.take(index)
+        if isinstance(index, (list, tuple, np.ndarray)):
+            index = np.asarray(index)
+            if index.size == 0:
+                index = index.astype(np.int64)
+            if index.ndim != 1 or not index.dtype.kind in ['b', 'i', 'u']:
+                raise TypeError(
+                    'atom_table can only be indexed with a 1D array of '
+                    'integers or booleans'
+                )
+            return self.take(index)
+
+        raise TypeError(
+            'atom_table indices must be integers, slices or arrays, not '
+            '{}'.format(type(index).__name__)
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield atom_table_row(self, index)
+
+    def take(self, index):
+        """
+        Returns a new atom table of the rows selected by index (a slice, or
+        an array of integer indices or a boolean mask). As for numpy arrays,
+        the columns of a table selected by a slice are views of the columns
+        of this table, whilst those selected by an array are copies.
+        """
+
+        columns = {
+            name: getattr(self, name)[index] for name in (
+                self.int_fields + self.float_fields + self.object_fields
+            )
+        }
+        weighted_pd = None
+        if self.weighted_pd is not None:
+            weighted_pd = {
+                weighting: values[index]
+                for weighting, values in self.weighted_pd.items()
+            }
+
+        return atom_table(columns, self.xyz[index], weighted_pd)
+
+    def get_value(self, name, index):
+        """
+        Returns the value of the named property of a single atom, in the
+        form in which it is stored by an atom object.
+        """
+
+        import math
+
+        if name == 'xyzCoords':
+            return [[float(self.xyz[index][i])] for i in range(3)]
+        elif name == 'weighted_pd':
+            if self.weighted_pd is None:
+                return None
+            return {weighting: values[index]
+                    for weighting, values in self.weighted_pd.items()}
+        elif name in self.int_fields:
+            return int(getattr(self, name)[index])
+        elif name in self.float_fields:
+            value = float(getattr(self, name)[index])
+            if math.isnan(value):
+                return None
+            return value
+        elif name in self.object_fields:
+            return getattr(self, name)[index]
+        else:
+            raise AttributeError(
+                'atom_table has no atom property {}'.format(name)
+            )
+
+    def set_value(self, name, index, value):
+        """
+        Sets the value of the named property of a single atom.
+        """
+
+        import numpy as np
+
+        if name == 'xyzCoords':
+            self.xyz[index] = [value[0][0], value[1][0], value[2][0]]
+        elif name == 'weighted_pd':
+            if self.weighted_pd is None:
+                self.weighted_pd = {
+                    weighting: np.full(len(self), np.nan) for weighting in value
+                }
+            for weighting, weighted_value in value.items():
+                self.weighted_pd[weighting][index] = weighted_value
+        elif name in self.float_fields:
+            getattr(self, name)[index] = np.nan if value is None else value
+        else:
+            getattr(self, name)[index] = value
+
+    def iter_rows(self):
+        """
+        Yields each row of the table as a (read-only) named tuple with the
+        same attributes as an atom object. The values of each column are
+        converted to the form in which they are stored by an atom object in a
+        single pass over the column.
+        """
+
+        import collections
+        import itertools
+
+        names = self.int_fields + self.float_fields + self.object_fields
+        atom_row = collections.namedtuple(
+            'atom_row', names + ['xyzCoords', 'weighted_pd']
+        )
+
+        columns = []
+        for name in names:
+            values = getattr(self, name).tolist()
+            if name in self.float_fields:
+                values = [None if value != value else value for value in values]
+            columns.append(values)
+        columns.append(
+            [[x], [y], [z]] for x, y, z in self.xyz.tolist()
+        )
+        if self.weighted_pd is None:
+            columns.append(itertools.repeat(None))
+        else:
+            weightings = list(self.weighted_pd.keys())
+            columns.append(
+                dict(zip(weightings, values)) for values in zip(*[
+                    self.weighted_pd[weighting].tolist()
+                    for weighting in weightings
+                ])
+            )
+
+        for values in zip(*columns):
+            yield atom_row._make(values)
+
+    def to_atoms(self):
+        """
+        Returns a list of atom objects with the properties stored in the
+        table.
+        """
+
+        atomList = [atom() for index in range(len(self))]
+        for name in (
+            self.int_fields + self.float_fields + self.object_fields
+            + ['xyzCoords', 'weighted_pd']
+        ):
+            for index, atm in enumerate(atomList):
+                setattr(atm, name, self.get_value(name, index))
+
+        return atomList
+
+
+class atom_table_row(object):
+    """
+    A view of a single row of an atom_table, whose attributes are read from
+    (and written to) the columns of the table, so that it can be used in
+    place of an atom object.
+    """
+
+    __slots__ = ['_table', '_index']
+
+    def __init__(self, table, index):
+        object.__setattr__(self, '_table', table)
+        object.__setattr__(self, '_index', index)
+
+    def __getattr__(self, name):
+        return self._table.get_value(name, self._index)
+
+    def __setattr__(self, name, value):
+        self._table.set_value(name, self._index, value)
+
+
+def is_selection_expression(item):
+    """
+    Returns True if an item listed in the addAtoms, removeAtoms or
+    highlightAtoms option is an atom selection expression (rather than an
+    atom number, atom number range or residue name). Atom numbers and ranges
+    written with spaces (e.g. '1 - 5') are not expressions.
+    """
+
+    import re
+
+    if re.match(r'^[0-9]+(-[0-9]+)?$', ''.join(item.split())):
+        return False
+
+    return len(item.split()) > 1 or any(char in item for char in '()<>=!')
+
+
+def compile_selection_expression(expression):
+    """
+    Compiles an atom selection expression, e.g. 'chain A and resname GLU and
+    name OE1 OE2' or 'bfactor > 80', into a function that returns a boolean
+    mask of the atoms that match the expression. This function is passed a
+    function get_column, which returns an array of the values of the named
+    property (a key of SELECTION_PROPERTIES) of every atom.
+
+    Expressions are built from terms of the form '<property> <value> [<value>
+    ...]' (matching atoms whose property is equal to any of the values listed)
+    or '<property> <comparison> <number>' (numeric properties only), which are
+    combined via 'and', 'or', 'not' and parentheses. Property names and
+    'and' / 'or' / 'not' are case-insensitive, values are not. Raises a
+    ValueError if the expression cannot be compiled.
+    """
+
+    import operator
+    import re
+    import numpy as np
+
+    comparisons = {'<': operator.lt, '<=': operator.le, '>': operator.gt,
+                   '>=': operator.ge, '==': operator.eq, '!=': operator.ne}
+    keywords = ['and', 'or', 'not', '(', ')']
+
+    tokens = re.findall(r'<=|>=|==|!=|<|>|\(|\)|[^\s()<>=!]+', expression)
+    if ''.join(tokens) != ''.join(expression.split()):
+        raise ValueError(
+            'Unrecognised character in atom selection {}'.format(expression)
+        )
+    position = [0]
+
+    def peek():
+        if position[0] < len(tokens):
+            return tokens[position[0]]
+        else:
+            return None
+
+    def next_token():
+        token = peek()
+        if token is None:
+            raise ValueError(
+                'Atom selection {} ends unexpectedly'.format(expression)
+            )
+        position[0] += 1
+        return token
+
+    def parse_or():
+        terms = [parse_and()]
+        while peek() is not None and peek().lower() == 'or':
+            next_token()
+            terms.append(parse_and())
+        if len(terms) == 1:
+            return terms[0]
+
+        def select(get_column):
+            mask = terms[0](get_column)
+            for term in terms[1:]:
+                mask = mask | term(get_column)
+            return mask
+        return select
+
+    def parse_and():
+        terms = [parse_not()]
+        while peek() is not None and peek().lower() == 'and':
+            next_token()
+            terms.append(parse_not())
+        if len(terms) == 1:
+            return terms[0]
+
+        def select(get_column):
+            mask = terms[0](get_column)
+            for term in terms[1:]:
+                mask = mask & term(get_column)
+            return mask
+        return select
+
+    def parse_not():
+        if peek() is not None and peek().lower() == 'not':
+            next_token()
+            term = parse_not()
+            return lambda get_column: ~term(get_column)
+        return parse_term()
+
+    def parse_term():
+        token = next_token()
+        if token == '(':
+            term = parse_or()
+            if next_token() != ')':
+                raise ValueError(
+                    'Unmatched "(" in atom selection {}'.format(expression)
+                )
+            return term
+
+        prop = token.lower()
+        if not prop in SELECTION_PROPERTIES:
+            raise ValueError(
+                'Unrecognised atom property {} in atom selection {} - please '
+                'select from: {}'.format(
+                    token, expression, list(SELECTION_PROPERTIES.keys())
+                )
+            )
+        numeric = SELECTION_PROPERTIES[prop][1]
+
+        if peek() in comparisons:
+            comparison = comparisons[next_token()]
+            value = next_token()
+            try:
+                if numeric is False:
+                    raise ValueError
+                value = float(value)
+            except ValueError:
+                raise ValueError(
+                    'Unrecognised comparison {} {} in atom selection {} - '
+                    'comparisons require a numeric atom property and '
+                    'value'.format(token, value, expression)
+                )
+            return lambda get_column: comparison(get_column(prop), value)
+
+        values = []
+        while (
+                peek() is not None and peek().lower() not in keywords
+            and peek() not in comparisons
+        ):
+            values.append(next_token())
+        if len(values) == 0:
+            raise ValueError(
+                'No values listed for atom property {} in atom selection '
+                '{}'.format(token, expression)
+            )
+        if numeric is True:
+            try:
+                values = [float(value) for value in values]
+            except ValueError:
+                raise ValueError(
+                    'Unrecognised value for numeric atom property {} in atom '
+                    'selection {}'.format(token, expression)
+                )
+        return lambda get_column: np.isin(get_column(prop), values)
+
+    select = parse_or()
+    if peek() is not None:
+        raise ValueError(
+            'Unexpected {} in atom selection {}'.format(peek(), expression)
+        )
+
+    return select
+
+
+class atom_selection(object):
+    """
+    The atoms listed in the addAtoms, removeAtoms or highlightAtoms option,
+    via their atom numbers (individually or as a range, e.g. '7-9'), their
+    residue names, or atom selection expressions (see
+    compile_selection_expression). Atom number ranges are stored as a sorted
+    array of non-overlapping intervals rather than being expanded into
+    individual atom numbers, residue names are stored as a set, and
+    expressions are compiled once, so that selecting atoms requires only a
+    few array operations over the atom properties.
+    """
+
+    def __init__(self, items=[]):
+        import numpy as np
+
+        self.items = []
+        intervals = []
+        resiTypes = set()
+        self.expressions = []
+        for item in items:
+            item = str(item).strip()
+            if is_selection_expression(item):
+                self.items.append(item)
+                self.expressions.append(compile_selection_expression(item))
+                continue
+            item = ''.join(item.split())
+            self.items.append(item)
+            num_range = item.split('-')
+            try:
+                if len(num_range) == 2:
+                    intervals.append((int(num_range[0]), int(num_range[1])))
+                elif len(num_range) == 1:
+                    try:
+                        intervals.append((int(item), int(item)))
+                    except ValueError:
+                        resiTypes.add(item)
+                else:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(
+                    'Unrecognised atom selection: {} - if selection contains '
+                    '"-", expecting a numeric range'.format(item)
+                )
+
+        # Merges overlapping and adjacent atom number ranges (ranges whose
+        # maximum is less than their minimum do not select any atoms)
+        merged_intervals = []
+        for start, end in sorted(x for x in intervals if x[0] <= x[1]):
+            if len(merged_intervals) > 0 and start <= merged_intervals[-1][1] + 1:
+                merged_intervals[-1][1] = max(merged_intervals[-1][1], end)
+            else:
+                merged_intervals.append([start, end])
+        merged_intervals = np.array(merged_intervals, dtype=np.int64).reshape(-1, 2)
+
+        self.starts = merged_intervals[:, 0]
+        self.ends = merged_intervals[:, 1]
+        self.resiTypes = frozenset(resiTypes)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __str__(self):
+        return ', '.join(self.items)
+
+    def contains_atom_numbers(self, atom_nums):
+        """
+        Returns a boolean mask of the atom numbers (an array) that lie within
+        one of the selected atom number ranges, found via a binary search of
+        the sorted interval starts.
+        """
+
+        import numpy as np
+
+        atom_nums = np.asarray(atom_nums, dtype=np.int64)
+        interval_index = np.searchsorted(self.starts, atom_nums, side='right') - 1
+        mask = interval_index >= 0
+        mask[mask] = atom_nums[mask] <= self.ends[interval_index[mask]]
+
+        return mask
+
+    def select(self, get_column):
+        """
+        Returns a boolean mask of the atoms that are included in the
+        selection. get_column is a function that returns an array of the
+        values of the named property (a key of SELECTION_PROPERTIES) of every
+        atom.
+        """
+
+        import numpy as np
+
+        mask = self.contains_atom_numbers(get_column('atomnum'))
+        if len(self.resiTypes) > 0:
+            mask |= np.isin(get_column('resname'), list(self.resiTypes))
+        for expression in self.expressions:
+            mask |= expression(get_column)
+
+        return mask
+
+    def select_atoms(self, atomList, columns=None):
+        """
+        Returns a boolean mask of the atoms in atomList (a list of atom
+        objects or an atom_table) that are included in the selection. The
+        atom properties are converted into arrays once, and stored in
+        columns (which can be shared between selections over the same
+        atoms).
+        """
+
+        if columns is None:
+            columns = {}
+
+        def get_column(prop):
+            if not prop in columns:
+                attribute, numeric = SELECTION_PROPERTIES[prop]
+                if getattr(atomList, 'columnar', False) is True:
+                    values = getattr(atomList, attribute)
+                else:
+                    values = [getattr(atm, attribute) for atm in atomList]
+                columns[prop] = convert_selection_column(values, numeric)
+            return columns[prop]
+
+        return self.select(get_column)
+
+    def select_atom_numbers(self, atomList):
+        """
+        Returns the atom numbers of the atoms in atomList (a list of atom
+        objects or an atom_table) that are included in the selection.
+        """
+
+        import numpy as np
+
+        if getattr(atomList, 'columnar', False) is True:
+            atom_nums = atomList.atomNum
+        else:
+            atom_nums = np.array(
+                [atm.atomNum for atm in atomList], dtype=np.int64
+            )
+
+        return atom_nums[self.select_atoms(atomList)].tolist()
+
+
+def convert_selection_column(values, numeric):
+    """
+    Converts the values of an atom property into an array of floats (with NaN
+    in place of missing values) if the property is numeric, else into an
+    array of strings.
+    """
+
+    import numpy as np
+
+    if isinstance(values, np.ndarray) and values.dtype.kind in ['i', 'u', 'f']:
+        return values.astype(np.float64)
+
+    values = np.asarray(values, dtype=object)
+    if numeric is True:
+        try:
+            values = values.astype(np.float64)
+        except (TypeError, ValueError):
+            float_values = np.full(values.shape[0], np.nan)
+            for index, value in enumerate(values):
+                try:
+                    float_values[index] = float(value)
+                except (TypeError, ValueError):
+                    pass
+            values = float_values
+    else:
+        values = values.astype(str)
+
+    return values
+
+
 def download_mmcif(PDBcode, pathToCIF):
     """
     Downloads and saves mmCif file from the RSCB PDB website.
@@ -150,52 +774,59 @@ def copy_input(pathToInput, disk, newPathToInput, PDBdirectory):
 
 def b_damage_atom_list(clean_au_list, HETATM, protOrNA, addAtoms, removeAtoms):
     """
-    Filters a copy of the clean_au_list to retain only the subset of atoms
-    to be included in the BDamage calculation, as specified by the 'HETATM',
-    'proteinOrNucleicAcid', 'addAtoms'  and 'removeAtoms' argument values set
-    in the input file.
+    Selects the subset of atoms in clean_au_list to be included in the
+    BDamage calculation, as specified by the 'HETATM', 'proteinOrNucleicAcid',
+    'addAtoms'  and 'removeAtoms' argument values set in the input file. The
+    atoms are selected with a boolean mask over clean_au_list rather than by
+    copying the list, hence the returned atom objects are shared with
+    clean_au_list.
     """
 
-    import copy
-
-    bdam_list_unfiltered = copy.deepcopy(clean_au_list) + [None]*len(clean_au_list)
-
-    for index, atm in enumerate(clean_au_list):
-        # Removes hetatm not in macromolecule if HETATM set to 'Remove' in
-        # input file.
-        if atm.protein is False and atm.na is False:
-            if HETATM is False:
-                bdam_list_unfiltered[index] = None
-
-        # Removes nucleic acid atoms if proteinOrNucleicAcid set to
-        # 'Protein' in input file.
-        if protOrNA == 'protein':
-            if atm.protein is False and atm.na is True:
-                bdam_list_unfiltered[index] = None
-        # Removes protein atoms if proteinOrNucleicAcid set to
-        # 'Nucleic Acid' / 'NA' in input file.
-        elif protOrNA in ['nucleicacid', 'na']:
-            if atm.na is False and atm.protein is True:
-                bdam_list_unfiltered[index] = None
-        # Otherwise keeps all protein and NA atoms
-        elif protOrNA == 'proteinna':
-            pass
-
-        # Removes atoms whose number is in removeAtoms list.
-        if str(atm.atomNum) in removeAtoms:
-            bdam_list_unfiltered[index] = None
-        # Removes atoms whose residue type is in removeAtoms list.
-        elif atm.resiType in removeAtoms:
-            bdam_list_unfiltered[index] = None
-
-        # Adds atoms whose number is in addAtoms list.
-        if str(atm.atomNum) in addAtoms:
-            bdam_list_unfiltered[len(clean_au_list)+index] = copy.deepcopy(atm)
-        # Adds atoms whose residue type is in addAtoms list.
-        elif atm.resiType in addAtoms:
-            bdam_list_unfiltered[len(clean_au_list)+index] = copy.deepcopy(atm)
-
-    bdam_list_filtered = filter(None, bdam_list_unfiltered)
+    import numpy as np
+
+    if not isinstance(addAtoms, atom_selection):
+        addAtoms = atom_selection(addAtoms)
+    if not isinstance(removeAtoms, atom_selection):
+        removeAtoms = atom_selection(removeAtoms)
+
+    not_protein = np.array(
+        [atm.protein is False for atm in clean_au_list], dtype=bool
+    )
+    is_protein = np.array(
+        [atm.protein is True for atm in clean_au_list], dtype=bool
+    )
+    not_na = np.array([atm.na is False for atm in clean_au_list], dtype=bool)
+    is_na = np.array([atm.na is True for atm in clean_au_list], dtype=bool)
+    keep = np.ones(len(clean_au_list), dtype=bool)
+
+    # Removes hetatm not in macromolecule if HETATM set to 'Remove' in
+    # input file.
+    if HETATM is False:
+        keep[not_protein & not_na] = False
+
+    # Removes nucleic acid atoms if proteinOrNucleicAcid set to
+    # 'Protein' in input file.
+    if protOrNA == 'protein':
+        keep[not_protein & is_na] = False
+    # Removes protein atoms if proteinOrNucleicAcid set to
+    # 'Nucleic Acid' / 'NA' in input file.
+    elif protOrNA in ['nucleicacid', 'na']:
+        keep[not_na & is_protein] = False
+    # Otherwise keeps all protein and NA atoms
+    elif protOrNA == 'proteinna':
+        pass
+
+    # Removes atoms selected by the removeAtoms list (via their number,
+    # residue type or an atom selection expression), then adds atoms selected
+    # by the addAtoms list. The atom property arrays are shared between the
+    # two selections.
+    columns = {}
+    keep[removeAtoms.select_atoms(clean_au_list, columns)] = False
+    keep[addAtoms.select_atoms(clean_au_list, columns)] = True
+
+    bdam_list_filtered = [
+        atm for index, atm in enumerate(clean_au_list) if keep[index]
+    ]
     bdam_list_filtered = sorted(bdam_list_filtered, key=lambda x: x.atomNum)
 
     # Filters list of atoms for BDamage analysis to remove multiple copies
@@ -116,22 +116,221 @@ def translateUnitCell(ucAtomList, transAtomList, transAtomIDList,
     transVector = np.array([aVec, bVec, cVec])
     transVector = np.sum(transVector, axis=0)
 
-    # Each atom in the unit cell is translated as described by the translation
-    # matrix, and its new xyz coordinates stored in a list of all atoms in
-    # the 3x3 assembly.
-    for coords in ucAtomList:
-        coords = np.array([[coords[0]],
-                           [coords[1]],
-                           [coords[2]]])
-        new_atom_xyz = np.add(coords, transVector)
-        transAtomList[atom_count][0] = new_atom_xyz[0][0]
-        transAtomList[atom_count][1] = new_atom_xyz[1][0]
-        transAtomList[atom_count][2] = new_atom_xyz[2][0]
-        transAtomIDList[atom_count] = atom_count
-        atom_count += 1
+    # Every atom in the unit cell is translated as described by the
+    # translation vector (in a single array operation), and its new xyz
+    # coordinates stored in the array of all atoms in the 3x3 assembly.
+    num_uc_atoms = len(ucAtomList)
+    transAtomList[atom_count:atom_count+num_uc_atoms] = np.add(
+        ucAtomList, transVector.reshape(1, 3)
+    )
+    transAtomIDList[atom_count:atom_count+num_uc_atoms] = list(
+        range(atom_count, atom_count+num_uc_atoms)
+    )
+    atom_count += num_uc_atoms
 
     print('Successfully translated by (%2sa,%2sb,%2sc) unit cells' % (
         aTrans, bTrans, cTrans
         ))
 
     return transAtomList, transAtomIDList, atom_count
+
+
+def calcAssemblyTranslations(
+    ucAtomList, cartesianVectors, dtype=None, keepParams=None
+):
+    """
+    Calculates the 27 translation vectors required to translate the unit
+    cell +/- 1 units in all dimensions (a, b and c), looping over a, b and c
+    translations of -1, 0 and +1 in turn, using the same arithmetic as
+    translateUnitCell. Returns the indices of the translations to be
+    performed (all 27, unless the boundaries of the trimmed atoms box,
+    keepParams, are provided, in which case translated unit cells whose
+    bounding box does not intersect the trimmed atoms box are skipped),
+    plus the array of all 27 translation vectors.
+    """
+
+    import numpy as np
+
+    if dtype is None:
+        dtype = np.float64
+    ucAtomList = np.asarray(ucAtomList, dtype=np.float64)
+
+    cell_shifts = np.array(
+        [[a, b, c] for a in range(-1, 2) for b in range(-1, 2)
+         for c in range(-1, 2)]
+    )
+    aVec = np.multiply(cell_shifts[:, 0:1], cartesianVectors[0].reshape(1, 3))
+    bVec = np.multiply(cell_shifts[:, 1:2], cartesianVectors[1].reshape(1, 3))
+    cVec = np.multiply(cell_shifts[:, 2:3], cartesianVectors[2].reshape(1, 3))
+    transVectors = np.sum(np.array([aVec, bVec, cVec]), axis=0)
+
+    # Identifies the translated unit cells that can contain atoms within the
+    # trimmed atoms box. The bounding box of each translated cell is
+    # calculated (and rounded to dtype) in the same way as the coordinates
+    # of its atoms, so no atom that would be retained by trimAtoms lies in a
+    # cell that is skipped.
+    translations = np.arange(27)
+    if keepParams is not None and ucAtomList.shape[0] > 0:
+        cell_min = np.add(
+            ucAtomList.min(axis=0)[np.newaxis, :], transVectors
+        ).astype(dtype)
+        cell_max = np.add(
+            ucAtomList.max(axis=0)[np.newaxis, :], transVectors
+        ).astype(dtype)
+        box_min = np.array(keepParams[0::2], dtype=np.float64)
+        box_max = np.array(keepParams[1::2], dtype=np.float64)
+        overlap = np.all(
+            (cell_min <= box_max) & (cell_max >= box_min), axis=1
+        )
+        translations = translations[overlap]
+
+    if translations.shape[0] == 27:
+        print('Translating unit cell by -/+ 1 unit cells in a, b and c')
+    else:
+        print('Translating unit cell by -/+ 1 unit cells in a, b and c\n'
+              '--> %d of 27 translated unit cells lie within the trimmed atoms '
+              'box' % translations.shape[0])
+
+    return translations, transVectors
+
+
+def translateUnitCellAssembly(
+    ucAtomList, cartesianVectors, dtype=None, keepParams=None
+):
+    """
+    Translates the unit cell +/- 1 units in all dimensions (a, b and c) to
+    generate a 3x3 assembly, in a single broadcasted array operation rather
+    than one translation at a time. Returns the same atom coordinate array
+    and atom IDs as 27 successive calls of translateUnitCell (looping over
+    a, b and c translations of -1, 0 and +1 in turn), with the coordinates
+    stored in the specified dtype (default = double precision). If the
+    boundaries of the trimmed atoms box (keepParams) are provided, translated
+    unit cells whose bounding box does not intersect the trimmed atoms box
+    are skipped (the IDs of the atoms in the remaining cells are unchanged).
+    """
+
+    import numpy as np
+
+    if dtype is None:
+        dtype = np.float64
+    ucAtomList = np.asarray(ucAtomList, dtype=np.float64)
+    num_uc_atoms = ucAtomList.shape[0]
+
+    translations, transVectors = calcAssemblyTranslations(
+        ucAtomList, cartesianVectors, dtype, keepParams
+    )
+
+    # Broadcasts the unit cell atoms against the translation vectors to
+    # generate the (num_translations, num_uc_atoms, 3) assembly in a single
+    # operation
+    num_trans = translations.shape[0]
+    transAtomList = np.empty([num_trans, num_uc_atoms, 3], dtype=dtype)
+    np.add(
+        ucAtomList[np.newaxis, :, :], transVectors[translations, np.newaxis, :],
+        out=transAtomList, casting='same_kind'
+    )
+    transAtomList = transAtomList.reshape(num_trans*num_uc_atoms, 3)
+    transAtomIDList = (
+        (translations[:, np.newaxis]*num_uc_atoms) + np.arange(num_uc_atoms)
+    ).reshape(-1)
+
+    print('Successfully translated unit cell')
+
+    return transAtomList, transAtomIDList
+
+
+def iterTranslatedUnitCells(ucAtomList, cartesianVectors, keepParams=None):
+    """
+    Generates the 3x3 unit cell assembly one translated unit cell at a time,
+    so that only a single translated unit cell need be stored in memory.
+    Yields the (double precision) coordinates and IDs of the atoms in each
+    translated unit cell in turn; concatenated, these are identical to the
+    arrays returned by translateUnitCellAssembly.
+    """
+
+    import numpy as np
+
+    ucAtomList = np.asarray(ucAtomList, dtype=np.float64)
+    num_uc_atoms = ucAtomList.shape[0]
+
+    translations, transVectors = calcAssemblyTranslations(
+        ucAtomList, cartesianVectors, np.float64, keepParams
+    )
+    for trans in translations:
+        transAtomList = np.add(ucAtomList, transVectors[trans:trans+1, :])
+        transAtomIDList = (trans*num_uc_atoms) + np.arange(num_uc_atoms)
+        yield transAtomList, transAtomIDList
+
+
+class translated_atom_coords(object):
+    """
+    Provides the (double precision) coordinates of atoms in the 3x3 unit
+    cell assembly, calculated from their IDs as and when they are required
+    rather than being stored. Indexing returns the coordinates of the
+    corresponding atoms in the atom ID list, calculated using the same
+    arithmetic as translateUnitCell.
+    """
+
+    def __init__(self, ucAtomList, atomIDList, cartesianVectors):
+        import numpy as np
+
+        self.ucAtomList = np.asarray(ucAtomList, dtype=np.float64)
+        self.atomIDList = np.asarray(atomIDList, dtype=int)
+        self.cartesianVectors = cartesianVectors
+
+    def __len__(self):
+        return self.atomIDList.shape[0]
+
+    def __getitem__(self, indices):
+        import numpy as np
+
+        # Atom IDs are assigned sequentially as the unit cell is translated
+        # by a, b and c (looping over -1, 0 and +1 in turn)
+        atom_ids = np.atleast_1d(self.atomIDList[indices])
+        num_uc_atoms = self.ucAtomList.shape[0]
+        uc_indices = atom_ids % num_uc_atoms
+        trans_indices = atom_ids // num_uc_atoms
+        aTrans = ((trans_indices // 9) - 1).reshape(-1, 1)
+        bTrans = (((trans_indices // 3) % 3) - 1).reshape(-1, 1)
+        cTrans = ((trans_indices % 3) - 1).reshape(-1, 1)
+
+        aVec = np.multiply(aTrans, self.cartesianVectors[0].reshape(1, 3))
+        bVec = np.multiply(bTrans, self.cartesianVectors[1].reshape(1, 3))
+        cVec = np.multiply(cTrans, self.cartesianVectors[2].reshape(1, 3))
+        transVector = np.sum(np.array([aVec, bVec, cVec]), axis=0)
+
+        coords = np.add(self.ucAtomList[uc_indices], transVector)
+        if np.ndim(self.atomIDList[indices]) == 0:
+            coords = coords[0]
+
+        return coords
+
+
+def identify_au_copy_atoms(ucAtomList, auAtomXYZ, atomIDList, tol=1e-3):
+    """
+    Determines (as a boolean array) which of the atoms in the atom ID list
+    belong to the copy of the asymmetric unit from which the unit cell was
+    generated, i.e. atoms in the untranslated unit cell whose coordinates
+    match (to within tol Angstroms) those of an atom in auAtomXYZ. All other
+    atoms belong to symmetry-related or lattice-translated copies of the
+    asymmetric unit.
+    """
+
+    import numpy as np
+    from scipy.spatial import cKDTree
+
+    ucAtomList = np.asarray(ucAtomList, dtype=np.float64)
+    atomIDList = np.asarray(atomIDList, dtype=int)
+    num_uc_atoms = ucAtomList.shape[0]
+    if num_uc_atoms == 0 or len(auAtomXYZ) == 0:
+        return np.zeros(atomIDList.shape[0], dtype=bool)
+
+    distances = cKDTree(auAtomXYZ).query(
+        ucAtomList, k=1, distance_upper_bound=tol
+    )[0]
+    uc_in_au = distances <= tol
+
+    # Atom IDs are assigned sequentially as the unit cell is translated by a,
+    # b and c (looping over -1, 0 and +1 in turn), so the untranslated unit
+    # cell is the 14th (index 13) of the 27 translations
+    return (atomIDList // num_uc_atoms == 13) & uc_in_au[atomIDList % num_uc_atoms]
@@ -23,40 +23,27 @@ def getAUparams(atomList):
     """
     Determines the min. and max. values of the x, y and z coordinates in the
     asymmetric unit. (These are required later when calculating the size
-    of the trimmed atoms box.)
-    """
-
-    # Initialises x, y and z minima and maxima using values from first atom in
-    # atomList.
-    xMin = atomList[0].xyzCoords[0][0]
-    xMax = atomList[0].xyzCoords[0][0]
-    yMin = atomList[0].xyzCoords[1][0]
-    yMax = atomList[0].xyzCoords[1][0]
-    zMin = atomList[0].xyzCoords[2][0]
-    zMax = atomList[0].xyzCoords[2][0]
-
-    # Updates x, y and z minima and maxima as loop through atomList
-    for atm in atomList:
-        x = atm.xyzCoords[0][0]
-        y = atm.xyzCoords[1][0]
-        z = atm.xyzCoords[2][0]
-
-        if x < xMin:
-            xMin = x
-        elif x > xMax:
-            xMax = x
-
-        if y < yMin:
-            yMin = y
-        elif y > yMax:
-            yMax = y
-
-        if z < zMin:
-            zMin = z
-        elif z > zMax:
-            zMax = z
-
-    auParams = [xMin, xMax, yMin, yMax, zMin, zMax]
+    of the trimmed atoms box.) atomList can be either a list of atom objects
+    or an array of their xyz coordinates.
+    """
+
+    import numpy as np
+
+    if isinstance(atomList, np.ndarray):
+        atomXYZ = atomList
+    else:
+        atomXYZ = np.array([[atm.xyzCoords[0][0],
+                             atm.xyzCoords[1][0],
+                             atm.xyzCoords[2][0]] for atm in atomList])
+
+    # Calculates the x, y and z minima and maxima via reductions over the
+    # columns of the coordinate array.
+    xyzMin = atomXYZ.min(axis=0)
+    xyzMax = atomXYZ.max(axis=0)
+
+    auParams = [float(xyzMin[0]), float(xyzMax[0]),
+                float(xyzMin[1]), float(xyzMax[1]),
+                float(xyzMin[2]), float(xyzMax[2])]
     return auParams
 
 
@@ -78,6 +65,48 @@ def convertParams(params, pdt):
     return convParams
 
 
+def getAUfracParams(atomXYZ, cartesianVectors):
+    """
+    Determines the min. and max. values of the fractional a, b and c
+    coordinates of the atoms in the asymmetric unit.
+    """
+
+    import numpy as np
+
+    fracMatrix = np.linalg.inv(np.hstack(cartesianVectors))
+    atomFrac = np.dot(atomXYZ, fracMatrix.T)
+    fracMin = atomFrac.min(axis=0)
+    fracMax = atomFrac.max(axis=0)
+
+    fracParams = [float(fracMin[0]), float(fracMax[0]),
+                  float(fracMin[1]), float(fracMax[1]),
+                  float(fracMin[2]), float(fracMax[2])]
+    return fracParams
+
+
+def convertFracParams(fracParams, pdt, cartesianVectors, tol=1e-6):
+    """
+    Adds/subtracts the packing density threshold to/from the maximum/minimum
+    fractional a, b and c coordinate values of atoms in the asymmetric unit.
+    A distance d in Cartesian space changes the fractional coordinate along
+    each axis by at most d times the norm of the corresponding row of the
+    fractionalisation matrix (i.e. d divided by the spacing between lattice
+    planes), so the values returned define a parallelepiped (aligned with
+    the unit cell axes) that contains every atom within the packing density
+    threshold (plus tol, to allow for rounding) of the asymmetric unit.
+    """
+
+    import numpy as np
+
+    fracMatrix = np.linalg.inv(np.hstack(cartesianVectors))
+    fracPdt = (pdt + tol)*np.sqrt(np.square(fracMatrix).sum(axis=1))
+
+    convFracParams = [fracParams[0] - fracPdt[0], fracParams[1] + fracPdt[0],
+                      fracParams[2] - fracPdt[1], fracParams[3] + fracPdt[1],
+                      fracParams[4] - fracPdt[2], fracParams[5] + fracPdt[2]]
+    return convFracParams
+
+
 def isInXYZparams(atomXYZ, params):
     """
     Determines whether the xyz coordinates of atoms in the unit cell 3x3
@@ -96,10 +125,66 @@ def isInXYZparams(atomXYZ, params):
         return False
 
 
+def inXYZparams(atomList, params):
+    """
+    Determines (as a boolean array) which of the atoms in atomList lie within
+    the boundaries of the trimmed atoms box. Boundaries are compared in double
+    precision, whatever the precision in which the coordinates are stored.
+    """
+
+    import numpy as np
+
+    params = np.array(params, dtype=np.float64)
+    keep = np.ones(atomList.shape[0], dtype=bool)
+    for dim in range(3):
+        keep &= atomList[:, dim] >= params[2*dim]
+        keep &= atomList[:, dim] <= params[(2*dim)+1]
+
+    return keep
+
+
+def inFracParams(atomList, fracParams, cartesianVectors):
+    """
+    Determines (as a boolean array) which of the atoms in atomList have
+    fractional coordinates within the boundaries defined by fracParams.
+    """
+
+    import numpy as np
+
+    fracMatrix = np.linalg.inv(np.hstack(cartesianVectors))
+    atomFrac = np.dot(atomList.astype(np.float64), fracMatrix.T)
+    keep = np.ones(atomList.shape[0], dtype=bool)
+    for dim in range(3):
+        keep &= atomFrac[:, dim] >= fracParams[2*dim]
+        keep &= atomFrac[:, dim] <= fracParams[(2*dim)+1]
+
+    return keep
+
+
+def inAUdistance(atomList, auTree, pdt, tol=1e-6):
+    """
+    Determines (as a boolean array) which of the atoms in atomList lie within
+    the packing density threshold (plus tol, to allow for rounding) of at
+    least one atom in the asymmetric unit, via a KD-tree (auTree) of the
+    asymmetric unit atoms.
+    """
+
+    import numpy as np
+
+    if atomList.shape[0] == 0:
+        return np.zeros(0, dtype=bool)
+    distances = auTree.query(
+        atomList.astype(np.float64), k=1, distance_upper_bound=pdt+tol
+    )[0]
+
+    return distances <= pdt + tol
+
+
 def trimAtoms(atomList, params, atom_id_list, pdt):
     """
     Removes all atoms with coordinates which lie outside of the trimmed atoms
-    box from the list of atoms in the 3x3 unit cell assembly.
+    box from the list of atoms in the 3x3 unit cell assembly. Returns arrays
+    of the coordinates and IDs of the retained atoms.
     """
 
     import numpy as np
@@ -107,14 +192,91 @@ def trimAtoms(atomList, params, atom_id_list, pdt):
     print('Discarding atoms that lie further than %s Angstroms from the\n'
           'asymmetric unit' % pdt)
 
-    trimmedAtomList = []
-    trimmedAtomIDList = []
-    for num in range(atomList.shape[0]):
-        atomXYZ = [atomList[num][0], atomList[num][1], atomList[num][2]]
-        if isInXYZparams(atomXYZ, params):
-            trimmedAtomList.append(atomXYZ)
-            trimmedAtomIDList.append(atom_id_list[num])
-    trimmedAtomList = np.array(trimmedAtomList)
+    keep = inXYZparams(atomList, params)
+    trimmedAtomList = np.ascontiguousarray(atomList[keep])
+    trimmedAtomIDList = np.asarray(atom_id_list)[keep]
+
+    print('--> %s atoms have been retained' % trimmedAtomList.shape[0])
+    return trimmedAtomList, trimmedAtomIDList
+
+
+def trimAtomsFractional(
+    atomList, fracParams, cartesianVectors, atom_id_list, pdt
+):
+    """
+    Removes all atoms with fractional coordinates which lie outside of the
+    parallelepiped defined by fracParams (see convertFracParams) from the
+    list of (trimmed) atoms in the 3x3 unit cell assembly. For unit cells
+    with oblique axes this parallelepiped is much tighter than the
+    (axis-aligned) trimmed atoms box. Returns arrays of the coordinates and
+    IDs of the retained atoms.
+    """
+
+    import numpy as np
+
+    print('Discarding atoms whose fractional coordinates lie further than %s '
+          'Angstroms\nfrom the asymmetric unit' % pdt)
+
+    keep = inFracParams(atomList, fracParams, cartesianVectors)
+    trimmedAtomList = np.ascontiguousarray(atomList[keep])
+    trimmedAtomIDList = np.asarray(atom_id_list)[keep]
 
     print('--> %s atoms have been retained' % trimmedAtomList.shape[0])
     return trimmedAtomList, trimmedAtomIDList
+
+
+def trimAtomsByDistance(atomList, auAtomXYZ, atom_id_list, pdt):
+    """
+    Removes all atoms which lie further than the packing density threshold
+    from every atom in the asymmetric unit from the list of (trimmed) atoms
+    in the 3x3 unit cell assembly. Unlike the trimmed atoms box, this
+    discards the atoms in the empty regions of the box around elongated or
+    irregularly shaped asymmetric units. Returns arrays of the coordinates
+    and IDs of the retained atoms.
+    """
+
+    import numpy as np
+    from scipy.spatial import cKDTree
+
+    print('Discarding atoms that lie further than %s Angstroms from every '
+          'atom in the\nasymmetric unit' % pdt)
+
+    keep = inAUdistance(atomList, cKDTree(auAtomXYZ), float(pdt))
+    trimmedAtomList = np.ascontiguousarray(atomList[keep])
+    trimmedAtomIDList = np.asarray(atom_id_list)[keep]
+
+    print('--> %s atoms have been retained' % trimmedAtomList.shape[0])
+    return trimmedAtomList, trimmedAtomIDList
+
+
+def iterTrimmedAtoms(
+    transAtomBlocks, params, fracParams=None, cartesianVectors=None,
+    auAtomXYZ=None, pdt=None
+):
+    """
+    Trims each block of atoms yielded by iterTranslatedUnitCells to the
+    trimmed atoms box, and then either (if fracParams is provided) to the
+    boundaries defined by fracParams in fractional coordinates, or (if
+    auAtomXYZ is provided) to the atoms within pdt of the asymmetric unit
+    atoms. Yields the coordinates of the retained atoms in each block in
+    turn.
+    """
+
+    import numpy as np
+    from scipy.spatial import cKDTree
+
+    auTree = None
+    if auAtomXYZ is not None:
+        auTree = cKDTree(auAtomXYZ)
+
+    for transAtomList, transAtomIDList in transAtomBlocks:
+        trimmedAtomList = transAtomList[inXYZparams(transAtomList, params)]
+        if fracParams is not None:
+            trimmedAtomList = trimmedAtomList[inFracParams(
+                trimmedAtomList, fracParams, cartesianVectors
+            )]
+        if auTree is not None:
+            trimmedAtomList = trimmedAtomList[inAUdistance(
+                trimmedAtomList, auTree, pdt
+            )]
+        yield np.ascontiguousarray(trimmedAtomList)
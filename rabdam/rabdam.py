@@ -128,7 +128,28 @@ def parse_input_file_arguments(splitArgs):
     Reads in program parameters listed in user-specified input file
     """
 
+    import math
     import os
+    import sys
+
+    if __name__ == '__main__':
+        from Subroutines.parsePDB import (
+            is_selection_expression, compile_selection_expression
+        )
+        from Subroutines.CalculateBDamage import check_option_combinations
+    else:
+        if sys.version_info[0] < 3:
+            from Subroutines.parsePDB import (
+                is_selection_expression, compile_selection_expression
+            )
+            from Subroutines.CalculateBDamage import check_option_combinations
+        else:
+            from rabdam.Subroutines.parsePDB import (
+                is_selection_expression, compile_selection_expression
+            )
+            from rabdam.Subroutines.CalculateBDamage import (
+                check_option_combinations
+            )
 
     # Initialises default program options
     cwd = os.getcwd()
@@ -150,6 +171,18 @@ def parse_input_file_arguments(splitArgs):
     uc_pdb = False
     auc_pdb = False
     ta_pdb = False
+    pdEngine = 'kdtree'
+    maxKernelMem = 1073741824
+    nprocs = 1
+    assemblyMode = 'full'
+    contactShells = None
+    precision = 'double'
+    backend = 'auto'
+    pdCache = False
+    contactGraph = False
+    trimMode = 'box'
+    weightedContacts = None
+    contactSplit = False
 
     # If input file is provided, program options are updated to the values
     # the user has specified in it
@@ -323,21 +356,39 @@ def parse_input_file_arguments(splitArgs):
         # Lists atoms (via either their atom numbers or their residue names) to
         # be removed from the BDamage calculation. (This is useful to remove
         # additional atoms not covered by the proteinOrNucleicAcid / HETATM
-        # options.)
+        # options.) Atom number ranges are not expanded into individual atom
+        # numbers (the ranges are converted into an atom_selection when the
+        # atoms for BDamage analysis are selected). Atoms can also be listed
+        # via atom selection expressions, e.g. "chain A and resname GLU and
+        # name OE1 OE2" or "bfactor > 80" (see compile_selection_expression).
         elif splitArgs[x][0:11].lower() == 'removeatoms':
-            removeAtomsArg = splitArgs[x].split('=')[-1].upper()
+            removeAtomsArg = splitArgs[x].split('=', 1)[-1].strip()
             removeAtomsList = []
             if removeAtomsArg != '':
                 removeAtomsArg = removeAtomsArg.split(';')
                 for item in removeAtomsArg:
-                    removeAtomsRange = item.split('-')
+                    item = item.strip()
+                    if is_selection_expression(item):
+                        try:
+                            compile_selection_expression(item)
+                        except ValueError as error:
+                            raise ArgumentError(
+                                'Unrecognised atom selection for remove atoms: '
+                                '{}'.format(error)
+                            )
+                        removeAtomsList.append(item)
+                        continue
+                    # Spaces are ignored in atom numbers, residue names and
+                    # ranges, e.g. "1 - 5" is read as "1-5"
+                    item = ''.join(item.split())
+                    removeAtomsRange = item.upper().split('-')
                     if len(removeAtomsRange) == 2:
                         try:
                             min_val = int(removeAtomsRange[0])
                             max_val = int(removeAtomsRange[1])
-                            removeAtomsRange = range(min_val, (max_val+1))
-                            for number in removeAtomsRange:
-                                removeAtomsList.append(str(number))
+                            removeAtomsList.append(
+                                '{}-{}'.format(min_val, max_val)
+                            )
                         except ValueError:
                             raise ArgumentError(
                                 'Unrecognised input: {} for remove atoms - if '
@@ -358,19 +409,33 @@ def parse_input_file_arguments(splitArgs):
         # in a subset of atoms of interest that has been removed by the
         # proteinOrNucleicAcid / HETATM / removeAtoms options.)
         elif splitArgs[x][0:8].lower() == 'addatoms':
-            addAtomsArg = splitArgs[x].split('=')[-1].upper()
+            addAtomsArg = splitArgs[x].split('=', 1)[-1].strip()
             addAtomsList = []
             if addAtomsArg != '':
                 addAtomsArg = addAtomsArg.split(';')
                 for item in addAtomsArg:
-                    addAtomsRange = item.split('-')
+                    item = item.strip()
+                    if is_selection_expression(item):
+                        try:
+                            compile_selection_expression(item)
+                        except ValueError as error:
+                            raise ArgumentError(
+                                'Unrecognised atom selection for add atoms: '
+                                '{}'.format(error)
+                            )
+                        addAtomsList.append(item)
+                        continue
+                    # Spaces are ignored in atom numbers, residue names and
+                    # ranges, e.g. "1 - 5" is read as "1-5"
+                    item = ''.join(item.split())
+                    addAtomsRange = item.upper().split('-')
                     if len(addAtomsRange) == 2:
                         try:
                             min_val = int(addAtomsRange[0])
                             max_val = int(addAtomsRange[1])
-                            addAtomsRange = range(min_val, (max_val+1))
-                            for number in addAtomsRange:
-                                addAtomsList.append(str(number))
+                            addAtomsList.append(
+                                '{}-{}'.format(min_val, max_val)
+                            )
                         except ValueError:
                             raise ArgumentError(
                                 'Unrecognised input: {} for add atoms - if '
@@ -393,19 +458,33 @@ def parse_input_file_arguments(splitArgs):
         # (beyond 6 atoms, the colour scheme will repeat itself, and in
         # addition the key may not fit onto the graph).
         elif splitArgs[x][0:14].lower() == 'highlightatoms':
-            highlightAtomsArg = splitArgs[x].split('=')[-1].upper()
+            highlightAtomsArg = splitArgs[x].split('=', 1)[-1].strip()
             highlightAtomsList = []
             if highlightAtomsArg != '':
                 highlightAtomsArg = highlightAtomsArg.split(';')
                 for item in highlightAtomsArg:
-                    highlightAtomsRange = item.split('-')
+                    item = item.strip()
+                    if is_selection_expression(item):
+                        try:
+                            compile_selection_expression(item)
+                        except ValueError as error:
+                            raise ArgumentError(
+                                'Unrecognised atom selection for highlight atoms: '
+                                '{}'.format(error)
+                            )
+                        highlightAtomsList.append(item)
+                        continue
+                    # Spaces are ignored in atom numbers, residue names and
+                    # ranges, e.g. "1 - 5" is read as "1-5"
+                    item = ''.join(item.split())
+                    highlightAtomsRange = item.upper().split('-')
                     if len(highlightAtomsRange) == 2:
                         try:
                             min_val = int(highlightAtomsRange[0])
                             max_val = int(highlightAtomsRange[1])
-                            highlightAtomsRange = range(min_val, (max_val+1))
-                            for number in highlightAtomsRange:
-                                highlightAtomsList.append(str(number))
+                            highlightAtomsList.append(
+                                '{}-{}'.format(min_val, max_val)
+                            )
                         except ValueError:
                             raise ArgumentError(
                                 'Unrecognised input: {} for highlight atoms - '
@@ -491,12 +570,228 @@ def parse_input_file_arguments(splitArgs):
                     'to "True" or "False"'.format(ta_pdb)
                 )
 
+        # Specifies the method used to count the atoms within the packing
+        # density threshold of each atom - either a KD-tree neighbour search
+        # (default), a comparison of every pair of atoms in memory-limited
+        # blocks, or an approximate count from a grid of the surrounding atoms
+        # convolved with a sphere
+        elif splitArgs[x][0:8].lower() == 'pdengine':
+            pdEngine = splitArgs[x].split('=')[-1].lower()
+            if not pdEngine in ['kdtree', 'blocked', 'grid']:
+                raise ArgumentError(
+                    'Unrecognised value for pdengine: {}\nPlease set to one of '
+                    '"kdtree", "blocked" or "grid"'.format(pdEngine)
+                )
+
+        # Specifies the maximum amount of memory (default = 1G) to be used by
+        # the blocked packing density calculation
+        elif splitArgs[x][0:12].lower() == 'maxkernelmem':
+            maxKernelMemArg = splitArgs[x].split('=')[-1].upper().rstrip('B')
+            mem_units = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+            try:
+                if maxKernelMemArg[-1:] in mem_units:
+                    maxKernelMem = int(
+                        float(maxKernelMemArg[:-1])*mem_units[maxKernelMemArg[-1]]
+                    )
+                else:
+                    maxKernelMem = int(maxKernelMemArg)
+            except ValueError:
+                raise ArgumentError(
+                    'Value provided for maxkernelmem unrecognised: {}\nExpect '
+                    'to be set to a number of bytes, optionally followed by '
+                    'K, M, G or T (e.g. "2G")'.format(splitArgs[x].split('=')[-1])
+                )
+            if maxKernelMem <= 0:
+                raise ArgumentError(
+                    'Value provided for maxkernelmem must be greater than 0: '
+                    '{}'.format(splitArgs[x].split('=')[-1])
+                )
+
+        # Specifies the number of threads (default = 1) across which the
+        # packing density calculation is split
+        elif splitArgs[x][0:6].lower() == 'nprocs':
+            try:
+                nprocs = int(splitArgs[x].split('=')[-1])
+            except ValueError:
+                raise ArgumentError(
+                    'Value provided for nprocs not recognised as an integer: '
+                    '{}'.format(splitArgs[x].split('=')[-1])
+                )
+            if nprocs < 1:
+                raise ArgumentError(
+                    'Value provided for nprocs must be at least 1: '
+                    '{}'.format(nprocs)
+                )
+
+        # Specifies whether packing density is calculated from a 3x3 unit
+        # cell assembly (default), from the 3x3 unit cell assembly generated
+        # (and discarded) one translated unit cell at a time, from the unit
+        # cell under periodic boundary conditions, or from the asymmetric unit
+        # plus the space group symmetry operators
+        elif splitArgs[x][0:12].lower() == 'assemblymode':
+            assemblyMode = splitArgs[x].split('=')[-1].lower()
+            if not assemblyMode in ['full', 'stream', 'pbc', 'symmetry']:
+                raise ArgumentError(
+                    'Unrecognised value for assemblymode: {}\nPlease set to '
+                    'one of "full", "stream", "pbc" or "symmetry"'.format(
+                        assemblyMode
+                    )
+                )
+
+        # Specifies a range of radii (min-max:step, in Angstroms) at which to
+        # additionally count the contacts of each atom, so that BDamage can
+        # subsequently be recalculated at different packing density
+        # thresholds without repeating the neighbour search
+        elif splitArgs[x][0:13].lower() == 'contactshells':
+            contactShellsArg = splitArgs[x].split('=')[-1]
+            try:
+                shell_range, shell_step = contactShellsArg.split(':')
+                shell_min, shell_max = [
+                    float(val) for val in shell_range.split('-')
+                ]
+                shell_step = float(shell_step)
+            except ValueError:
+                raise ArgumentError(
+                    'Value provided for contactshells not recognised: {}\n'
+                    'Expect to be set to min-max:step, e.g. '
+                    '"4-14:0.5"'.format(contactShellsArg)
+                )
+            if shell_min <= 0 or shell_max < shell_min or shell_step <= 0:
+                raise ArgumentError(
+                    'Value provided for contactshells not recognised: {}\n'
+                    'Radii must be greater than 0, the maximum radius must be '
+                    'at least the minimum radius, and the step must be greater '
+                    'than 0'.format(contactShellsArg)
+                )
+            # The number of shells is rounded down (with a tolerance for
+            # floating point error), such that the maximum radius is never
+            # exceeded
+            num_shells = int(math.floor(
+                ((shell_max - shell_min) / shell_step) + 1e-6
+            )) + 1
+            contactShells = [
+                round(shell_min + (n*shell_step), 6) for n in range(num_shells)
+            ]
+
+        # Specifies whether the coordinates of the 3x3 unit cell assembly are
+        # stored in double (default) or single precision. Single precision
+        # halves the memory of the assembly and trimmed atom arrays, and of
+        # the blocked packing density engine's distance kernel, but not of
+        # the KD-tree packing density engine (the KD-tree stores its own
+        # double precision copy of the trimmed atom coordinates)
+        elif splitArgs[x][0:9].lower() == 'precision':
+            precision = splitArgs[x].split('=')[-1].lower()
+            if not precision in ['double', 'single']:
+                raise ArgumentError(
+                    'Unrecognised value for precision: {}\nPlease set to '
+                    'either "double" or "single"'.format(precision)
+                )
+
+        # Specifies whether contacts are counted by the blocked packing
+        # density engine using JIT-compiled (numba) or numpy kernels. By
+        # default (auto) the JIT-compiled kernels are used if the blocked
+        # engine has been selected and numba is installed.
+        elif splitArgs[x][0:7].lower() == 'backend':
+            backend = splitArgs[x].split('=')[-1].lower()
+            if not backend in ['auto', 'numpy', 'jit']:
+                raise ArgumentError(
+                    'Unrecognised value for backend: {}\nPlease set to one of '
+                    '"auto", "numpy" or "jit"'.format(backend)
+                )
+
+        # Specifies whether to cache the packing density values of the
+        # processed asymmetric unit, so that they can be reused by subsequent
+        # runs that change only the selection of atoms for BDamage analysis
+        elif splitArgs[x][0:7].lower() == 'pdcache':
+            pdCache = splitArgs[x].split('=')[-1].lower()
+            if pdCache in ['true', 'yes', 't', 'y']:
+                pdCache = True
+            elif pdCache in ['false', 'no', 'f', 'n']:
+                pdCache = False
+            else:
+                raise ArgumentError(
+                    'Unrecognised value for pdcache: {}\nExpect to be set '
+                    'to "True" or "False"'.format(pdCache)
+                )
+
+        # Specifies whether to save the graph of atom pairs within the packing
+        # density threshold (as a sparse matrix)
+        elif splitArgs[x][0:12].lower() == 'contactgraph':
+            contactGraph = splitArgs[x].split('=')[-1].lower()
+            if contactGraph in ['true', 'yes', 't', 'y']:
+                contactGraph = True
+            elif contactGraph in ['false', 'no', 'f', 'n']:
+                contactGraph = False
+            else:
+                raise ArgumentError(
+                    'Unrecognised value for contactgraph: {}\nExpect to be '
+                    'set to "True" or "False"'.format(contactGraph)
+                )
+
+        # Specifies whether the 3x3 unit cell assembly is trimmed to a box
+        # around the asymmetric unit in Cartesian coordinates only (box), or
+        # additionally in fractional coordinates (fractional) or to the atoms
+        # within the packing density threshold of the asymmetric unit atoms
+        # (distance)
+        elif splitArgs[x][0:8].lower() == 'trimmode':
+            trimMode = splitArgs[x].split('=')[-1].lower()
+            if not trimMode in ['box', 'fractional', 'distance']:
+                raise ArgumentError(
+                    'Unrecognised value for trimmode: {}\nPlease set to one of '
+                    '"box", "fractional" or "distance"'.format(trimMode)
+                )
+
+        # Specifies the functions (of the distance between two atoms) by
+        # which contacts are weighted to calculate weighted contact numbers,
+        # in the same neighbour search as packing density
+        elif splitArgs[x][0:16].lower() == 'weightedcontacts':
+            weightedContactsArg = splitArgs[x].split('=')[-1].lower()
+            weightedContacts = None
+            if not weightedContactsArg in ['', 'none']:
+                weightedContacts = []
+                for weighting in weightedContactsArg.split(';'):
+                    if weighting == '':
+                        continue
+                    if not weighting in ['inverse', 'inverse_square', 'gaussian']:
+                        raise ArgumentError(
+                            'Unrecognised value for weightedcontacts: {}\n'
+                            'Please set to a semicolon-separated list of '
+                            '"inverse", "inverse_square" and/or '
+                            '"gaussian"'.format(weighting)
+                        )
+                    if not weighting in weightedContacts:
+                        weightedContacts.append(weighting)
+
+        # Specifies whether to split the packing density of each atom into
+        # contacts with atoms in the same copy of the asymmetric unit and
+        # contacts with atoms in other copies (i.e. crystal contacts)
+        elif splitArgs[x][0:12].lower() == 'contactsplit':
+            contactSplit = splitArgs[x].split('=')[-1].lower()
+            if contactSplit in ['true', 'yes', 't', 'y']:
+                contactSplit = True
+            elif contactSplit in ['false', 'no', 'f', 'n']:
+                contactSplit = False
+            else:
+                raise ArgumentError(
+                    'Unrecognised value for contactsplit: {}\nExpect to be '
+                    'set to "True" or "False"'.format(contactSplit)
+                )
+
         else:
             if splitArgs[x] != '':
                 raise ArgumentError(
                     'Unrecognised argument {}'.format(splitArgs[x])
                 )
 
+    # Checks that the options specified can be used together
+    try:
+        check_option_combinations(
+            assemblyMode, pdEngine, contactShells, weightedContacts,
+            contactSplit, contactGraph, trimMode, precision, auc_pdb, ta_pdb
+        )
+    except ValueError as error:
+        raise ArgumentError(str(error))
+
     input_arguments = {'outputDir': outputLoc,
                        'batchRun': batchVal,
                        'overwrite': overwriteVal,
@@ -514,7 +809,19 @@ def parse_input_file_arguments(splitArgs):
                        'createAUpdb': au_pdb,
                        'createUCpdb': uc_pdb,
                        'createAUCpdb': auc_pdb,
-                       'createTApdb': ta_pdb}
+                       'createTApdb': ta_pdb,
+                       'pdEngine': pdEngine,
+                       'maxKernelMem': maxKernelMem,
+                       'nprocs': nprocs,
+                       'assemblyMode': assemblyMode,
+                       'contactShells': contactShells,
+                       'precision': precision,
+                       'backend': backend,
+                       'pdCache': pdCache,
+                       'contactGraph': contactGraph,
+                       'trimMode': trimMode,
+                       'weightedContacts': weightedContacts,
+                       'contactSplit': contactSplit}
 
     return input_arguments
 
@@ -564,10 +871,14 @@ def main(test=False):
         functionArgs = functionArgs.replace('\r', '')
         splitArgs = functionArgs.split(',')
         pathToInputList = [item.strip() for item in splitArgs if '=' not in item]
-        # Reads in remaining program options specified in input file
-        functionArgs = functionArgs.replace(' ', '')
-        splitArgs = functionArgs.split(',')
-        splitArgs = [item.strip() for item in splitArgs if '=' in item]
+        # Reads in remaining program options specified in input file. Spaces
+        # are retained in the atom selection options (which can contain atom
+        # selection expressions), and removed from all other options.
+        selection_options = ('removeatoms', 'addatoms', 'highlightatoms')
+        splitArgs = [
+            item.strip() if item.strip().lower().startswith(selection_options)
+            else item.replace(' ', '') for item in splitArgs if '=' in item
+        ]
 
     # Reads in PDB file name(s) specified by -f flag listed in command line input
     elif vars(args)['pdb_or_mmcif_file'] is not None:
@@ -605,7 +916,19 @@ def main(test=False):
             createAUpdb=input_arguments['createAUpdb'],
             createUCpdb=input_arguments['createUCpdb'],
             createAUCpdb=input_arguments['createAUCpdb'],
-            createTApdb=input_arguments['createTApdb']
+            createTApdb=input_arguments['createTApdb'],
+            pdEngine=input_arguments['pdEngine'],
+            maxKernelMem=input_arguments['maxKernelMem'],
+            nprocs=input_arguments['nprocs'],
+            assemblyMode=input_arguments['assemblyMode'],
+            contactShells=input_arguments['contactShells'],
+            precision=input_arguments['precision'],
+            backend=input_arguments['backend'],
+            pdCache=input_arguments['pdCache'],
+            contactGraph=input_arguments['contactGraph'],
+            trimMode=input_arguments['trimMode'],
+            weightedContacts=input_arguments['weightedContacts'],
+            contactSplit=input_arguments['contactSplit']
         )
 
         success = True
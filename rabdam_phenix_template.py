@@ -106,6 +106,30 @@ master_phil_str = '''
         .type = bool
     save_ta_pdb = False
         .type = bool
+    pd_engine = "kdtree"
+        .type = str
+    max_kernel_mem = "1G"
+        .type = str
+    nprocs = 1
+        .type = int
+    assembly_mode = "full"
+        .type = str
+    contact_shells = None
+        .type = str
+    precision = "double"
+        .type = str
+    backend = "auto"
+        .type = str
+    pd_cache = False
+        .type = bool
+    contact_graph = False
+        .type = bool
+    trim_mode = "box"
+        .type = str
+    weighted_contacts = None
+        .type = str
+    contact_split = False
+        .type = bool
     test = False
         .type = bool
     run_type = "full"
@@ -117,9 +141,16 @@ master_phil_str = '''
 
 def convert_input_str_to_list(input_string, variable_name):
     """
-    Converts list in string format ("[1, 2, 3]") into list ([1, 2, 3])
+    Converts list in string format ("[1, 2, 3-5]") into list (["1", "2",
+    "3-5"]). Atom number ranges are not expanded into individual atom numbers,
+    and atom selection expressions (e.g. "bfactor > 80") are retained as
+    listed.
     """
 
+    from phenix.rabdam.Subroutines.parsePDB import (
+        is_selection_expression, compile_selection_expression
+    )
+
     input_string = str(input_string).strip()
     output_list = []
 
@@ -128,14 +159,18 @@ def convert_input_str_to_list(input_string, variable_name):
         input_list = input_string.split(',')  # Necessary to use "," rather 
         # than ";" as phenix throws an error if include ";" in the string
         for item in input_list:
-            num_range = item.split('-').strip()
+            item = item.strip()
+            if is_selection_expression(item):
+                # Raises ValueError if the expression isn't recognised
+                compile_selection_expression(item)
+                output_list.append(item)
+                continue
+            num_range = ''.join(item.split()).split('-')
             if len(num_range) == 2:
                 try:
                     min_val = int(num_range[0])
                     max_val = int(num_range[1])
-                    full_num_range = range(min_val, (max_val+1))
-                    for number in full_num_range:
-                        output_list.append(str(number))
+                    output_list.append('{}-{}'.format(min_val, max_val))
                 except ValueError:
                     raise ValueError(
                         'Unrecognised input: {} for {} - if input contains "-",'
@@ -177,6 +212,69 @@ def convert_input_temp_to_float(temp_str):
     return temp_float
 
 
+def convert_input_mem_to_bytes(mem_str):
+    """
+    Converts input memory size (e.g. "2G") into a number of bytes
+    """
+
+    mem_str = str(mem_str).upper().strip().rstrip('B')
+    mem_units = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+    try:
+        if mem_str[-1:] in mem_units:
+            mem_bytes = int(float(mem_str[:-1])*mem_units[mem_str[-1]])
+        else:
+            mem_bytes = int(mem_str)
+    except ValueError:
+        raise ValueError(
+            'Value provided for max_kernel_mem unrecognised: {}\n'
+            'Expect to be set to a number of bytes, optionally followed by K, '
+            'M, G or T (e.g. "2G")'.format(mem_str)
+        )
+
+    return mem_bytes
+
+
+def convert_input_shells_to_list(shells_str):
+    """
+    Converts input contact shell range ("min-max:step") into a list of radii
+    """
+
+    import math
+
+    shells_str = str(shells_str).lower().strip()
+    if shells_str in ['', 'none']:
+        return None
+
+    try:
+        shell_range, shell_step = shells_str.split(':')
+        shell_min, shell_max = [float(val) for val in shell_range.split('-')]
+        shell_step = float(shell_step)
+    except ValueError:
+        raise ValueError(
+            'Value provided for contact_shells unrecognised: {}\n'
+            'Expect to be set to min-max:step, e.g. "4-14:0.5"'.format(shells_str)
+        )
+    if shell_min <= 0 or shell_max < shell_min or shell_step <= 0:
+        raise ValueError(
+            'Value provided for contact_shells unrecognised: {}\n'
+            'Radii must be greater than 0, the maximum radius must be at least '
+            'the minimum radius, and the step must be greater than '
+            '0'.format(shells_str)
+        )
+
+    # The number of shells is rounded down (with a tolerance for floating
+    # point error), such that the maximum radius is never exceeded
+    num_shells = int(math.floor(
+        ((shell_max - shell_min) / shell_step) + 1e-6
+    )) + 1
+    shells_list = [
+        round(shell_min + (n*shell_step), 6) for n in range(num_shells)
+    ]
+
+    return shells_list
+
+
 class Program(ProgramTemplate):
 
     # Program description
@@ -254,6 +352,24 @@ class Program(ProgramTemplate):
         self.params.temperature = convert_input_temp_to_float(
             self.params.temperature
         )
+        # Convert command line memory size from string to number of bytes
+        self.params.max_kernel_mem = convert_input_mem_to_bytes(
+            self.params.max_kernel_mem
+        )
+        # Convert command line contact shell range from string to list of radii
+        self.params.contact_shells = convert_input_shells_to_list(
+            self.params.contact_shells
+        )
+
+        # Convert command line contact weighting functions from string to list
+        weightings_str = str(self.params.weighted_contacts).lower().strip()
+        if weightings_str in ['', 'none']:
+            self.params.weighted_contacts = None
+        else:
+            self.params.weighted_contacts = [
+                val.strip() for val in weightings_str.split(';')
+                if val.strip() != ''
+            ]
 
         # Initialises rabdam object
         rabdam_obj = run_rabdam(
@@ -276,7 +392,19 @@ class Program(ProgramTemplate):
             createUCpdb=self.params.save_uc_pdb,
             createAUCpdb=self.params.save_auc_pdb,
             createTApdb=self.params.save_ta_pdb,
-            phenixImport=self.params.phenix_import
+            phenixImport=self.params.phenix_import,
+            pdEngine=self.params.pd_engine,
+            maxKernelMem=self.params.max_kernel_mem,
+            nprocs=self.params.nprocs,
+            assemblyMode=self.params.assembly_mode,
+            contactShells=self.params.contact_shells,
+            precision=self.params.precision,
+            backend=self.params.backend,
+            pdCache=self.params.pd_cache,
+            contactGraph=self.params.contact_graph,
+            trimMode=self.params.trim_mode,
+            weightedContacts=self.params.weighted_contacts,
+            contactSplit=self.params.contact_split
         )
 
         # Runs RABDAM to calculate BDamage and Bnet values
@@ -22,7 +22,9 @@
 # python -m unittest tests/test_atom_filtering.py
 
 import unittest
-from rabdam.Subroutines.parsePDB import atom, b_damage_atom_list
+from rabdam.Subroutines.parsePDB import (
+    atom, atom_table, atom_selection, b_damage_atom_list
+)
 from rabdam.Subroutines.PDBCUR import clean_atom_rec
 from tests.make_atom_rec import gen_atom_objs_list
 
@@ -87,6 +89,9 @@ class TestClass(unittest.TestCase):
         self.assertFalse(exit_1)
         self.assertFalse(pause_1)
         self.assertEqual(exp_atoms_list_1, act_atoms_list_1)
+        # Check retained atoms are not copied
+        for act_atm, atm in zip(act_atoms_list_1, atoms_list_1):
+            self.assertIs(atm, act_atm)
         with open('{}.cif'.format(clean_au_file_1), 'r') as f:
             act_cif_lines_1 = f.read().split('\n')
             self.assertEqual(exp_cif_lines_1, act_cif_lines_1)
@@ -388,4 +393,221 @@ class TestClass(unittest.TestCase):
         )
         exp_atoms_list_8 = copy.deepcopy(atoms_list_8)
         self.assertEqual(exp_atoms_list_8, act_atoms_list_8)
+        # Check selected atoms are not copied, and that added atoms are not
+        # duplicated
+        for act_atm, atm in zip(act_atoms_list_8, atoms_list_8):
+            self.assertIs(atm, act_atm)
+
+        # Check removes atoms 2 and 438 but not atom 3546 if remove_atoms =
+        # ['1-500', '700-3545']
+        atoms_list_9 = copy.deepcopy(atoms_list)
+        act_atoms_list_9 = b_damage_atom_list(
+            clean_au_list=atoms_list_9, HETATM=True, protOrNA='proteinna',
+            addAtoms=[], removeAtoms=['1-500', '700-3545']
+        )
+        exp_atoms_list_9 = copy.deepcopy(atoms_list_9[2:])
+        self.assertEqual(exp_atoms_list_9, act_atoms_list_9)
+
+    def test_atom_table(self):
+        """
+        Checks that a list of atom objects is stored without loss in an atom
+        table, and that packing density, BDamage and DataFrame values
+        calculated from an atom table are identical to those calculated from
+        the list of atom objects
+        """
+
+        import os
+        import shutil
+        import numpy as np
+        import pandas as pd
+        from rabdam.Subroutines.BDamage import (
+            get_xyz_from_objects, write_pckg_dens_to_atoms, calcBDam,
+            write_weighted_contacts_to_atoms
+        )
+        from rabdam.Subroutines.makeDataFrame import makePDB, writeDataFrame
+        from rabdam.Subroutines.output import write_output_cif
+
+        atoms_list = gen_atom_objs_list()
+        rng = np.random.RandomState(0)
+        for index in range(40):
+            atm = atom()
+            for key, value in vars(atoms_list[index % 3]).items():
+                setattr(atm, key, value)
+            atm.atomNum = index + 10
+            atm.xyzCoords = [[x] for x in np.round(rng.uniform(0, 50, 3), 3)]
+            atm.bFactor = float(np.round(rng.uniform(10, 80), 2))
+            atm.pd = None
+            atoms_list.append(atm)
+
+        table = atom_table.from_atoms(atoms_list)
+        self.assertEqual(len(table), len(atoms_list))
+        self.assertEqual(table.to_atoms(), atoms_list)
+        self.assertEqual(
+            [atm.atomNum for atm in table], [atm.atomNum for atm in atoms_list]
+        )
+        self.assertEqual(table[-1].xyzCoords, atoms_list[-1].xyzCoords)
+        self.assertIsNone(table[-1].pd)
+        # Check that slicing or indexing the table with an array returns a
+        # table of the selected rows
+        self.assertEqual(table[2:10].to_atoms(), atoms_list[2:10])
+        self.assertEqual(table[::-3].to_atoms(), atoms_list[::-3])
+        self.assertEqual(
+            table[np.array([5, 0, -1])].to_atoms(),
+            [atoms_list[5], atoms_list[0], atoms_list[-1]]
+        )
+        mask = np.arange(len(atoms_list)) % 2 == 0
+        self.assertEqual(table[mask].to_atoms(), atoms_list[::2])
+        self.assertEqual(len(table[[]]), 0)
+        for index in [1.0, 'a', np.array([0.5]), np.zeros((2, 2), dtype=int)]:
+            self.assertRaises(TypeError, table.__getitem__, index)
+        self.assertRaises(IndexError, table.__getitem__, len(atoms_list))
+        np.testing.assert_array_equal(
+            get_xyz_from_objects(table), get_xyz_from_objects(atoms_list)
+        )
+
+        packing_density_array = rng.randint(
+            0, 40, (len(atoms_list), 1)
+        ).astype(float)
+        weighted_array = rng.uniform(0, 10, (len(atoms_list), 2))
+        for atom_list in [atoms_list, table]:
+            write_pckg_dens_to_atoms(atom_list, packing_density_array)
+            write_weighted_contacts_to_atoms(
+                atom_list, ['inverse', 'gaussian'], weighted_array
+            )
+            calcBDam(atom_list, 11)
+        self.assertEqual(table.to_atoms(), atoms_list)
+        pd.testing.assert_frame_equal(
+            writeDataFrame(table), writeDataFrame(atoms_list)
+        )
+
+        # Check that the rows returned by iter_rows match the atom objects,
+        # and that identical output files are written from the atom table
+        # and the list of atom objects
+        rows = list(table.iter_rows())
+        self.assertEqual(len(rows), len(atoms_list))
+        for row, atm in zip(rows, atoms_list):
+            for name, value in vars(atm).items():
+                self.assertEqual(getattr(row, name), value)
 
+        if not os.path.isdir('tests/temp_files/'):
+            os.mkdir('tests/temp_files/')
+        for index, atom_list in enumerate([atoms_list, table]):
+            makePDB(
+                [], atom_list, [], 'tests/temp_files/test_{}.pdb'.format(index),
+                'bdamage'
+            )
+            write_output_cif(
+                atom_list, 'tests/temp_files/test_{}'.format(index), True
+            )
+        for ext in ['pdb', 'cif']:
+            # The first line of the mmCIF file (data_<file name>) is skipped
+            with open('tests/temp_files/test_0.{}'.format(ext), 'r') as f:
+                exp_lines = f.readlines()[1:]
+            with open('tests/temp_files/test_1.{}'.format(ext), 'r') as f:
+                act_lines = f.readlines()[1:]
+            self.assertEqual(exp_lines, act_lines)
+        shutil.rmtree('tests/temp_files/')
+
+    def test_atom_selection(self):
+        """
+        Checks that atom number ranges, residue names and atom selection
+        expressions are correctly converted into an atom_selection, and that
+        atoms are correctly matched against the selection
+        """
+
+        import numpy as np
+
+        selection = atom_selection(['7-9', '2', 'HOH', '8-12', '14-13', '1-1'])
+        np.testing.assert_array_equal(selection.starts, np.array([1, 7]))
+        np.testing.assert_array_equal(selection.ends, np.array([2, 12]))
+        self.assertEqual(selection.resiTypes, frozenset(['HOH']))
+        self.assertEqual(selection.expressions, [])
+        self.assertEqual(len(selection), 6)
+        self.assertEqual(str(selection), '7-9, 2, HOH, 8-12, 14-13, 1-1')
+
+        # Check spaces are ignored in atom number ranges and residue names
+        spaced_selection = atom_selection(['1 - 5', ' HOH '])
+        np.testing.assert_array_equal(spaced_selection.starts, np.array([1]))
+        np.testing.assert_array_equal(spaced_selection.ends, np.array([5]))
+        self.assertEqual(spaced_selection.resiTypes, frozenset(['HOH']))
+        self.assertEqual(spaced_selection.expressions, [])
+
+        atoms_list = []
+        # The label (orig_*) values of some atoms differ from their author
+        # values, to check that selection uses the author values
+        for (atom_num, resi_type, chain, atom_type, b_factor, orig_resi_type,
+             orig_chain, orig_atom_type) in [
+            (0, 'GLY', 'A', 'CA', 10.0, 'GLY', 'A', 'CA'),
+            (1, 'GLY', 'A', 'CA', 90.0, 'GLY', 'A', 'CA'),
+            (2, 'GLU', 'A', 'OE1', 20.0, 'GLU', 'A', 'O1'),
+            (3, 'HOH', 'B', 'O', 85.0, 'HOH', 'D', 'O'),
+            (6, 'GLU', 'A', 'OE2', 30.0, 'GLU', 'A', 'OE2'),
+            (7, 'GLU', 'B', 'OE1', 40.0, 'GLU', 'A', 'OE1'),
+            (12, 'GLY', 'A', 'CA', 50.0, 'GLY', 'A', 'CA'),
+            (13, 'FAD', 'C', 'PA', 60.0, 'FDA', 'C', 'PA'),
+            (14, 'HOH', 'B', 'O', 70.0, 'HOH', 'D', 'O'),
+            (500000, 'GLU', 'A', 'CD', 80.0, 'GLU', 'A', 'CD')
+        ]:
+            atoms_list.append(atom(
+                lineidentifier='ATOM', atomnum=atom_num, atomtype=atom_type,
+                conformer='', resitype=resi_type, chainID=chain, resinum=1,
+                insertioncode='', xyz_coords=[[0.0], [0.0], [0.0]],
+                element=atom_type[0], bfactor=b_factor, occupancy=1.0,
+                charge='', orig_resinum=2, orig_resitype=orig_resi_type,
+                orig_chainID=orig_chain, orig_atomtype=orig_atom_type
+            ))
+        table = atom_table.from_atoms(atoms_list)
+
+        np.testing.assert_array_equal(
+            selection.contains_atom_numbers([0, 1, 2, 3, 6, 7, 12, 13, 14]),
+            np.array([False, True, True, False, False, True, True, False,
+                      False])
+        )
+        exp_mask = np.array([False, True, True, True, False, True, True,
+                             False, True, False])
+        np.testing.assert_array_equal(
+            selection.select_atoms(atoms_list), exp_mask
+        )
+        np.testing.assert_array_equal(selection.select_atoms(table), exp_mask)
+
+        # Check large ranges are not expanded into individual atom numbers
+        selection = atom_selection(['1-500000'])
+        self.assertEqual(selection.starts.shape, (1,))
+        self.assertTrue(selection.select_atoms(atoms_list)[1:].all())
+
+        # Check empty selection matches no atoms
+        selection = atom_selection()
+        self.assertEqual(len(selection), 0)
+        self.assertFalse(selection.select_atoms(atoms_list).any())
+
+        # Check atom selection expressions are matched against the atom
+        # properties, and combined with the other items in the selection
+        for items, exp_atom_nums in [
+            (['chain A and resname GLU and name OE1 OE2'], [2, 6]),
+            (['bfactor > 80'], [1, 3]),
+            (['bfactor >= 80 and not (resname HOH or atomnum<500000)'],
+             [500000]),
+            (['CHAIN B AND NOT RESNAME HOH'], [7]),
+            (['resname FAD', 'chain B and bfactor <= 70', '0-1'],
+             [0, 1, 7, 13, 14]),
+            (['resnum 2'], [])
+        ]:
+            selection = atom_selection(items)
+            for atom_list in [atoms_list, table]:
+                act_mask = selection.select_atoms(atom_list)
+                self.assertEqual(
+                    [atm.atomNum for atm, selected in zip(atoms_list, act_mask)
+                     if selected], exp_atom_nums
+                )
+                self.assertEqual(
+                    selection.select_atom_numbers(atom_list), exp_atom_nums
+                )
+
+        # Check raises ValueError if atom number range or atom selection
+        # expression isn't recognised
+        for items in [
+            ['1-A'], ['1-2-3'], ['chian A'], ['chain A and'], ['chain > 1'],
+            ['bfactor > high'], ['(chain A'], ['chain A)'], ['name ()'],
+            ['bfactor = 80'], ['resnum A B']
+        ]:
+            self.assertRaises(ValueError, atom_selection, items)
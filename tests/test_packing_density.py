@@ -0,0 +1,1099 @@
+
+# RABDAM
+# Copyright (C) 2025 Garman Group, University of Oxford
+
+# This file is part of RABDAM.
+
+# RABDAM is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+
+# RABDAM is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General
+# Public License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+# python -m unittest tests/test_packing_density.py
+
+import math
+import unittest
+import numpy as np
+from rabdam.Subroutines.BDamage import (
+    calc_block_size, calc_packing_density, calc_packing_density_stream,
+    calc_packing_density_grid, calc_grid_shape, calc_grid_mem,
+    calc_weighted_packing_density,
+    calc_contact_split,
+    calc_packing_density_pbc,
+    calc_packing_density_symmetry,
+    find_unique_symmetry_images,
+    calc_contact_shells, calc_contact_graph, packing_density_at_threshold,
+    calc_bdamage_at_threshold, write_pckg_dens_to_atoms, calcBDam,
+    calc_single_precision_tol, select_kernel_backend,
+    gen_packing_density_cache_key, select_cached_values, calc_morton_order
+)
+from rabdam.Subroutines.parsePDB import atom
+from rabdam.Subroutines.translateUnitCell import (
+    convertToCartesian, translateUnitCell, translateUnitCellAssembly,
+    iterTranslatedUnitCells, translated_atom_coords, identify_au_copy_atoms
+)
+from rabdam.Subroutines.trimUnitCellAssembly import (
+    getAUparams, convertParams, isInXYZparams, trimAtoms, getAUfracParams,
+    convertFracParams, trimAtomsFractional, trimAtomsByDistance,
+    iterTrimmedAtoms
+)
+
+
+try:
+    import numba
+    numba_installed = True
+except ImportError:
+    numba_installed = False
+
+
+def calc_packing_density_brute_force(xyz_au_atom, xyz_surr_atom, pdt):
+    """
+    Reference packing density calculation, comparing every asymmetric unit
+    atom against every surrounding atom
+    """
+
+    packing_density_array = np.zeros([xyz_au_atom.shape[0], 1])
+    for i in range(xyz_au_atom.shape[0]):
+        distances = np.sqrt(np.square(xyz_surr_atom[:, :] - xyz_au_atom[i, :]).sum(axis=1))
+        packing_density_array[i][0] = np.sum(distances < pdt) - 1
+
+    return packing_density_array
+
+
+def calc_bdamage_pandas(bdamAtomList, window):
+    """
+    Reference BDamage calculation, performing the sort, rolling mean and edge
+    corrections with pandas
+    """
+
+    import pandas as pd
+
+    df = pd.DataFrame({'ATMNUM': [atm.atomNum for atm in bdamAtomList],
+                       'BFAC': [atm.bFactor for atm in bdamAtomList],
+                       'PD': [atm.pd for atm in bdamAtomList]})
+    df = df.sort_values(by=['PD', 'ATMNUM'], ascending=[True, True])
+    df = df.reset_index(drop=True)
+    ser = df['BFAC'].rename('AVRG_BF').rolling(window=window, center=True).mean()
+    ser = ser.fillna(0)
+    index = pd.Series(range(0, len(bdamAtomList))).rename('INDEX')
+    df = pd.concat([df, ser, index], axis=1)
+    df.loc[(df.AVRG_BF == 0) & (df.INDEX <= (math.floor(window/2)-1)),
+           'AVRG_BF'] += df.BFAC.values[0:window].mean(axis=0)
+    df.loc[(df.AVRG_BF == 0) & (df.INDEX >= (len(bdamAtomList) - math.floor(window/2))),
+           'AVRG_BF'] += df.BFAC.values[(len(bdamAtomList)-window):len(bdamAtomList)].mean(axis=0)
+
+    atmnum_list = df.ATMNUM.tolist()
+    avrg_bf = [df.AVRG_BF[atmnum_list.index(atm.atomNum)] for atm in bdamAtomList]
+
+    return avrg_bf
+
+
+def round_trip_fractional(xyz):
+    """
+    Converts cartesian coordinates into fractional coordinates (of a triclinic
+    unit cell) and back, as is the case for the atoms in the unit cell
+    assembly in a RABDAM run
+    """
+
+    cartesianVectors = np.array([[33.7, -9.53, -7.58],
+                                 [0.0, 40.8, 2.14],
+                                 [0.0, 0.0, 56.7]])
+    frac_xyz = np.dot(xyz, np.linalg.inv(cartesianVectors))
+
+    return np.dot(frac_xyz, cartesianVectors)
+
+
+def gen_test_coords(seed=0, num_au_atoms=300, num_surr_atoms=3000):
+    """
+    Generates coordinates (to 3 d.p., as in a PDB file) of a test asymmetric
+    unit and of its surrounding atoms. The asymmetric unit atoms are included
+    in the surrounding atoms, as they are in a RABDAM run (i.e. after a round
+    trip through fractional coordinates, so they are not exactly equal to the
+    asymmetric unit coordinates), and a subset of the surrounding atoms lie
+    exactly 7 Angstroms along an axis from an asymmetric unit atom.
+    """
+
+    rng = np.random.RandomState(seed)
+    xyz_au_atom = np.round(rng.uniform(0, 30, (num_au_atoms, 3)), 3)
+    xyz_surr_atom = np.round(rng.uniform(-10, 40, (num_surr_atoms, 3)), 3)
+
+    boundary_atoms = np.copy(xyz_au_atom[0:50])
+    boundary_atoms[:, 0] += 7.0
+    xyz_surr_atom = np.concatenate([
+        xyz_surr_atom, round_trip_fractional(xyz_au_atom),
+        np.round(boundary_atoms, 3)
+    ], axis=0)
+
+    return xyz_au_atom, xyz_surr_atom
+
+
+def gen_assembly(uc_atom_xyz, cartesianVectors, num_cells, dtype=np.float64):
+    """
+    Translates the unit cell -/+ num_cells units along a, b and c
+    """
+
+    shifts = range(-num_cells, num_cells+1)
+    num_trans = len(shifts)**3
+    trans_atom_xyz = np.empty([uc_atom_xyz.shape[0]*num_trans, 3], dtype=dtype)
+    trans_atom_ids = ['']*(uc_atom_xyz.shape[0]*num_trans)
+
+    atom_count = 0
+    for a in shifts:
+        for b in shifts:
+            for c in shifts:
+                trans_atom_xyz, trans_atom_ids, atom_count = translateUnitCell(
+                    uc_atom_xyz, trans_atom_xyz, trans_atom_ids,
+                    cartesianVectors, a, b, c, atom_count, False, False
+                )
+
+    return trans_atom_xyz, trans_atom_ids
+
+
+class TestClass(unittest.TestCase):
+
+    def test_calc_packing_density(self):
+        """
+        Checks that the packing density values calculated via the KD-tree
+        neighbour search are identical to those calculated by comparing every
+        pair of atoms
+        """
+
+        for seed in range(3):
+            xyz_au_atom, xyz_surr_atom = gen_test_coords(seed)
+            for pdt in [7, 7.0, 4.5, 14]:
+                exp_pd = calc_packing_density_brute_force(
+                    xyz_au_atom, xyz_surr_atom, pdt
+                )
+                act_pd = calc_packing_density(xyz_au_atom, xyz_surr_atom, pdt)
+                self.assertEqual(act_pd.shape, exp_pd.shape)
+                np.testing.assert_array_equal(act_pd, exp_pd)
+
+        # Checks atoms lying exactly on the threshold are not counted
+        xyz_au_atom = np.array([[0.0, 0.0, 0.0]])
+        xyz_surr_atom = np.array([[0.0, 0.0, 0.0], [7.0, 0.0, 0.0],
+                                  [0.0, -6.999, 0.0], [2.0, 3.0, 6.0]])
+        act_pd = calc_packing_density(xyz_au_atom, xyz_surr_atom, 7)
+        np.testing.assert_array_equal(act_pd, np.array([[1]]))
+
+    def test_blocked_packing_density(self):
+        """
+        Checks that the packing density values calculated via the blocked
+        distance kernel are identical to those calculated by comparing every
+        pair of atoms, and that the size of the blocks is limited by the
+        memory available
+        """
+
+        # Checks block size
+        self.assertEqual(calc_block_size(1000, 33000), 1)
+        self.assertEqual(calc_block_size(1000, 1), 1)
+        self.assertEqual(calc_block_size(1000, 330000), 10)
+        self.assertEqual(calc_block_size(0, 330), 10)
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=3)
+        exp_pd = calc_packing_density_brute_force(xyz_au_atom, xyz_surr_atom, 7)
+        # Block sizes of 1 atom, 7 atoms and all atoms
+        for max_kernel_mem in [1, 7*33*xyz_surr_atom.shape[0], 1073741824]:
+            act_pd = calc_packing_density(
+                xyz_au_atom, xyz_surr_atom, 7, engine='blocked',
+                max_kernel_mem=max_kernel_mem
+            )
+            np.testing.assert_array_equal(act_pd, exp_pd)
+
+        # Checks raises ValueError if packing density engine not recognised
+        self.assertRaises(
+            ValueError, calc_packing_density, xyz_au_atom, xyz_surr_atom, 7,
+            'bruteforce'
+        )
+
+    def test_parallel_packing_density(self):
+        """
+        Checks that the packing density values calculated across multiple
+        threads are identical to those calculated on a single thread
+        """
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=4)
+        for engine in ['kdtree', 'blocked']:
+            exp_pd = calc_packing_density(
+                xyz_au_atom, xyz_surr_atom, 7, engine=engine, workers=1
+            )
+            for workers in [2, 3, 8]:
+                act_pd = calc_packing_density(
+                    xyz_au_atom, xyz_surr_atom, 7, engine=engine,
+                    workers=workers
+                )
+                np.testing.assert_array_equal(act_pd, exp_pd)
+
+        # Checks more threads than atoms
+        act_pd = calc_packing_density(
+            xyz_au_atom[0:1], xyz_surr_atom, 7, workers=4
+        )
+        np.testing.assert_array_equal(act_pd, exp_pd[0:1])
+
+    def test_morton_order(self):
+        """
+        Checks that atoms are sorted along a Morton curve, and that the
+        packing density values calculated from the spatially sorted atoms are
+        returned in the original order of the asymmetric unit atoms
+        """
+
+        rng = np.random.RandomState(20)
+        grid = rng.randint(0, 2**21, (500, 3))
+        xyz = grid.astype(np.float64)
+        xyz[0] = 0
+        xyz[1] = 2**21 - 1
+
+        exp_codes = []
+        for x, y, z in grid:
+            code = 0
+            for bit in range(21):
+                code |= ((int(x) >> bit) & 1) << (3*bit)
+                code |= ((int(y) >> bit) & 1) << (3*bit + 1)
+                code |= ((int(z) >> bit) & 1) << (3*bit + 2)
+            exp_codes.append(code)
+        exp_codes[0] = 0
+        exp_codes[1] = 2**63 - 1
+        np.testing.assert_array_equal(
+            calc_morton_order(xyz), np.argsort(exp_codes, kind='stable')
+        )
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=20)
+        exp_pd = calc_packing_density_brute_force(
+            xyz_au_atom, xyz_surr_atom, 7
+        )
+        for engine in ['kdtree', 'blocked']:
+            for workers in [1, 3]:
+                act_pd = calc_packing_density(
+                    xyz_au_atom, xyz_surr_atom, 7, engine=engine,
+                    workers=workers
+                )
+                np.testing.assert_array_equal(act_pd, exp_pd)
+
+    def test_grid_packing_density(self):
+        """
+        Checks that the packing density values approximated on a grid are
+        close to the exact values, and that the approximation improves as the
+        voxel size decreases
+        """
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=21)
+        exp_pd = calc_packing_density_brute_force(
+            xyz_au_atom, xyz_surr_atom, 7
+        )
+        errors = []
+        for voxel_size in [1.0, 0.5]:
+            act_pd = calc_packing_density_grid(
+                xyz_au_atom, xyz_surr_atom, 7, voxel_size=voxel_size,
+                sample_size=50
+            )
+            self.assertEqual(act_pd.shape, exp_pd.shape)
+            errors.append(np.abs(act_pd - exp_pd).mean())
+        self.assertLess(errors[1], errors[0])
+        self.assertLess(errors[1], 0.05*exp_pd.mean())
+
+    def test_grid_packing_density_memory(self):
+        """
+        Checks that the grid voxel size is coarsened to keep the memory
+        required by the convolution within max_kernel_mem, and that a
+        ValueError is raised if the grid cannot be coarsened enough
+        """
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=21)
+        exp_pd = calc_packing_density_grid(
+            xyz_au_atom, xyz_surr_atom, 7, voxel_size=1.75, sample_size=50
+        )
+        # A generous memory limit leaves the voxel size unchanged
+        act_pd = calc_packing_density_grid(
+            xyz_au_atom, xyz_surr_atom, 7, voxel_size=1.75, sample_size=50,
+            max_kernel_mem=1e12
+        )
+        np.testing.assert_array_equal(act_pd, exp_pd)
+
+        grid_mem = calc_grid_mem(
+            calc_grid_shape(
+                xyz_surr_atom.min(axis=0) - 0.5, xyz_surr_atom.max(axis=0), 0.5
+            ), 29
+        )
+        act_pd = calc_packing_density_grid(
+            xyz_au_atom, xyz_surr_atom, 7, voxel_size=0.5, sample_size=50,
+            max_kernel_mem=grid_mem/8
+        )
+        self.assertEqual(act_pd.shape, exp_pd.shape)
+
+        with self.assertRaises(ValueError):
+            calc_packing_density_grid(
+                xyz_au_atom, xyz_surr_atom, 7, voxel_size=0.5,
+                sample_size=50, max_kernel_mem=1000
+            )
+
+    def test_weighted_packing_density(self):
+        """
+        Checks that the packing density values calculated alongside weighted
+        contact numbers are identical to those calculated by
+        calc_packing_density, and that the weighted contact numbers match a
+        brute force calculation
+        """
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=22)
+        weightings = ['inverse_square', 'gaussian']
+        exp_pd = calc_packing_density_brute_force(
+            xyz_au_atom, xyz_surr_atom, 7
+        )
+
+        distances = np.sqrt(((
+            xyz_au_atom[:, None, :] - xyz_surr_atom[None, :, :]
+        )**2).sum(axis=2))
+        # Each atom's own copy in the surrounding atoms is not exactly at a
+        # distance of 0
+        in_contact = (distances < 7) & (distances > 1e-3)
+        self.assertTrue(((distances > 0) & (distances <= 1e-3)).any())
+        safe_distances = np.where(in_contact, distances, 1)
+        exp_weighted = np.stack([
+            np.where(in_contact, 1 / safe_distances**2, 0).sum(axis=1),
+            np.where(
+                in_contact, np.exp(-safe_distances**2 / (2 * 3.5**2)), 0
+            ).sum(axis=1)
+        ], axis=1)
+
+        for workers in [1, 3]:
+            act_pd, act_weighted = calc_weighted_packing_density(
+                xyz_au_atom, xyz_surr_atom, 7, weightings, workers=workers
+            )
+            np.testing.assert_array_equal(act_pd, exp_pd)
+            self.assertEqual(act_weighted.shape, (xyz_au_atom.shape[0], 2))
+            np.testing.assert_allclose(act_weighted, exp_weighted, rtol=1e-10)
+
+        self.assertRaises(
+            ValueError, calc_weighted_packing_density, xyz_au_atom,
+            xyz_surr_atom, 7, ['cubic']
+        )
+
+    def test_pbc_packing_density(self):
+        """
+        Checks that the packing density values calculated under periodic
+        boundary conditions are identical to those calculated from a
+        translated unit cell assembly, for orthogonal, oblique and small unit
+        cells
+        """
+
+        for unit_cell_params, num_cells in [
+            [[40.0, 45.0, 50.0, 70.0, 100.0, 115.0], 1],
+            [[20.0, 22.0, 18.0, 80.0, 95.0, 120.0], 3],
+            [[7.0, 7.0, 7.0, 90.0, 90.0, 90.0], 4]
+        ]:
+            unit_cell_params = (  unit_cell_params[0:3]
+                                + [math.radians(x) for x in unit_cell_params[3:]])
+            cartesianVectors = convertToCartesian(unit_cell_params)
+            lattice = np.hstack(cartesianVectors)
+
+            # Generates unit cell atoms, some of which lie outside of the
+            # (0, 0, 0) unit cell, as can be the case for the output of
+            # gen_unit_cell
+            rng = np.random.RandomState(5)
+            uc_atom_frac = rng.uniform(-0.2, 1.2, (300, 3))
+            uc_atom_xyz = np.round(uc_atom_frac.dot(lattice.T), 3)
+            au_atom_xyz = uc_atom_xyz[0:50]
+            trans_atom_xyz = gen_assembly(
+                uc_atom_xyz, cartesianVectors, num_cells
+            )[0]
+
+            for pdt in [7, 10.5]:
+                exp_pd = calc_packing_density_brute_force(
+                    au_atom_xyz, trans_atom_xyz, pdt
+                )
+                for workers in [1, 2]:
+                    act_pd = calc_packing_density_pbc(
+                        au_atom_xyz, uc_atom_xyz, cartesianVectors, pdt,
+                        workers=workers
+                    )
+                    np.testing.assert_array_equal(act_pd, exp_pd)
+
+    def test_symmetry_packing_density(self):
+        """
+        Checks that the packing density values calculated from the asymmetric
+        unit plus the space group symmetry operators are identical to those
+        calculated from a translated unit cell assembly, including for atoms
+        on special positions
+        """
+
+        p4_ops = [
+            (np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]]), np.array([0, 0, 0])),
+            (np.array([[0, -1, 0], [1, 0, 0], [0, 0, 1]]), np.array([0, 0, 0])),
+            (np.array([[-1, 0, 0], [0, -1, 0], [0, 0, 1]]), np.array([0, 0, 0])),
+            (np.array([[0, 1, 0], [-1, 0, 0], [0, 0, 1]]), np.array([0, 0, 0]))
+        ]
+        c2_ops = [
+            (np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]]), np.array([0, 0, 0])),
+            (np.array([[-1, 0, 0], [0, 1, 0], [0, 0, -1]]), np.array([0, 0, 0])),
+            (np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]]), np.array([0.5, 0.5, 0])),
+            (np.array([[-1, 0, 0], [0, 1, 0], [0, 0, -1]]), np.array([0.5, 0.5, 0]))
+        ]
+
+        for unit_cell_params, sym_ops, special_frac, exp_num_uc_atoms in [
+            [[24.0, 24.0, 30.0, 90.0, 90.0, 90.0], p4_ops,
+             [[0, 0, 0.3], [0.5, 0.5, 0.6], [0, 0.5, 0.2]], (4*80)+1+1+2],
+            [[40.0, 20.0, 25.0, 90.0, 110.0, 90.0], c2_ops,
+             [[0, 0.3, 0], [0.5, 0.1, 0.5]], (4*80)+2+2]
+        ]:
+            unit_cell_params = (  unit_cell_params[0:3]
+                                + [math.radians(x) for x in unit_cell_params[3:]])
+            cartesianVectors = convertToCartesian(unit_cell_params)
+            lattice = np.hstack(cartesianVectors)
+
+            rng = np.random.RandomState(6)
+            au_atom_frac = np.concatenate([
+                rng.uniform(0, 0.5, (80, 3)), np.array(special_frac)
+            ])
+            au_atom_xyz = au_atom_frac.dot(lattice.T)
+
+            # Generates the unit cell, retaining only a single copy of atoms
+            # on special positions
+            unique_masks = find_unique_symmetry_images(
+                au_atom_frac, sym_ops, cartesianVectors
+            )
+            uc_atom_xyz = np.concatenate([
+                (au_atom_frac[unique_mask].dot(rot.T) + trans).dot(lattice.T)
+                for (rot, trans), unique_mask in zip(sym_ops, unique_masks)
+            ])
+            self.assertEqual(uc_atom_xyz.shape[0], exp_num_uc_atoms)
+            trans_atom_xyz = gen_assembly(uc_atom_xyz, cartesianVectors, 2)[0]
+
+            for pdt in [7, 12]:
+                exp_pd = calc_packing_density_brute_force(
+                    au_atom_xyz, trans_atom_xyz, pdt
+                )
+                act_pd = calc_packing_density_symmetry(
+                    au_atom_xyz, au_atom_frac, sym_ops, cartesianVectors, pdt,
+                    workers=2
+                )
+                np.testing.assert_array_equal(act_pd, exp_pd)
+
+    def test_contact_shells(self):
+        """
+        Checks that the packing density values calculated at each contact
+        shell radius are identical to those calculated by comparing every
+        pair of atoms at that radius, and that BDamage values recalculated
+        from the contact shells are identical to those calculated directly
+        """
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=7)
+        shell_radii = [4.0, 4.5, 5.0, 7.0, 10.0, 14.0]
+        for workers in [1, 3]:
+            shell_counts = calc_contact_shells(
+                xyz_au_atom, xyz_surr_atom, shell_radii[::-1], workers=workers
+            )
+            self.assertEqual(
+                shell_counts.shape, (xyz_au_atom.shape[0], len(shell_radii))
+            )
+            for index, radius in enumerate(shell_radii):
+                exp_pd = calc_packing_density_brute_force(
+                    xyz_au_atom, xyz_surr_atom, radius
+                )
+                np.testing.assert_array_equal(
+                    shell_counts[:, index:index+1], exp_pd
+                )
+                np.testing.assert_array_equal(
+                    packing_density_at_threshold(
+                        shell_radii, shell_counts, radius
+                    ), exp_pd
+                )
+        self.assertRaises(
+            ValueError, packing_density_at_threshold, shell_radii,
+            shell_counts, 7.5
+        )
+
+        rng = np.random.RandomState(8)
+        exp_atoms = []
+        for index in range(xyz_au_atom.shape[0]):
+            exp_atoms.append(atom(
+                atomnum=index+1, bfactor=round(rng.uniform(10, 50), 2)
+            ))
+        act_atoms = [
+            atom(atomnum=atm.atomNum, bfactor=atm.bFactor) for atm in exp_atoms
+        ]
+        for pdt in [5.0, 10.0]:
+            write_pckg_dens_to_atoms(
+                exp_atoms,
+                calc_packing_density(xyz_au_atom, xyz_surr_atom, pdt)
+            )
+            calcBDam(exp_atoms, 11)
+            calc_bdamage_at_threshold(
+                act_atoms, shell_radii, shell_counts, pdt, 11
+            )
+            for exp_atm, act_atm in zip(exp_atoms, act_atoms):
+                self.assertEqual(exp_atm.pd, act_atm.pd)
+                self.assertEqual(exp_atm.bd, act_atm.bd)
+
+    def test_single_precision_packing_density(self):
+        """
+        Checks that the packing density values calculated from a 3x3 unit
+        cell assembly stored in single precision are identical to those
+        calculated in double precision, including for atoms lying exactly on
+        the packing density threshold
+        """
+
+        for unit_cell_params, offset in [
+            [[7.0, 7.0, 7.0, 90.0, 90.0, 90.0], 0],
+            [[60.0, 70.0, 80.0, 70.0, 100.0, 115.0], 450]
+        ]:
+            unit_cell_params = (  unit_cell_params[0:3]
+                                + [math.radians(x) for x in unit_cell_params[3:]])
+            cartesianVectors = convertToCartesian(unit_cell_params)
+            lattice = np.hstack(cartesianVectors)
+
+            rng = np.random.RandomState(9)
+            uc_atom_frac = rng.uniform(0, 1, (400, 3))
+            uc_atom_xyz = np.round(uc_atom_frac.dot(lattice.T) + offset, 3)
+            au_atom_xyz = uc_atom_xyz[0:100]
+
+            au_params = [
+                au_atom_xyz[:, 0].min(), au_atom_xyz[:, 0].max(),
+                au_atom_xyz[:, 1].min(), au_atom_xyz[:, 1].max(),
+                au_atom_xyz[:, 2].min(), au_atom_xyz[:, 2].max()
+            ]
+            for pdt in [7.0, 10.0]:
+                trimmed = {}
+                for dtype in [np.float64, np.float32]:
+                    trans_atom_xyz, trans_atom_ids = gen_assembly(
+                        uc_atom_xyz, cartesianVectors, 1, dtype
+                    )
+                    # In single precision the trimmed atoms box is expanded
+                    # such that no atoms within the packing density threshold
+                    # are discarded as a result of rounding
+                    trim_radius = pdt
+                    if dtype == np.float32:
+                        trim_radius += calc_single_precision_tol(
+                            au_atom_xyz, trans_atom_xyz, pdt
+                        )
+                    keep_params = convertParams(au_params, trim_radius)
+                    trimmed[dtype] = trimAtoms(
+                        trans_atom_xyz, keep_params, trans_atom_ids,
+                        str(trim_radius)
+                    )
+                self.assertEqual(trimmed[np.float32][0].dtype, np.float32)
+                self.assertTrue(
+                    set(trimmed[np.float64][1]) <= set(trimmed[np.float32][1])
+                )
+                xyz_surr_exact = translated_atom_coords(
+                    uc_atom_xyz, trimmed[np.float32][1], cartesianVectors
+                )
+                trans_atom_xyz = gen_assembly(uc_atom_xyz, cartesianVectors, 1)[0]
+                np.testing.assert_array_equal(
+                    xyz_surr_exact[np.arange(len(xyz_surr_exact))],
+                    trans_atom_xyz[trimmed[np.float32][1]]
+                )
+
+                for engine in ['kdtree', 'blocked']:
+                    exp_pd = calc_packing_density(
+                        au_atom_xyz, trimmed[np.float64][0], pdt, engine=engine
+                    )
+                    act_pd = calc_packing_density(
+                        au_atom_xyz, trimmed[np.float32][0], pdt,
+                        engine=engine, max_kernel_mem=1000000,
+                        xyz_surr_exact=xyz_surr_exact
+                    )
+                    np.testing.assert_array_equal(act_pd, exp_pd)
+
+                exp_shells = calc_contact_shells(
+                    au_atom_xyz, trimmed[np.float64][0], [3.5, 7.0]
+                )
+                act_shells = calc_contact_shells(
+                    au_atom_xyz, trimmed[np.float32][0], [3.5, 7.0],
+                    xyz_surr_exact=xyz_surr_exact
+                )
+                np.testing.assert_array_equal(act_shells, exp_shells)
+
+        # Checks raises ValueError if double precision coordinates are not
+        # provided alongside single precision coordinates
+        self.assertRaises(
+            ValueError, calc_packing_density, au_atom_xyz,
+            trimmed[np.float32][0], 7.0
+        )
+
+    def test_select_kernel_backend(self):
+        """
+        Checks that the kernel backend is selected according to the packing
+        density engine and whether numba is installed
+        """
+
+        self.assertEqual(select_kernel_backend('numpy'), 'numpy')
+        self.assertEqual(select_kernel_backend('numpy', 'blocked'), 'numpy')
+        # The JIT kernels are only selected by default for the blocked engine
+        for engine in ['kdtree', 'grid']:
+            self.assertEqual(select_kernel_backend('auto', engine), 'numpy')
+        if numba_installed:
+            self.assertEqual(select_kernel_backend('auto', 'blocked'), 'jit')
+            self.assertEqual(select_kernel_backend('jit'), 'jit')
+        else:
+            self.assertEqual(select_kernel_backend('auto', 'blocked'), 'numpy')
+            self.assertRaises(ImportError, select_kernel_backend, 'jit')
+        self.assertRaises(ValueError, select_kernel_backend, 'cuda')
+
+    @unittest.skipIf(not numba_installed, 'numba not installed')
+    def test_jit_backend(self):
+        """
+        Checks that the packing density values calculated with the
+        JIT-compiled kernels are identical to those calculated with the numpy
+        kernels
+        """
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=10)
+        for pdt in [7, 10.5]:
+            exp_pd = calc_packing_density_brute_force(
+                xyz_au_atom, xyz_surr_atom, pdt
+            )
+            for workers in [1, 2]:
+                act_pd = calc_packing_density(
+                    xyz_au_atom, xyz_surr_atom, pdt, engine='blocked',
+                    workers=workers, backend='jit'
+                )
+                np.testing.assert_array_equal(act_pd, exp_pd)
+
+        # Checks single precision coordinates
+        xyz_surr_single = xyz_surr_atom.astype(np.float32)
+        exp_pd = calc_packing_density(
+            xyz_au_atom, xyz_surr_single, 7, engine='blocked',
+            xyz_surr_exact=xyz_surr_atom
+        )
+        act_pd = calc_packing_density(
+            xyz_au_atom, xyz_surr_single, 7, engine='blocked',
+            xyz_surr_exact=xyz_surr_atom, backend='jit'
+        )
+        np.testing.assert_array_equal(act_pd, exp_pd)
+
+    def test_packing_density_cache(self):
+        """
+        Checks that the packing density cache key depends only upon the
+        processed asymmetric unit, unit cell and packing density threshold,
+        and that the cached packing density values selected for a subset of
+        atoms are identical to those calculated for that subset directly
+        """
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=12)
+        cryst1_line = (
+            'CRYST1   40.000   45.000   50.000  90.00  90.00  90.00 P 1       '
+            '     \n'
+        )
+        exp_key = gen_packing_density_cache_key(xyz_au_atom, cryst1_line, 7.0)
+        self.assertEqual(
+            gen_packing_density_cache_key(
+                xyz_au_atom.copy(), cryst1_line.strip(), 7
+            ), exp_key
+        )
+        for act_key in [
+            gen_packing_density_cache_key(xyz_au_atom, cryst1_line, 7.5),
+            gen_packing_density_cache_key(
+                xyz_au_atom, cryst1_line.replace('P 1', 'P 2'), 7.0
+            ),
+            gen_packing_density_cache_key(
+                xyz_au_atom[1:], cryst1_line, 7.0
+            ),
+            gen_packing_density_cache_key(
+                xyz_au_atom, cryst1_line, 7.0, shell_radii=[5.0, 7.0]
+            )
+        ]:
+            self.assertNotEqual(act_key, exp_key)
+
+        # Check values calculated from different unit cell assemblies are
+        # given different keys
+        mode_keys = [
+            gen_packing_density_cache_key(
+                xyz_au_atom, cryst1_line, 7.0, assembly_mode=mode
+            ) for mode in ['full', 'stream', 'pbc', 'symmetry']
+        ]
+        self.assertEqual(mode_keys[0], exp_key)
+        self.assertEqual(len(set(mode_keys)), 4)
+
+        clean_au_list = [
+            atom(atomnum=i+1) for i in range(xyz_au_atom.shape[0])
+        ]
+        clean_pd = calc_packing_density(xyz_au_atom, xyz_surr_atom, 7.0)
+        subset = [5, 0, 17, 3, 42]
+        bdam_atom_list = [clean_au_list[i] for i in subset]
+        np.testing.assert_array_equal(
+            select_cached_values(bdam_atom_list, clean_au_list, clean_pd),
+            calc_packing_density(xyz_au_atom[subset], xyz_surr_atom, 7.0)
+        )
+
+    def test_contact_graph(self):
+        """
+        Checks that the contact graph contains every pair of atoms within the
+        packing density threshold (and their distances), and that the
+        packing density values and weighted contact numbers calculated from
+        the same neighbour search are identical to those calculated by
+        calc_packing_density and calc_weighted_packing_density
+        """
+
+        xyz_au_atom, xyz_surr_atom = gen_test_coords(seed=13)
+        pdt = 7.0
+        exp_pd = calc_packing_density_brute_force(
+            xyz_au_atom, xyz_surr_atom, pdt
+        )
+        np.testing.assert_array_equal(
+            calc_packing_density(xyz_au_atom, xyz_surr_atom, pdt), exp_pd
+        )
+        weightings = ['inverse_square', 'gaussian']
+        exp_pd, exp_weighted = calc_weighted_packing_density(
+            xyz_au_atom, xyz_surr_atom, pdt, weightings
+        )
+        for workers in [1, 3]:
+            act_pd, act_weighted, contact_graph = calc_contact_graph(
+                xyz_au_atom, xyz_surr_atom, pdt, workers=workers
+            )
+            np.testing.assert_array_equal(act_pd, exp_pd)
+            self.assertIsNone(act_weighted)
+            act_pd, act_weighted, weighted_graph = calc_contact_graph(
+                xyz_au_atom, xyz_surr_atom, pdt, weightings, workers=workers
+            )
+            np.testing.assert_array_equal(act_pd, exp_pd)
+            np.testing.assert_array_equal(act_weighted, exp_weighted)
+            self.assertEqual((weighted_graph != contact_graph).nnz, 0)
+            self.assertEqual(
+                contact_graph.shape,
+                (xyz_au_atom.shape[0], xyz_surr_atom.shape[0])
+            )
+            np.testing.assert_array_equal(
+                np.diff(contact_graph.indptr), exp_pd[:, 0]
+            )
+            for i in [0, 17, xyz_au_atom.shape[0]-1]:
+                distances = np.sqrt(
+                    np.square(xyz_surr_atom - xyz_au_atom[i]).sum(axis=1)
+                )
+                exp_indices = np.flatnonzero(
+                    (distances < pdt) & (distances > 1e-3)
+                )
+                row = contact_graph.getrow(i)
+                np.testing.assert_array_equal(row.indices, exp_indices)
+                np.testing.assert_array_equal(
+                    row.data, distances[exp_indices].astype(np.float32)
+                )
+
+    def test_translate_unit_cell_assembly(self):
+        """
+        Checks that the 3x3 unit cell assembly generated in a single array
+        operation is identical to that generated by translating the unit
+        cell one step at a time
+        """
+
+        unit_cell_params = [60.0, 70.0, 80.0] + [
+            math.radians(x) for x in [70.0, 100.0, 115.0]
+        ]
+        cartesianVectors = convertToCartesian(unit_cell_params)
+        rng = np.random.RandomState(14)
+        uc_atom_xyz = np.round(rng.uniform(-20, 120, (250, 3)), 3)
+
+        for dtype in [np.float64, np.float32]:
+            exp_xyz, exp_ids = gen_assembly(
+                uc_atom_xyz, cartesianVectors, 1, dtype
+            )
+            act_xyz, act_ids = translateUnitCellAssembly(
+                uc_atom_xyz, cartesianVectors, dtype
+            )
+            self.assertEqual(act_xyz.dtype, dtype)
+            np.testing.assert_array_equal(act_xyz, exp_xyz)
+            np.testing.assert_array_equal(act_ids, exp_ids)
+
+    def test_skip_translated_unit_cells(self):
+        """
+        Checks that skipping the translated unit cells that lie outside of
+        the trimmed atoms box does not change the atoms that are retained
+        after trimming
+        """
+
+        unit_cell_params = [90.0, 100.0, 110.0] + [
+            math.radians(x) for x in [80.0, 95.0, 105.0]
+        ]
+        cartesianVectors = convertToCartesian(unit_cell_params)
+        lattice = np.hstack(cartesianVectors)
+        rng = np.random.RandomState(15)
+        uc_atom_frac = rng.uniform(0, 1, (2000, 3))
+        uc_atom_xyz = np.round(uc_atom_frac.dot(lattice.T), 3)
+
+        # Asymmetric units at the centre and in a corner of the unit cell
+        for au_frac_range in [[0.4, 0.6], [0.0, 0.15]]:
+            au_mask = np.all(
+                  (uc_atom_frac >= au_frac_range[0])
+                & (uc_atom_frac <= au_frac_range[1]), axis=1
+            )
+            au_atom_xyz = uc_atom_xyz[au_mask]
+            au_params = [
+                au_atom_xyz[:, 0].min(), au_atom_xyz[:, 0].max(),
+                au_atom_xyz[:, 1].min(), au_atom_xyz[:, 1].max(),
+                au_atom_xyz[:, 2].min(), au_atom_xyz[:, 2].max()
+            ]
+            keep_params = convertParams(au_params, 7.0)
+            for dtype in [np.float64, np.float32]:
+                all_xyz, all_ids = translateUnitCellAssembly(
+                    uc_atom_xyz, cartesianVectors, dtype
+                )
+                act_xyz, act_ids = translateUnitCellAssembly(
+                    uc_atom_xyz, cartesianVectors, dtype, keep_params
+                )
+                self.assertLess(act_xyz.shape[0], all_xyz.shape[0])
+                np.testing.assert_array_equal(act_xyz, all_xyz[act_ids])
+
+                exp_trimmed = trimAtoms(all_xyz, keep_params, all_ids, '7.0')
+                act_trimmed = trimAtoms(act_xyz, keep_params, act_ids, '7.0')
+                np.testing.assert_array_equal(act_trimmed[0], exp_trimmed[0])
+                np.testing.assert_array_equal(act_trimmed[1], exp_trimmed[1])
+
+    def test_trim_atoms(self):
+        """
+        Checks that the asymmetric unit parameters and trimmed atoms are
+        identical to those determined atom by atom
+        """
+
+        rng = np.random.RandomState(16)
+        xyz_au_atom = np.round(rng.uniform(-10, 30, (150, 3)), 3)
+        au_atoms = [
+            atom(xyz_coords=[[x], [y], [z]]) for x, y, z in xyz_au_atom.tolist()
+        ]
+        exp_params = [
+            min(xyz_au_atom[:, 0]), max(xyz_au_atom[:, 0]),
+            min(xyz_au_atom[:, 1]), max(xyz_au_atom[:, 1]),
+            min(xyz_au_atom[:, 2]), max(xyz_au_atom[:, 2])
+        ]
+        self.assertEqual(getAUparams(au_atoms), exp_params)
+        self.assertEqual(getAUparams(xyz_au_atom), exp_params)
+
+        keep_params = convertParams(exp_params, 7.0)
+        for dtype in [np.float64, np.float32]:
+            xyz_surr_atom = rng.uniform(-40, 60, (5000, 3)).astype(dtype)
+            surr_ids = list(range(10, 5010))
+            exp_indices = [
+                i for i in range(xyz_surr_atom.shape[0])
+                if isInXYZparams(
+                    [float(x) for x in xyz_surr_atom[i]], keep_params
+                )
+            ]
+            act_xyz, act_ids = trimAtoms(
+                xyz_surr_atom, keep_params, surr_ids, '7.0'
+            )
+            self.assertEqual(act_xyz.dtype, dtype)
+            np.testing.assert_array_equal(act_xyz, xyz_surr_atom[exp_indices])
+            np.testing.assert_array_equal(
+                act_ids, [surr_ids[i] for i in exp_indices]
+            )
+
+    def test_fractional_trimming(self):
+        """
+        Checks that trimming in fractional coordinates retains every atom
+        within the packing density threshold of the asymmetric unit (so that
+        packing density values are unchanged), whilst discarding more atoms
+        than the trimmed atoms box for an oblique unit cell
+        """
+
+        unit_cell_params = [40.0, 50.0, 120.0] + [
+            math.radians(x) for x in [90.0, 140.0, 90.0]
+        ]
+        cartesianVectors = convertToCartesian(unit_cell_params)
+        lattice = np.hstack(cartesianVectors)
+        rng = np.random.RandomState(17)
+        uc_atom_xyz = np.round(
+            rng.uniform(0, 1, (1500, 3)).dot(lattice.T), 3
+        )
+        au_atom_xyz = uc_atom_xyz[0:375]
+
+        pdt = 7.0
+        trans_atom_xyz, trans_atom_ids = translateUnitCellAssembly(
+            uc_atom_xyz, cartesianVectors
+        )
+        box_xyz, box_ids = trimAtoms(
+            trans_atom_xyz, convertParams(getAUparams(au_atom_xyz), pdt),
+            trans_atom_ids, str(pdt)
+        )
+        frac_params = convertFracParams(
+            getAUfracParams(au_atom_xyz, cartesianVectors), pdt,
+            cartesianVectors
+        )
+        frac_xyz, frac_ids = trimAtomsFractional(
+            box_xyz, frac_params, cartesianVectors, box_ids, str(pdt)
+        )
+        self.assertLess(frac_xyz.shape[0], box_xyz.shape[0])
+        self.assertTrue(set(frac_ids) <= set(box_ids))
+        np.testing.assert_array_equal(
+            calc_packing_density(au_atom_xyz, frac_xyz, pdt),
+            calc_packing_density_brute_force(
+                au_atom_xyz, trans_atom_xyz, pdt
+            )
+        )
+
+    def test_stream_packing_density(self):
+        """
+        Checks that the packing density values calculated one translated
+        unit cell at a time are identical to those calculated from the
+        complete (trimmed) 3x3 unit cell assembly
+        """
+
+        unit_cell_params = [45.0, 55.0, 65.0] + [
+            math.radians(x) for x in [85.0, 110.0, 95.0]
+        ]
+        cartesianVectors = convertToCartesian(unit_cell_params)
+        lattice = np.hstack(cartesianVectors)
+        rng = np.random.RandomState(18)
+        uc_atom_xyz = np.round(rng.uniform(0, 1, (1200, 3)).dot(lattice.T), 3)
+        au_atom_xyz = uc_atom_xyz[0:300]
+
+        pdt = 7.0
+        keep_params = convertParams(getAUparams(au_atom_xyz), pdt)
+        frac_params = convertFracParams(
+            getAUfracParams(au_atom_xyz, cartesianVectors), pdt,
+            cartesianVectors
+        )
+        trans_atom_xyz, trans_atom_ids = translateUnitCellAssembly(
+            uc_atom_xyz, cartesianVectors, keepParams=keep_params
+        )
+        blocks = list(iterTranslatedUnitCells(
+            uc_atom_xyz, cartesianVectors, keep_params
+        ))
+        np.testing.assert_array_equal(
+            np.concatenate([block[0] for block in blocks]), trans_atom_xyz
+        )
+        np.testing.assert_array_equal(
+            np.concatenate([block[1] for block in blocks]), trans_atom_ids
+        )
+
+        exp_pd = calc_packing_density(
+            au_atom_xyz,
+            trimAtoms(trans_atom_xyz, keep_params, trans_atom_ids, str(pdt))[0],
+            pdt
+        )
+        for engine in ['kdtree', 'blocked']:
+            for params in [None, frac_params]:
+                act_pd = calc_packing_density_stream(
+                    au_atom_xyz,
+                    iterTrimmedAtoms(
+                        iter(blocks), keep_params, params, cartesianVectors
+                    ), pdt, engine=engine, workers=2
+                )
+                np.testing.assert_array_equal(act_pd, exp_pd)
+            act_pd = calc_packing_density_stream(
+                au_atom_xyz,
+                iterTrimmedAtoms(
+                    iter(blocks), keep_params, auAtomXYZ=au_atom_xyz, pdt=pdt
+                ), pdt, engine=engine, workers=2
+            )
+            np.testing.assert_array_equal(act_pd, exp_pd)
+
+    def test_distance_trimming(self):
+        """
+        Checks that retaining only those atoms within the packing density
+        threshold of an asymmetric unit atom discards atoms from the trimmed
+        atoms box around an elongated asymmetric unit, without changing the
+        packing density values
+        """
+
+        unit_cell_params = [60.0, 60.0, 60.0] + [
+            math.radians(x) for x in [90.0, 90.0, 90.0]
+        ]
+        cartesianVectors = convertToCartesian(unit_cell_params)
+        rng = np.random.RandomState(19)
+        uc_atom_xyz = np.round(rng.uniform(0, 60, (1500, 3)), 3)
+        # Selects a diagonal rod of atoms as the asymmetric unit
+        offset = uc_atom_xyz - uc_atom_xyz.mean(axis=1)[:, None]
+        au_atom_xyz = uc_atom_xyz[np.linalg.norm(offset, axis=1) < 6.0]
+
+        pdt = 7.0
+        trans_atom_xyz, trans_atom_ids = translateUnitCellAssembly(
+            uc_atom_xyz, cartesianVectors
+        )
+        box_xyz, box_ids = trimAtoms(
+            trans_atom_xyz, convertParams(getAUparams(au_atom_xyz), pdt),
+            trans_atom_ids, str(pdt)
+        )
+        dist_xyz, dist_ids = trimAtomsByDistance(
+            box_xyz, au_atom_xyz, box_ids, pdt
+        )
+        self.assertLess(dist_xyz.shape[0], box_xyz.shape[0])
+        self.assertTrue(set(dist_ids) <= set(box_ids))
+        np.testing.assert_array_equal(
+            calc_packing_density(au_atom_xyz, dist_xyz, pdt),
+            calc_packing_density_brute_force(
+                au_atom_xyz, trans_atom_xyz, pdt
+            )
+        )
+
+    def test_contact_split(self):
+        """
+        Checks that the atoms in the original copy of the asymmetric unit are
+        identified in the 3x3 unit cell assembly, and that the intra- and
+        intermolecular contact numbers match a brute force calculation and
+        sum to the packing density
+        """
+
+        unit_cell_params = [40.0, 45.0, 50.0] + [
+            math.radians(x) for x in [90.0, 100.0, 90.0]
+        ]
+        cartesianVectors = convertToCartesian(unit_cell_params)
+        lattice = np.hstack(cartesianVectors)
+        rng = np.random.RandomState(23)
+        uc_atom_xyz = np.round(rng.uniform(0, 1, (1000, 3)).dot(lattice.T), 3)
+        au_atom_xyz = uc_atom_xyz[250:500]
+
+        pdt = 7.0
+        trans_atom_xyz, trans_atom_ids = translateUnitCellAssembly(
+            uc_atom_xyz, cartesianVectors
+        )
+        trimmed_xyz, trimmed_ids = trimAtoms(
+            trans_atom_xyz, convertParams(getAUparams(au_atom_xyz), pdt),
+            trans_atom_ids, str(pdt)
+        )
+        au_copy_mask = identify_au_copy_atoms(
+            uc_atom_xyz, au_atom_xyz, trimmed_ids
+        )
+        np.testing.assert_array_equal(
+            np.sort(trimmed_ids[au_copy_mask]), np.arange(250, 500) + 13*1000
+        )
+
+        exp_pd = calc_packing_density_brute_force(
+            au_atom_xyz, trimmed_xyz, pdt
+        )
+        exp_intra = calc_packing_density_brute_force(
+            au_atom_xyz, au_atom_xyz, pdt
+        )
+        for workers in [1, 3]:
+            act_pd, act_split = calc_contact_split(
+                au_atom_xyz, trimmed_xyz, au_copy_mask, pdt, workers=workers
+            )
+            np.testing.assert_array_equal(act_pd, exp_pd)
+            np.testing.assert_array_equal(act_split[:, 0:1], exp_intra)
+            np.testing.assert_array_equal(
+                act_split[:, 1:2], exp_pd - exp_intra
+            )
+
+    def test_calc_bdamage(self):
+        """
+        Checks that the BDamage values calculated from numpy arrays are
+        identical to those calculated via pandas, including for atoms that
+        are not listed in order of atom number, windows larger than the number
+        of atoms and B-factors that are repeated across the window
+        """
+
+        rng = np.random.RandomState(24)
+        for num_atoms, window, bfactors in [
+            [2000, 41, np.round(rng.uniform(10, 80, 2000), 2)],
+            [300, 31, np.repeat([25.5, 30.25, 25.5], 100)],
+            [8, 11, np.round(rng.uniform(10, 80, 8), 2)],
+            [5000, 101, np.round(rng.uniform(10, 80, 5000), 2)]
+        ]:
+            pd_values = rng.randint(0, 40, num_atoms)
+            atom_nums = rng.permutation(num_atoms) + 1
+            bdam_atoms = [
+                atom(atomnum=int(atom_nums[i]), bfactor=float(bfactors[i]),
+                     packingdensity=float(pd_values[i]))
+                for i in range(num_atoms)
+            ]
+            exp_avrg_bf = calc_bdamage_pandas(bdam_atoms, window)
+            calcBDam(bdam_atoms, window)
+            for exp_avrg, act_atm in zip(exp_avrg_bf, bdam_atoms):
+                self.assertEqual(act_atm.avrg_bf, exp_avrg)
+                self.assertEqual(act_atm.bd, act_atm.bFactor / exp_avrg)
@@ -25,6 +25,7 @@ import unittest
 from rabdam.rabdam import (
     ArgumentError, parse_command_line_arguments, parse_input_file_arguments
 )
+from rabdam.Subroutines.CalculateBDamage import run_rabdam
 
 class TestClass(unittest.TestCase):
 
@@ -137,7 +138,19 @@ class TestClass(unittest.TestCase):
                         'createAUpdb': False,
                         'createUCpdb': False,
                         'createAUCpdb': False,
-                        'createTApdb': False}
+                        'createTApdb': False,
+                        'pdEngine': 'kdtree',
+                        'maxKernelMem': 1073741824,
+                        'nprocs': 1,
+                        'assemblyMode': 'full',
+                        'contactShells': None,
+                        'precision': 'double',
+                        'backend': 'auto',
+                        'pdCache': False,
+                        'contactGraph': False,
+                        'trimMode': 'box',
+                        'weightedContacts': None,
+                        'contactSplit': False}
         self.assertDictEqual(act_output_1, exp_output_1)
 
         # Check that non-default, valid input variables are parsed correctly
@@ -147,7 +160,8 @@ class TestClass(unittest.TestCase):
             'pdt=4', 'windowsize=0.5', 'hetatm=keep', 'removeatoms=2;5;7-9;HOH',
             'addatoms=NA;FE;45-49;3;FAD', 'highlightatoms=1-6',
             'createorigpdb=YES', 'createaupdb=No', 'createucpdb=true',
-            'createaucpdb=False', 'createtapdb=True'
+            'createaucpdb=False', 'createtapdb=True', 'pdengine=blocked',
+            'maxkernelmem=2G', 'nprocs=4'
         ]
         act_output_2 = parse_input_file_arguments(input_2)
         exp_output_2 = {'outputDir': 'tests/',
@@ -160,14 +174,26 @@ class TestClass(unittest.TestCase):
                         'PDT': 4.0,
                         'windowSize': 0.5,
                         'HETATM': True,
-                        'removeAtoms': ['2', '5', '7', '8', '9', 'HOH'],
-                        'addAtoms': ['NA', 'FE', '45', '46', '47', '48', '49', '3', 'FAD'],
-                        'highlightAtoms': ['1', '2', '3', '4', '5', '6'],
+                        'removeAtoms': ['2', '5', '7-9', 'HOH'],
+                        'addAtoms': ['NA', 'FE', '45-49', '3', 'FAD'],
+                        'highlightAtoms': ['1-6'],
                         'createOrigpdb': True,
                         'createAUpdb': False,
                         'createUCpdb': True,
                         'createAUCpdb': False,
-                        'createTApdb': True}
+                        'createTApdb': True,
+                        'pdEngine': 'blocked',
+                        'maxKernelMem': 2147483648,
+                        'nprocs': 4,
+                        'assemblyMode': 'full',
+                        'contactShells': None,
+                        'precision': 'double',
+                        'backend': 'auto',
+                        'pdCache': False,
+                        'contactGraph': False,
+                        'trimMode': 'box',
+                        'weightedContacts': None,
+                        'contactSplit': False}
         self.assertDictEqual(act_output_2, exp_output_2)
 
         # Check raises FileNotFoundError if output directory doesn't exist
@@ -219,7 +245,19 @@ class TestClass(unittest.TestCase):
                         'createAUpdb': False,
                         'createUCpdb': False,
                         'createAUCpdb': False,
-                        'createTApdb': False}
+                        'createTApdb': False,
+                        'pdEngine': 'kdtree',
+                        'maxKernelMem': 1073741824,
+                        'nprocs': 1,
+                        'assemblyMode': 'full',
+                        'contactShells': None,
+                        'precision': 'double',
+                        'backend': 'auto',
+                        'pdCache': False,
+                        'contactGraph': False,
+                        'trimMode': 'box',
+                        'weightedContacts': None,
+                        'contactSplit': False}
         self.assertDictEqual(act_output_9, exp_output_9)
 
         # Check temperature='none' is converted to temperature=None
@@ -242,7 +280,19 @@ class TestClass(unittest.TestCase):
                          'createAUpdb': False,
                          'createUCpdb': False,
                          'createAUCpdb': False,
-                         'createTApdb': False}
+                         'createTApdb': False,
+                         'pdEngine': 'kdtree',
+                         'maxKernelMem': 1073741824,
+                        'nprocs': 1,
+                        'assemblyMode': 'full',
+                        'contactShells': None,
+                        'precision': 'double',
+                        'backend': 'auto',
+                        'pdCache': False,
+                        'contactGraph': False,
+                        'trimMode': 'box',
+                        'weightedContacts': None,
+                        'contactSplit': False}
         self.assertDictEqual(act_output_10, exp_output_10)
 
         # Check raises ArgumentError if value specified for resolution isn't
@@ -270,7 +320,19 @@ class TestClass(unittest.TestCase):
                          'createAUpdb': False,
                          'createUCpdb': False,
                          'createAUCpdb': False,
-                         'createTApdb': False}
+                         'createTApdb': False,
+                         'pdEngine': 'kdtree',
+                         'maxKernelMem': 1073741824,
+                        'nprocs': 1,
+                        'assemblyMode': 'full',
+                        'contactShells': None,
+                        'precision': 'double',
+                        'backend': 'auto',
+                        'pdCache': False,
+                        'contactGraph': False,
+                        'trimMode': 'box',
+                        'weightedContacts': None,
+                        'contactSplit': False}
         self.assertDictEqual(act_output_12, exp_output_12)
 
         # Check raises ArgumentError if value specified for PDT isn't recognised
@@ -337,6 +399,217 @@ class TestClass(unittest.TestCase):
         input_25 = ['createTApdb=np.inf']
         self.assertRaises(ArgumentError, parse_input_file_arguments, input_25)
 
+        # Check raises ArgumentError if value specified for pdengine isn't
+        # recognised
+        input_27 = ['pdengine=bruteforce']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_27)
+
+        # Check raises ArgumentError if value specified for maxkernelmem isn't
+        # recognised
+        input_28 = ['maxkernelmem=2X']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_28)
+        input_29 = ['maxkernelmem=0']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_29)
+
+        # Check memory sizes are converted into numbers of bytes
+        for mem_str, exp_mem in [
+            ('512M', 536870912), ('1.5g', 1610612736), ('2GB', 2147483648),
+            ('100000', 100000)
+        ]:
+            act_output_30 = parse_input_file_arguments(
+                ['maxkernelmem={}'.format(mem_str)]
+            )
+            self.assertEqual(act_output_30['maxKernelMem'], exp_mem)
+
+        # Check raises ArgumentError if value specified for nprocs isn't a
+        # positive integer
+        input_31 = ['nprocs=two']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_31)
+        input_32 = ['nprocs=0']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_32)
+
+        # Check raises ArgumentError if value specified for assemblymode isn't
+        # recognised, or if periodic boundary conditions are requested with
+        # the blocked packing density engine
+        input_33 = ['assemblymode=p1']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_33)
+        input_34 = ['assemblymode=pbc', 'pdengine=blocked']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_34)
+        input_36 = ['assemblymode=symmetry', 'pdengine=blocked']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_36)
+        act_output_35 = parse_input_file_arguments(['assemblyMode=PBC'])
+        self.assertEqual(act_output_35['assemblyMode'], 'pbc')
+        act_output_37 = parse_input_file_arguments(['assemblymode=Symmetry'])
+        self.assertEqual(act_output_37['assemblyMode'], 'symmetry')
+
+        # Check contact shell radii are generated from the range specified,
+        # and that raises ArgumentError if the range isn't recognised or if
+        # contact shells are requested with periodic boundary conditions
+        act_output_38 = parse_input_file_arguments(['contactShells=4-6:0.5'])
+        self.assertEqual(
+            act_output_38['contactShells'], [4.0, 4.5, 5.0, 5.5, 6.0]
+        )
+        act_output_39 = parse_input_file_arguments(['contactshells=7-7:1'])
+        self.assertEqual(act_output_39['contactShells'], [7.0])
+        # The maximum radius is never exceeded if the range isn't a whole
+        # number of steps
+        act_output_39a = parse_input_file_arguments(['contactshells=4-5:0.6'])
+        self.assertEqual(act_output_39a['contactShells'], [4.0, 4.6])
+        act_output_39b = parse_input_file_arguments(['contactshells=4-5:0.1'])
+        self.assertEqual(len(act_output_39b['contactShells']), 11)
+        self.assertEqual(act_output_39b['contactShells'][-1], 5.0)
+        for input_40 in [
+            ['contactshells=4-14'], ['contactshells=4:0.5'],
+            ['contactshells=0-14:0.5'], ['contactshells=14-4:0.5'],
+            ['contactshells=4-14:0'],
+            ['contactshells=4-14:0.5', 'assemblymode=pbc']
+        ]:
+            self.assertRaises(
+                ArgumentError, parse_input_file_arguments, input_40
+            )
+
+        # Check raises ArgumentError if value specified for precision isn't
+        # recognised, or if single precision is requested with periodic
+        # boundary conditions
+        act_output_41 = parse_input_file_arguments(['precision=Single'])
+        self.assertEqual(act_output_41['precision'], 'single')
+        input_42 = ['precision=half']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_42)
+        input_43 = ['precision=single', 'assemblymode=symmetry']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_43)
+
+        # Check raises ArgumentError if value specified for backend isn't
+        # recognised
+        act_output_44 = parse_input_file_arguments(['backend=NumPy'])
+        self.assertEqual(act_output_44['backend'], 'numpy')
+        input_45 = ['backend=cuda']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_45)
+
+        # Check raises ArgumentError if value specified for pdcache isn't
+        # recognised
+        act_output_46 = parse_input_file_arguments(['pdcache=Yes'])
+        self.assertEqual(act_output_46['pdCache'], True)
+        input_47 = ['pdcache=maybe']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_47)
+
+        # Check raises ArgumentError if contact graph is requested without
+        # the 3x3 unit cell assembly
+        act_output_48 = parse_input_file_arguments(['contactgraph=True'])
+        self.assertEqual(act_output_48['contactGraph'], True)
+        input_49 = ['contactgraph=True', 'assemblymode=pbc']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_49)
+
+        # Check raises ArgumentError if value specified for trimmode isn't
+        # recognised, or if trimming is requested without the 3x3 unit cell
+        # assembly
+        act_output_50 = parse_input_file_arguments(['trimmode=Fractional'])
+        self.assertEqual(act_output_50['trimMode'], 'fractional')
+        act_output_51 = parse_input_file_arguments(['trimmode=distance'])
+        self.assertEqual(act_output_51['trimMode'], 'distance')
+        input_51 = ['trimmode=sphere']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_51)
+        input_52 = ['trimmode=fractional', 'assemblymode=symmetry']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_52)
+
+        # Check raises ArgumentError if the 3x3 unit cell assembly PDB files
+        # are requested in stream mode
+        act_output_53 = parse_input_file_arguments(
+            ['assemblymode=stream', 'trimmode=fractional', 'pdengine=blocked']
+        )
+        self.assertEqual(act_output_53['assemblyMode'], 'stream')
+        input_54 = ['assemblymode=stream', 'createtapdb=True']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_54)
+        act_output_55 = parse_input_file_arguments(['pdengine=Grid'])
+        self.assertEqual(act_output_55['pdEngine'], 'grid')
+        input_56 = ['pdengine=grid', 'assemblymode=stream']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_56)
+        act_output_57 = parse_input_file_arguments(
+            ['weightedcontacts=Inverse_Square;gaussian;inverse_square']
+        )
+        self.assertEqual(
+            act_output_57['weightedContacts'], ['inverse_square', 'gaussian']
+        )
+        input_58 = ['weightedcontacts=cubic']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_58)
+        input_59 = ['weightedcontacts=gaussian', 'pdengine=blocked']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_59)
+        act_output_60 = parse_input_file_arguments(['contactsplit=Yes'])
+        self.assertEqual(act_output_60['contactSplit'], True)
+        input_61 = ['contactsplit=maybe']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_61)
+        input_62 = ['contactsplit=True', 'assemblymode=pbc']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_62)
+
+        # Check atom selection expressions are accepted by removeatoms,
+        # addatoms and highlightatoms (without being upper-cased), and that
+        # ArgumentError is raised if an expression isn't recognised
+        act_output_61 = parse_input_file_arguments([
+            'removeatoms=HOH; chain a and resname GLU and name OE1 OE2;7-9',
+            'addatoms=bfactor >= 80', 'highlightatoms=(resnum 10 or not chain A)'
+        ])
+        self.assertEqual(
+            act_output_61['removeAtoms'],
+            ['HOH', 'chain a and resname GLU and name OE1 OE2', '7-9']
+        )
+        self.assertEqual(act_output_61['addAtoms'], ['bfactor >= 80'])
+        self.assertEqual(
+            act_output_61['highlightAtoms'], ['(resnum 10 or not chain A)']
+        )
+        input_63 = ['removeatoms=chain A and']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_63)
+        input_64 = ['addatoms=bfactor > high']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_64)
+        input_65 = ['highlightatoms=colour red']
+        self.assertRaises(ArgumentError, parse_input_file_arguments, input_65)
+        act_output_66 = parse_input_file_arguments([
+            'removeatoms=1 - 5; 8', 'addatoms= HOH ', 'highlightatoms= 2 -3'
+        ])
+        self.assertEqual(act_output_66['removeAtoms'], ['1-5', '8'])
+        self.assertEqual(act_output_66['addAtoms'], ['HOH'])
+        self.assertEqual(act_output_66['highlightAtoms'], ['2-3'])
+
         # Check raises ArgumentError if unrecognised variable provided
         input_26 = ['blah=1']
         self.assertRaises(ArgumentError, parse_input_file_arguments, input_26)
+
+    def test_check_option_combinations(self):
+        """
+        Checks that combinations of options that are rejected when parsing
+        the input file are also rejected when a run_rabdam object is
+        initialised directly (as it is from the phenix interface)
+        """
+
+        args = {
+            'pathToInput': '1ABC', 'outputDir': 'tests/', 'batchRun': True,
+            'overwrite': True, 'outFiles': 'all', 'filterInput': False,
+            'temperature': None, 'resolution': None, 'PDT': 7,
+            'windowSize': 0.02, 'HETATM': False, 'removeAtoms': [],
+            'addAtoms': [], 'highlightAtoms': [], 'createOrigpdb': False,
+            'createAUpdb': False, 'createUCpdb': False, 'createAUCpdb': False,
+            'createTApdb': False
+        }
+
+        # Check valid combination of options is accepted
+        pdb = run_rabdam(
+            assemblyMode='full', contactShells=[6.0, 7.0], contactGraph=True,
+            contactSplit=True, **args
+        )
+        self.assertEqual(pdb.assemblyMode, 'full')
+
+        # Check invalid combinations of options raise ValueError
+        for kwargs in [
+            {'assemblyMode': 'pbc', 'contactShells': [6.0, 7.0]},
+            {'assemblyMode': 'pbc', 'contactGraph': True},
+            {'pdEngine': 'blocked', 'contactGraph': True},
+            {'assemblyMode': 'pbc', 'contactSplit': True},
+            {'pdEngine': 'blocked', 'contactSplit': True},
+            {'assemblyMode': 'symmetry', 'weightedContacts': ['inverse']},
+            {'assemblyMode': 'pbc', 'trimMode': 'distance'},
+            {'assemblyMode': 'stream', 'pdEngine': 'grid'},
+            {'assemblyMode': 'symmetry', 'precision': 'single'}
+        ]:
+            self.assertRaises(ValueError, run_rabdam, **dict(args, **kwargs))
+        stream_args = dict(args, createAUCpdb=True)
+        self.assertRaises(
+            ValueError, run_rabdam, assemblyMode='stream', **stream_args
+        )